@@ -9,9 +9,12 @@
 
 
 import os
-import datetime
+import functools
 import json
+import tempfile
+import threading
 import traceback
+import uuid
 
 # Do not Import Gtk if we are not bound to an X Display
 if 'DISPLAY' in os.environ:
@@ -22,26 +25,102 @@ from kano_world.connection import request_wrapper, content_type_json
 from kano.network import is_internet
 import kano.logging as logging
 from kano.logging import logger
-from kano.utils import run_cmd, write_file_contents, ensure_dir, delete_dir, \
-    delete_file, read_file_contents, get_rpi_model
+from kano.utils import run_cmd, ensure_dir, delete_dir, delete_file, \
+    read_file_contents, get_rpi_model
+
+from kano_feedback.app_logs import export_app_logs
+from kano_feedback.archive import ArchiveBuilder, DEFAULT_COMPRESSION, \
+    archive_extension, ram_tmp_dir
+from kano_feedback.chunked_upload import ChunkedUploader, UploadState
+from kano_feedback.budget import KEPT, TRUNCATED, member_size, \
+    plan_budget, tar_budget, tar_size
+from kano_feedback.task_pool import SharedResource, iter_tasks
+from kano_feedback.collectors import DEFAULT_PROFILE, FIRMWARE_PROBE, \
+    JOURNAL, LOG_STATE, PROC_SNAPSHOT, TIME_WINDOW, Priority, Profile, \
+    get_profile
+from kano_feedback.coredumps import COREDUMP_MAX_BYTES, CoredumpIndex, \
+    list_coredumps, render_crash_summary, select_coredumps
+from kano_feedback.firmware import GENCMD_MEM, FirmwareProbe
+from kano_feedback.journal import JournalReader, newest_cursor, \
+    render_json, render_short
+from kano_feedback.log_state import LogState
+from kano_feedback import native
+from kano_feedback.paths import Path
+from kano_feedback.proc_snapshot import take_snapshot, render_processes, \
+    render_process_tree, render_mem_ranking, render_open_files
+from kano_feedback.result_cache import ResultCache
+from kano_feedback.spool import ReportSpool
+from kano_feedback.streaming import StreamPipe, UploadProgress, \
+    multipart_content_type, multipart_stream
+from kano_feedback.templates import LogSummary
+from kano_feedback.tail import read_tail, tail_file, with_marker
+from kano_feedback.time_window import TimeWindow, dpkg_log_time
 
 
 TMP_DIR = os.path.join(os.path.expanduser('~'), '.kano-feedback/')
 SCREENSHOT_NAME = 'screenshot.png'
 SCREENSHOT_PATH = os.path.join(TMP_DIR, SCREENSHOT_NAME)
-ARCHIVE_NAME = 'bug_report.tar.gz'
-ARCHIVE_PATH = os.path.join(TMP_DIR, ARCHIVE_NAME)
+COREDUMPS_SKIPPED_NAME = 'coredumps-skipped.txt'
+APP_LOGS_RAW_NAME = 'app-logs.txt'
+APP_LOGS_JSON_NAME = 'app-logs-json.txt'
+BUDGET_NAME = 'budget.json'
+LOG_TEMPLATES_NAME = 'log-templates.txt'
+ARCHIVE_BASENAME = 'bug_report'
 SEPARATOR = '-----------------------------------------------------------------'
 
+CHUNKED_UPLOAD_ATTEMPTS = 3
+
 DPKG_LOG_PATH = '/var/log/dpkg.log'
 APT_LOG_PATH = '/var/log/apt/'
+XORG_LOG_PATH = '/var/log/Xorg.0.log'
+WPA_LOG_PATH = '/var/log/kano_wpa.log'
+COMPRESSED_LOG_EXTENSIONS = ('.gz', '.xz', '.bz2')
+
+# Caps on how much of each log goes in a report, the end is kept
+INSTALL_LOG_MAX_BYTES = 512 * 1024
+SOURCES_LIST_MAX_BYTES = 64 * 1024
+XORG_LOG_MAX_BYTES = 512 * 1024
+WPA_LOG_MAX_LINES = 300
 
 
-def send_data(text, full_info, subject='', network_send=True, logs_path=''):
+def archive_name(compression=DEFAULT_COMPRESSION):
+    '''
+    Returns the file name of the report archive, with the extension of its
+    compression method, e.g. bug_report.tar.xz
+    '''
+    return ARCHIVE_BASENAME + archive_extension(compression)
+
+
+def archive_path(compression=DEFAULT_COMPRESSION):
+    '''
+    Returns where the report archive is written in TMP_DIR
+    '''
+    return os.path.join(TMP_DIR, archive_name(compression))
+
+
+def send_data(text, full_info, subject='', network_send=True, logs_path='',
+              profile=DEFAULT_PROFILE, compression=DEFAULT_COMPRESSION,
+              compression_level=None, stream=True, progress_cb=None,
+              chunked=False, incremental=False, since=None, until=None,
+              max_bytes=None, log_templates=False):
     """Sends the data to our servers through a post request.
 
     It uses :func:`~get_metadata_archive` to gather all the logs on
-    the system.
+    the system. When streaming, the upload starts straight away and the
+    archive is sent while it is being built, see :func:`~stream_report`.
+    In chunked mode the finished archive is sent in resumable chunks
+    instead, see :class:`kano_feedback.chunked_upload.ChunkedUploader`.
+
+    When the logs cannot be sent, because there is no connectivity or the
+    upload fails, they are kept in the report spool and sent in the
+    background later on, see :func:`~spool_report`. This counts as success.
+
+    How far each log was collected is only remembered once the report was
+    sent or spooled, so that an incremental report picks up from there, see
+    :class:`kano_feedback.log_state.LogState`.
+
+    The logs can be restricted to the window of time around an incident,
+    see :class:`kano_feedback.time_window.TimeWindow`.
 
     Args:
         text (str): The description of the email when sending the logs
@@ -49,6 +128,26 @@ def send_data(text, full_info, subject='', network_send=True, logs_path=''):
         subject (str): The title of the email when sending the logs
         network_send (bool): Whether to send the data to our servers
         logs_path (str): Path to an existing logs archive to use instead
+        profile (str): Name of the collection profile selecting which logs
+            to gather, see :const:`kano_feedback.collectors.PROFILES`
+        compression (str): How to compress the logs archive, see
+            :class:`kano_feedback.archive.Compression`
+        compression_level (int): The compression level, defaults to the
+            default of the compression method
+        stream (bool): Whether to upload the logs while gathering them
+        progress_cb (function): Called with a
+            :class:`kano_feedback.streaming.UploadProgress` as the logs are
+            uploaded, from the sending thread
+        chunked (bool): Whether to upload the logs in resumable chunks,
+            better suited to large reports and flaky connections
+        incremental (bool): Whether to only send the logs added since the
+            last report, which the new report then refers to
+        since (float): UNIX timestamp from which to gather the logs
+        until (float): UNIX timestamp up to which to gather the logs
+        max_bytes (int): Most bytes the report may take as an uncompressed
+            tar archive, ``None`` for no limit
+        log_templates (bool): Whether to add a summary of the main logs,
+            their lines grouped into templates
 
     Returns:
         bool, error: Whether the operation was successful or there was
@@ -57,13 +156,33 @@ def send_data(text, full_info, subject='', network_send=True, logs_path=''):
 
     from kano_world.functions import get_email, get_mixed_username
 
+    if full_info and get_profile(profile) is None:
+        return False, 'Unknown collection profile: {}'.format(profile)
+
+    log_state = LogState(Path.LOG_STATE_PATH, incremental=incremental)
+    archive_kwargs = {
+        'title': subject,
+        'desc': text,
+        'profile': profile,
+        'compression': compression,
+        'compression_level': compression_level,
+        'log_state': log_state,
+        'time_window': TimeWindow(since, until),
+        'max_bytes': max_bytes,
+        'log_templates': log_templates,
+    }
+    use_logs = bool(logs_path and os.path.exists(logs_path))
+    offline = full_info and network_send and not is_internet()
+    streaming = full_info and network_send and stream and not chunked and \
+        not use_logs and not offline
+
     files = {}
     # packs all the information into 'files'
-    if full_info:
-        if logs_path and os.path.exists(logs_path):
+    if full_info and not streaming:
+        if use_logs:
             files['report'] = open(logs_path, 'rb')
         else:
-            files['report'] = get_metadata_archive(title=subject, desc=text)
+            files['report'] = get_metadata_archive(**archive_kwargs)
     # This is the actual info: subject, text, email, username
     payload = {
         "text": text,
@@ -76,14 +195,36 @@ def send_data(text, full_info, subject='', network_send=True, logs_path=''):
     if not network_send:
         return True, None
 
-    # send the bug report and remove all the created files
-    success, error, data = request_wrapper('post', '/feedback',
-                                           data=payload, files=files)
+    # send the bug report and remove all the created files, offline it is
+    # spooled straight away
+    if offline and not use_logs:
+        success, error = False, 'No internet connection'
+    elif streaming:
+        success, error = stream_report(payload, archive_kwargs,
+                                       progress_cb=progress_cb)
+    elif full_info and chunked:
+        files['report'].close()
+        success, error = upload_chunked(files['report'].name, payload,
+                                        progress_cb=progress_cb)
+    else:
+        success, error, data = request_wrapper('post', '/feedback',
+                                               data=payload, files=files)
+
+    if not success and full_info and not use_logs:
+        logger.warn('Could not send the report: {}'.format(error))
+        if 'report' in files:
+            files['report'].close()
+        success = spool_report(archive_path(compression), payload)
+        if success:
+            error = None
     delete_tmp_dir()
 
     if not success:
         return False, error
     if full_info:
+        if not use_logs:
+            log_state.commit()
+
         # kano-profile stat collection
         from kano_profile.badges import increment_app_state_variable_with_dialog
         increment_app_state_variable_with_dialog('kano-feedback',
@@ -94,6 +235,166 @@ def send_data(text, full_info, subject='', network_send=True, logs_path=''):
     return True, None
 
 
+def stream_report(payload, archive_kwargs, progress_cb=None):
+    """Upload a report while its logs archive is being built.
+
+    The archive is built by :func:`~get_metadata_archive` in a separate
+    thread. The compressed bytes go through a
+    :class:`kano_feedback.streaming.StreamPipe` into a chunked multipart
+    upload, so network time overlaps with collection time. The archive is
+    still written to :func:`~archive_path`.
+
+    Args:
+        payload (dict): The form fields of the report
+        archive_kwargs (dict): Arguments for :func:`~get_metadata_archive`
+        progress_cb (function): Called with the
+            :class:`kano_feedback.streaming.UploadProgress` of the upload
+
+    Returns:
+        bool, error: Whether the report was sent or the error
+    """
+    pipe = StreamPipe()
+    build_errors = []
+
+    def build_archive():
+        try:
+            get_metadata_archive(stream_to=pipe, **archive_kwargs).close()
+        except Exception:
+            build_errors.append(traceback.format_exc())
+            pipe.close(failed=True)
+        else:
+            pipe.close()
+
+    builder = threading.Thread(target=build_archive, name='report-archive')
+    builder.daemon = True
+    builder.start()
+
+    boundary = uuid.uuid4().hex
+    progress = UploadProgress(progress_cb)
+    body = multipart_stream(
+        boundary, payload, 'report',
+        archive_name(archive_kwargs.get('compression', DEFAULT_COMPRESSION)),
+        pipe, progress=progress
+    )
+    try:
+        success, error, _ = request_wrapper(
+            'post', '/feedback', data=body,
+            headers={'Content-Type': multipart_content_type(boundary)}
+        )
+    except Exception as exception:
+        success, error = False, str(exception)
+    finally:
+        # Let the archive finish even if the upload gave up on it
+        pipe.abandon()
+        builder.join()
+        progress.finish()
+
+    if build_errors:
+        logger.error('Could not build the report archive:\n{}'
+                     .format(build_errors[0]))
+        return False, 'Could not gather the logs'
+
+    return success, error
+
+
+def upload_chunked(archive_path, payload, progress_cb=None,
+                   attempts=CHUNKED_UPLOAD_ATTEMPTS):
+    """Upload a finished report archive in resumable chunks.
+
+    Every new attempt resumes from the chunks the server acknowledged.
+
+    Args:
+        archive_path (str): The report archive
+        payload (dict): The form fields of the report
+        progress_cb (function): Called with the
+            :class:`kano_feedback.streaming.UploadProgress` of the upload
+        attempts (int): How many times to resume the upload
+
+    Returns:
+        bool, error: Whether the report was sent or the last error
+    """
+    uploader = ChunkedUploader(progress=UploadProgress(progress_cb))
+
+    success, error = False, None
+    for attempt in xrange(attempts):
+        success, error = uploader.upload(archive_path, payload)
+        if success:
+            break
+
+        logger.warn('Chunked upload failed (try {}): {}'
+                    .format(attempt, error))
+
+    return success, error
+
+
+def spool_report(archive_path, payload):
+    """Keep a report which could not be sent to send it in the background.
+
+    The archive is moved into the report spool and the drain worker is
+    started, see :class:`kano_feedback.spool.ReportSpool`.
+
+    Args:
+        archive_path (str): The finished report archive
+        payload (dict): The form fields of the report
+
+    Returns:
+        bool: Whether the report was spooled
+    """
+    if not os.path.isfile(archive_path):
+        return False
+
+    try:
+        entry = ReportSpool(Path.REPORT_SPOOL_DIR).add(archive_path, payload)
+    except (IOError, OSError) as exception:
+        logger.error('Could not spool the report: {}'.format(exception))
+        return False
+
+    if entry is None:
+        logger.error('The report is too large to be spooled')
+        return False
+
+    logger.info('Report spooled as {}'.format(entry.entry_id))
+    start_spool_drainer()
+
+    return True
+
+
+def send_spooled_report(archive_path, payload):
+    """Send a report from the spool.
+
+    A report whose chunked upload failed before it was spooled resumes that
+    upload, see :class:`kano_feedback.chunked_upload.ChunkedUploader`.
+
+    Returns:
+        bool, error: Whether the report was sent or the error
+    """
+    if os.path.exists(UploadState(archive_path).path):
+        return ChunkedUploader().upload(archive_path, payload)
+
+    with open(archive_path, 'rb') as report_f:
+        success, error, _ = request_wrapper('post', '/feedback', data=payload,
+                                            files={'report': report_f})
+
+    return success, error
+
+
+def start_spool_drainer():
+    """Start sending the spooled reports in the background.
+
+    The drain runs as a separate process, see ``kano-feedback-spool``,
+    so that it outlives the app. Only one drain runs at a time.
+
+    Returns:
+        bool: Whether there were reports to send
+    """
+    if not ReportSpool(Path.REPORT_SPOOL_DIR).entries():
+        return False
+
+    run_cmd('setsid kano-feedback-spool --drain > /dev/null 2>&1 &')
+
+    return True
+
+
 def delete_tmp_dir():
     '''
     Deletes TMP_DIR directory
@@ -115,82 +416,269 @@ def delete_screenshot():
     delete_file(SCREENSHOT_PATH)
 
 
-def get_metadata_archive(title='', desc=''):
+def get_metadata_archive(title='', desc='', max_workers=None,
+                         profile=DEFAULT_PROFILE,
+                         compression=DEFAULT_COMPRESSION,
+                         compression_level=None, stream_to=None,
+                         log_state=None, result_cache=None, time_window=None,
+                         coredump_max_bytes=COREDUMP_MAX_BYTES,
+                         max_bytes=None, log_templates=False):
     '''
-    It creates a file (ARCHIVE_NAME) with all the information
-    Returns the file
+    It creates a file (see archive_path) with all the information
+    Returns the file, opened for reading
+
+    Only the collectors selected by ``profile`` are run, see
+    :mod:`kano_feedback.collectors`. They are independent of each other
+    so they are run concurrently on a pool of ``max_workers`` threads, see
+    :func:`kano_feedback.task_pool.iter_tasks`.
+
+    The archive is compressed with ``compression`` at ``compression_level``,
+    see :class:`kano_feedback.archive.Compression`. The achieved ratio is
+    tracked so the default can be chosen from real reports.
+
+    Members are added as soon as their collector is done. When
+    ``stream_to`` is given, e.g. a :class:`kano_feedback.streaming.StreamPipe`,
+    it receives the compressed archive as it is written.
+
+    The log collectors record how far they read into ``log_state``, a
+    :class:`kano_feedback.log_state.LogState`, and only collect the new
+    entries when it is incremental. The metadata identifies the report and
+    the report it follows on from. They only gather the entries within
+    ``time_window``, a :class:`kano_feedback.time_window.TimeWindow`, which
+    the metadata records.
+
+    The output of the collectors declaring their sources is kept in
+    ``result_cache``, a :class:`kano_feedback.result_cache.ResultCache`, and
+    reused until the sources change.
+
+    Coredumps are streamed from disk, the newest first up to
+    ``coredump_max_bytes`` in total, see
+    :func:`kano_feedback.coredumps.select_coredumps`. The skipped ones are
+    listed in the archive.
+
+    With ``max_bytes``, the report is fitted in that many bytes of
+    uncompressed tar, headers and padding included.
+    The members are then written once they are all collected, by
+    :class:`kano_feedback.collectors.Priority`, the least valuable ones
+    truncated or dropped, see :func:`kano_feedback.budget.plan_budget`. The
+    decisions are recorded in BUDGET_NAME. The log positions reached by the
+    collectors of the members cut are not recorded in ``log_state``.
+
+    With ``log_templates``, the lines of the main logs are grouped into
+    templates as they are collected, see
+    :class:`kano_feedback.templates.LogSummary`. The summary goes in
+    LOG_TEMPLATES_NAME, among the first members to fit the budget.
     '''
     ensure_dir(TMP_DIR)
-    file_list = [
-        {
-            'name': 'metadata.json',
-            'contents': json.dumps({'title': title, 'description': desc})
-        },
-        {'name': 'kanux_version.txt', 'contents': get_version()},
-        {'name': 'kanux_stamp.txt', 'contents': get_stamp()},
-        {'name': 'process.txt', 'contents': get_processes()},
-        {'name': 'process-tree.txt', 'contents': get_process_tree()},
-        {'name': 'packages.txt', 'contents': get_packages()},
-        {'name': 'dmesg.txt', 'contents': get_dmesg()},
-        {'name': 'syslog.txt', 'contents': get_syslog()},
-        {
-            'name': 'cmdline.txt',
-            'contents': read_file_contents('/boot/cmdline.txt')
-        },
-        {
-            'name': 'config.txt',
-            'contents': read_file_contents('/boot/config.txt')
-        },
-        {'name': 'wifi-info.txt', 'contents': get_wifi_info()},
-        {'name': 'usbdevices.txt', 'contents': get_usb_devices()},
-
-        # TODO: Remove raw logs when json ones become stable
-        {'name': 'app-logs.txt', 'contents': get_app_logs_raw()},
-
-        {'name': 'app-logs-json.txt', 'contents': get_app_logs_json()},
-        {'name': 'hdmi-info.txt', 'contents': get_hdmi_info()},
-        {'name': 'edid.dat', 'contents': get_edid()},
-        {'name': 'screen-log.txt', 'contents': get_screen_log()},
-        {'name': 'xorg-log.txt', 'contents': get_xorg_log()},
-        {'name': 'cpu-info.txt', 'contents': get_cpu_info()},
-        {'name': 'mem-stats.txt', 'contents': get_mem_stats()},
-        {'name': 'lsof.txt', 'contents': get_lsof()},
-        {'name': 'content-objects.txt', 'contents': get_co_list()},
-        {'name': 'disk-space.txt', 'contents': get_disk_space()},
-        {'name': 'lsblk.txt', 'contents': get_lsblk()},
-        {'name': 'sources-list.txt', 'contents': get_sources_list()},
-    ]
-    file_list += get_install_logs()
-
-    # Include the screenshot if it exists
-    if os.path.isfile(SCREENSHOT_PATH):
-        file_list.append({
-            'name': SCREENSHOT_NAME,
-            'contents': read_file_contents(SCREENSHOT_PATH)
-        })
-    # Collect all coredumps, for applications that terminated unexpectedly
-    for f in os.listdir('/var/tmp/'):
-        if f.startswith('core-'):
-            file_list.append({
-                'name': f,
-                'contents': read_file_contents(os.path.join('/var/tmp', f))
-            })
-    # create files for each non empty metadata info
-    for file in file_list:
-        if file['contents']:
-            write_file_contents(
-                os.path.join(TMP_DIR, file['name']), file['contents']
+
+    if not isinstance(profile, Profile):
+        profile_name = profile
+        profile = get_profile(profile_name)
+        if profile is None:
+            raise ValueError(
+                'Unknown collection profile: {}'.format(profile_name)
             )
-    # archive all the metadata files
-    import tarfile
-    with tarfile.open(ARCHIVE_PATH, mode='w') as archive:
-        for f in os.listdir(TMP_DIR):
-            archive.add(os.path.join(TMP_DIR, f), arcname=f)
+    collectors = profile.select()
+
+    if log_state is None:
+        log_state = LogState()
+    if time_window is None:
+        time_window = TimeWindow()
+    shared = {
+        LOG_STATE: log_state,
+        TIME_WINDOW: time_window,
+        PROC_SNAPSHOT: SharedResource(_snapshot_factory(collectors)),
+        FIRMWARE_PROBE: FirmwareProbe(),
+        JOURNAL: SharedResource(functools.partial(
+            read_journal,
+            log_state.for_collectors(
+                collector.name for collector in collectors
+                if JOURNAL in collector.shared
+            ),
+            time_window
+        )),
+    }
+    if result_cache is None:
+        result_cache = ResultCache(Path.RESULT_CACHE_DIR)
+
+    # Look the functions up now so that they can be replaced at runtime, see
+    # COLLECTOR_FNS
+    jobs = []
+    for collector in collectors:
+        kwargs = dict((name, shared[name]) for name in collector.shared)
+        # the positions reached are tied to the collector, see below
+        if LOG_STATE in kwargs:
+            kwargs[LOG_STATE] = log_state.for_collectors([collector.name])
+        job = functools.partial(COLLECTOR_FNS[collector.fn], **kwargs)
+        if collector.sources:
+            job = result_cache.wrap(collector.name, collector.sources, job)
+        jobs.append((collector.name, job))
+    costs = [collector.cost for collector in collectors]
+
+    # with a byte budget, the members wait until they are all known
+    pending = [] if max_bytes is not None else None
+    log_summary = LogSummary() if log_templates else None
+    # files collectors wrote only for the archive, removed once it is done
+    staged = []
+
+    def add_members(archive, file_list, priority=Priority.NORMAL,
+                    truncatable=True, collector=None):
+        staged.extend(file['path'] for file in file_list
+                      if file.get('temporary'))
+        if log_summary is not None:
+            for file in file_list:
+                log_summary.add_member(file)
+
+        if pending is not None:
+            pending.extend(
+                dict(file, priority=priority, truncatable=truncatable,
+                     collector=collector)
+                for file in file_list
+            )
+        else:
+            write_members(archive, file_list)
 
-    # open the file and return it
-    archive = open(ARCHIVE_PATH, 'rb')
+    def write_members(archive, file_list):
+        # files on disk are streamed rather than loaded, empty ones skipped
+        for file in file_list:
+            if file.get('path'):
+                archive.add_file(file['name'], file['path'])
+            elif file.get('contents'):
+                archive.add_contents(file['name'], file['contents'])
 
-    return archive
+        if stream_to is not None:
+            archive.flush()
+
+    try:
+        # write each non empty metadata info straight into the archive, always
+        # in the same order, as soon as it has been collected
+        with ArchiveBuilder(archive_path(compression), compression=compression,
+                            level=compression_level, workers=max_workers,
+                            tee=stream_to) as archive:
+            metadata = {'title': title, 'description': desc}
+            metadata.update(log_state.metadata())
+            metadata.update(time_window.metadata())
+            metadata_json = json.dumps(metadata)
+            write_members(archive, [{
+                'name': 'metadata.json',
+                'contents': metadata_json
+            }])
+
+            results = iter_tasks(jobs, max_workers=max_workers,
+                                 costs=costs)
+            for idx, result in enumerate(results):
+                if result.failed:
+                    logger.error('Collector for {} failed:\n{}'
+                                 .format(result.name, result.error))
+                    continue
+
+                collector = collectors[idx]
+                if collector.expands:
+                    members = result.contents
+                else:
+                    members = [{
+                        'name': result.name,
+                        'contents': result.contents
+                    }]
+                add_members(archive, members, priority=collector.priority,
+                            truncatable=collector.truncatable,
+                            collector=collector.name)
+
+            # Include the screenshot if it exists
+            if os.path.isfile(SCREENSHOT_PATH):
+                add_members(archive, [{
+                    'name': SCREENSHOT_NAME,
+                    'path': SCREENSHOT_PATH
+                }], truncatable=False)
+            # Collect the newest coredumps, for applications that terminated
+            # unexpectedly
+            if profile.coredumps:
+                dumps, skipped = select_coredumps(
+                    list_coredumps(index=CoredumpIndex()), coredump_max_bytes
+                )
+                add_members(archive, [
+                    {'name': dump.name, 'path': dump.path} for dump in dumps
+                ], priority=Priority.LOW, truncatable=False)
+                add_members(archive, [{
+                    'name': COREDUMPS_SKIPPED_NAME,
+                    'contents': ''.join(
+                        '{} {}\n'.format(dump.name, dump.size)
+                        for dump in skipped
+                    )
+                }], priority=Priority.HIGH)
+
+            if log_summary is not None:
+                add_members(archive, [{
+                    'name': LOG_TEMPLATES_NAME,
+                    'contents': log_summary.render()
+                }], priority=Priority.HIGH)
+
+            # Fit the members in the budget, recording what was cut and why
+            if pending is not None:
+                # budget.json goes in too, so room is kept for its longest
+                # version, every member truncated
+                reserved = tar_size('metadata.json', len(metadata_json)) + \
+                    tar_size(BUDGET_NAME, len(_render_budget(
+                        max_bytes, [{
+                            'name': member['name'],
+                            'priority': member['priority'],
+                            'bytes': member_size(member),
+                            'included_bytes': member_size(member),
+                            'action': TRUNCATED,
+                        } for member in pending]
+                    )))
+                kept, decisions = plan_budget(
+                    pending, tar_budget(max_bytes) - reserved
+                )
+                # what was cut is collected again by the next incremental
+                # report
+                actions = dict(
+                    (decision['name'], decision['action'])
+                    for decision in decisions
+                )
+                log_state.forget(set(
+                    member['collector'] for member in pending
+                    if member['collector'] and
+                    actions.get(member['name'], KEPT) != KEPT
+                ))
+                write_members(archive, [{
+                    'name': BUDGET_NAME,
+                    'contents': _render_budget(max_bytes, decisions)
+                }])
+                write_members(archive, kept)
+    finally:
+        _remove_files(staged)
+
+    # hand back the archive, ready to be read from the start
+    archive_f = archive.close()
+    _track_archive_stats(archive.stats)
+
+    return archive_f
+
+
+def _render_budget(max_bytes, decisions):
+    '''
+    Returns the contents of BUDGET_NAME
+    '''
+    return json.dumps({
+        'max_bytes': max_bytes,
+        'members': decisions,
+    }, sort_keys=True, indent=4, separators=(',', ': '))
+
+
+def _track_archive_stats(stats):
+    """Record how well the report archive compressed."""
+    logger.info(
+        'Report archive: {compression} level {level}, {raw_bytes} bytes '
+        'compressed to {compressed_bytes} ({ratio:.2f}) in {seconds:.2f}s'
+        .format(**stats)
+    )
+
+    try:
+        from kano_profile.tracker import track_data
+        track_data('feedback_report_archive', stats)
+    except Exception as exception:
+        logger.warn('Could not track the archive stats: {}'.format(exception))
 
 
 def get_version():
@@ -199,6 +687,22 @@ def get_version():
     Uses the command kanux_version
     '''
     cmd = "ls -l /etc/kanux_version | awk '{ print $6 \" \" $7 \" \" $8 }' && cat /etc/kanux_version"
+
+    return _native_or_cmd(native.kanux_version, cmd)
+
+
+def _native_or_cmd(native_fn, cmd):
+    '''
+    Returns the output of native_fn, which reads what cmd would print
+    straight from the system files, see kano_feedback.native
+    Runs cmd instead when native_fn cannot, to avoid forking otherwise
+    '''
+    try:
+        return native_fn()
+    except Exception:
+        logger.warn('Falling back to "{}":\n{}'
+                    .format(cmd, traceback.format_exc()))
+
     o, _, _ = run_cmd(cmd)
 
     return o
@@ -213,24 +717,73 @@ def get_stamp():
     return read_file_contents('/boot/kanux_stamp') or ''
 
 
-def get_processes():
+def get_cmdline():
+    """Get the kernel command line the board was booted with.
+
+    Returns:
+        str: The contents of the boot cmdline.txt file
+    """
+    return read_file_contents('/boot/cmdline.txt')
+
+
+def get_boot_config():
+    """Get the firmware configuration of the board.
+
+    Returns:
+        str: The contents of the boot config.txt file
+    """
+    return read_file_contents('/boot/config.txt')
+
+
+def get_processes(proc_snapshot=None):
     '''
     Returns a string with the current processes running in the system
     '''
     cmd = "ps -Ao user,pid,pcpu,pmem,vsz,rss,tty=TTY,tmout,f=FLAGS,wchan=EXTRA-WIDE-WCHAN-COLUMN,stat,start_time,time,args"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(
+        lambda: render_processes(_get_snapshot(proc_snapshot)),
+        cmd
+    )
 
 
-def get_process_tree():
+def get_process_tree(proc_snapshot=None):
     '''
     Returns a string with the processes tree of the system
     '''
     cmd = "pstree -apl"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(
+        lambda: render_process_tree(_get_snapshot(proc_snapshot, tasks=True)),
+        cmd
+    )
+
+
+def _get_snapshot(proc_snapshot=None, **kwargs):
+    '''
+    Returns the walk of /proc shared by the collectors of the report, or
+    walks /proc when the collector runs on its own, reading what kwargs ask
+    for, see kano_feedback.proc_snapshot.take_snapshot
+    '''
+    if proc_snapshot is not None:
+        return proc_snapshot.get()
+
+    return take_snapshot(**kwargs)
+
+
+def _snapshot_factory(collectors):
+    '''
+    Returns what walks /proc for the collectors of a report, only reading
+    the threads and the open files when a selected collector renders them
+    '''
+    fns = set(collector.fn for collector in collectors)
+
+    return functools.partial(
+        take_snapshot,
+        tasks='get_process_tree' in fns,
+        # without root lsof is run instead, see get_lsof
+        open_files='get_lsof' in fns and os.geteuid() == 0
+    )
 
 
 def get_packages():
@@ -238,9 +791,8 @@ def get_packages():
     Returns a string with the list of packages installed in the system
     '''
     cmd = "dpkg-query -l"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(native.dpkg_list, cmd)
 
 
 def get_dmesg():
@@ -256,24 +808,54 @@ def get_dmesg():
     return '%s\n%s' % (d, t)
 
 
-def get_syslog():
+def read_journal(log_state=None, time_window=None):
     '''
-    Returns the last 1000 lines of syslog messages
+    Returns the newest journal entries, since the last report when
+    incremental, within the time window if there is one, and records the
+    cursor of the newest one
     '''
-    cmd = "sudo journalctl -b | tail -n 1000"
-    o, _, _ = run_cmd(cmd)
+    cursor = log_state.journal_cursor if log_state else None
+    entries = JournalReader().read(cursor, time_window)
 
-    return o
+    if log_state and newest_cursor(entries):
+        log_state.journal_read(newest_cursor(entries))
+
+    return entries
+
+
+def _get_journal(journal=None):
+    '''
+    Returns the journal entries shared by the collectors of the report, or
+    reads them when the collector runs on its own
+    '''
+    if journal is not None:
+        return journal.get()
+
+    return read_journal()
+
+
+def get_syslog(journal=None):
+    '''
+    Returns the last 1000 lines of syslog messages, see read_journal
+    '''
+    return render_short(_get_journal(journal))
+
+
+def get_syslog_json(journal=None):
+    '''
+    Returns the last 1000 syslog messages as a JSON stream, see read_journal
+    '''
+    return render_json(_get_journal(journal))
 
 
 def get_wpalog():
     '''
-    Returns the last 300 lines of the wpa log
+    Returns the last WPA_LOG_MAX_LINES lines of the wpa log
     '''
-    cmd = "tail -n 300 /var/log/kano_wpa.log"
-    o, _, _ = run_cmd(cmd)
+    if not os.path.isfile(WPA_LOG_PATH):
+        return ''
 
-    return o
+    return _read_log(WPA_LOG_PATH, max_lines=WPA_LOG_MAX_LINES)
 
 
 def get_wlaniface():
@@ -286,14 +868,50 @@ def get_wlaniface():
     return o
 
 
-def get_xorg_log():
+def get_xorg_log(log_state=None, time_window=None):
     '''
-    Returns a string with the Xorg log
+    Returns a string with the end of the Xorg log
+
+    Its lines are timed from the start of the server, so the time window
+    only leaves out a log which ended before it
     '''
-    cmd = "cat /var/log/Xorg.0.log"
-    o, _, _ = run_cmd(cmd)
+    if not os.path.isfile(XORG_LOG_PATH):
+        return ''
+
+    return _read_log(XORG_LOG_PATH, log_state, max_bytes=XORG_LOG_MAX_BYTES,
+                     time_window=time_window)
 
-    return o
+
+def _read_log(path, log_state=None, max_bytes=None, max_lines=None,
+              time_window=None, time_fn=None):
+    '''
+    Returns the end of a log file, up to ``max_bytes`` or ``max_lines``,
+    only what was appended since the last report when ``log_state`` is
+    incremental, and records how far the file was read
+
+    With a ``time_window``, a log last modified before it is left out. When
+    ``time_fn`` gets the time of its lines, the log is bisected down to the
+    lines within the window, see :meth:`TimeWindow.span`.
+
+    The contents start with kano_feedback.tail.TRUNCATION_MARKER when some
+    of it was left out
+    '''
+    with open(path, 'r') as log_f:
+        stat = os.fstat(log_f.fileno())
+        start = log_state.file_offset(path, stat) if log_state else 0
+        end = stat.st_size
+        if time_window and time_window.ends_before(stat.st_mtime):
+            start = end
+        elif time_window and time_fn:
+            start, end = time_window.span(log_f, time_fn, start, end)
+        contents, truncated = read_tail(log_f, max_bytes=max_bytes,
+                                        max_lines=max_lines, start=start,
+                                        end=end)
+
+    if log_state:
+        log_state.file_read(path, stat, end)
+
+    return with_marker(contents, truncated)
 
 
 def get_cpu_info():
@@ -307,76 +925,93 @@ def get_cpu_info():
     return o
 
 
-def get_mem_stats():
+def get_mem_stats(proc_snapshot=None, firmware_probe=None):
     """
     Get information about memory usage
     """
     mem_stats = ''
+    firmware_probe = firmware_probe or FirmwareProbe()
 
     out, _, _ = run_cmd('free --human --lohi --total')
     mem_stats += out + '\n'
-    out, _, _ = run_cmd('vcgencmd get_mem arm')
-    mem_stats += out
-    out, _, _ = run_cmd('vcgencmd get_mem gpu')
-    mem_stats += out
-    out, _, _ = run_cmd('vcgencmd get_mem reloc')
-    mem_stats += out
-    out, _, _ = run_cmd('vcgencmd get_mem reloc_total')
-    mem_stats += out
-    out, _, _ = run_cmd('vcgencmd get_mem malloc')
-    mem_stats += out
-    out, _, _ = run_cmd('vcgencmd get_mem malloc_total')
-    mem_stats += out + '\n'
-    out, _, _ = run_cmd('vcgencmd mem_reloc_stats')
-    mem_stats += out + '\n'
-    out, _, _ = run_cmd('cat /proc/meminfo')
-    mem_stats += out + '\n'
-    out, _, _ = run_cmd('ps -eo pmem,args --no-headers --sort -pmem')
-    mem_stats += out
+    # the memory split and relocatable heap, queried in a single batch
+    gencmd = firmware_probe.vcgencmd(GENCMD_MEM)
+    mem_stats += ''.join(gencmd[:-1]) + '\n'
+    mem_stats += gencmd[-1] + '\n'
+    mem_stats += _native_or_cmd(native.meminfo, 'cat /proc/meminfo') + '\n'
+    mem_stats += _native_or_cmd(
+        lambda: render_mem_ranking(_get_snapshot(proc_snapshot)),
+        'ps -eo pmem,args --no-headers --sort -pmem'
+    )
 
     return mem_stats
 
 
-def get_lsof():
+def get_lsof(proc_snapshot=None):
     '''
     Get lsof information (list of open files)
+    Only root can read the /proc/<pid>/fd of other users, so the snapshot
+    only holds the files of every process when taken as root. Otherwise
+    lsof is run through sudo, as the report would miss most open files
     '''
     cmd = "sudo /usr/bin/lsof"
-    o, _, _ = run_cmd(cmd)
-
-    return o
+    if os.geteuid() != 0:
+        o, _, _ = run_cmd(cmd)
+        return o
+
+    return _native_or_cmd(
+        lambda: render_open_files(
+            _get_snapshot(proc_snapshot, open_files=True)
+        ),
+        cmd
+    )
 
 
-def get_app_logs_raw():
+def get_app_logs(log_state=None, time_window=None):
     '''
-    Extract kano logs in raw format:
-    "LOGFILE: component" (one line per component)
-    followed by entries in the form:
+    Returns the kano logs as two members, written in a single pass to
+    temporary files in RAM, see :func:`kano_feedback.app_logs.export_app_logs`:
+    APP_LOGS_RAW_NAME with the entries in the form
     "2014-09-30T10:18:54.532015 kano-updater info: Return value: 0"
-    '''
-    logs = logging.read_logs()
-    output = ""
-    for f, data in logs.iteritems():
-        app_name = os.path.basename(f).split(".")[0]
-        output += "LOGFILE: {}\n".format(f)
-        for line in data:
-            line["time"] = datetime.datetime.fromtimestamp(line["time"]).isoformat()
-            output += "{time} {app} {level}: {message}\n".format(app=app_name, **line)
-
-    return output
+    under a "LOGFILE: <path>" line per log, and APP_LOGS_JSON_NAME with one
+    JSON entry per line
 
-
-def get_app_logs_json():
-    '''
-    Return a JSON stream with the kano logs
+    The members are marked temporary, get_metadata_archive removes the files
+    once they are in the archive
     '''
-    # Fetch the kano logs
-    kano_logs = logging.read_logs()
+    paths = []
+    try:
+        for name in (APP_LOGS_RAW_NAME, APP_LOGS_JSON_NAME):
+            fd, path = tempfile.mkstemp(prefix='kano-feedback-',
+                                        suffix='-' + name,
+                                        dir=ram_tmp_dir())
+            os.close(fd)
+            paths.append(path)
+
+        raw_path, json_path = paths
+        with open(raw_path, 'w') as raw_f, open(json_path, 'w') as json_f:
+            exported = export_app_logs(raw_f, json_f, log_state=log_state,
+                                       time_window=time_window)
+    except Exception:
+        _remove_files(paths)
+        raise
+
+    if not exported:
+        _remove_files(paths)
+        return []
+
+    return [
+        {'name': APP_LOGS_RAW_NAME, 'path': raw_path, 'temporary': True},
+        {'name': APP_LOGS_JSON_NAME, 'path': json_path, 'temporary': True},
+    ]
+
 
-    # Transform them into a sorted, indented json stream
-    kano_logs_json = json.dumps(kano_logs, sort_keys=True, indent=4,
-                                separators=(',', ': '))
-    return kano_logs_json
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 
 def get_kwifi_cache():
@@ -386,9 +1021,8 @@ def get_kwifi_cache():
     Keypass is sent as "obfuscated" literal.
     '''
     cmd = "cat /etc/kwifiprompt-cache.conf | sed 's/\"enckey\":.*/\"enckey\": \"obfuscated\"/'"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(native.kwifi_cache, cmd)
 
 
 def get_usb_devices():
@@ -399,9 +1033,8 @@ def get_usb_devices():
     We can know for wireless dongles and HIDs which kernel driver is loaded.
     '''
     cmd = "lsusb && lsusb -t"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(native.usb_devices, cmd)
 
 
 def get_networks_info():
@@ -429,61 +1062,51 @@ def get_wifi_info():
     return world_username + kwifi_cache + wlaniface + ifconfig + wpalog
 
 
-def get_edid():
-    file_path = os.path.join(TMP_DIR, 'edid.dat')
-    cmd = "tvservice -d {}".format(file_path)
-    run_cmd(cmd)
+def get_edid(firmware_probe=None):
+    """Get the raw EDID of the connected display.
+
+    The EDID is read once per report and shared with the other display
+    collectors, see :class:`kano_feedback.firmware.FirmwareProbe`.
+
+    Returns:
+        str: The EDID bytes or ``"EMPTY"`` if it could not be read
+    """
     try:
-        dat = read_file_contents(file_path)
-        delete_file(file_path)
-        return dat
-    except:
+        return (firmware_probe or FirmwareProbe()).display().edid
+    except Exception:
         return "EMPTY"
 
 
-def get_hdmi_info():
+def get_hdmi_info(firmware_probe=None):
     '''
     Returns a string with Display info
     '''
+    display = (firmware_probe or FirmwareProbe()).display()
     # Current resolution
-    cmd = "tvservice -s"
-    o, _, _ = run_cmd(cmd)
-    res = 'Current resolution: {}\n\n'.format(o)
-    # edid file
-    file_path = os.path.join(TMP_DIR, 'edid.dat')
-    cmd = "tvservice -d {} && edidparser {}".format(file_path, file_path)
-    edid, _, _ = run_cmd(cmd)
-    delete_file(file_path)
+    res = 'Current resolution: {}\n\n'.format(display.status)
+
+    return res + display.parsed_edid
 
-    return res + edid
 
+def get_screen_log(firmware_probe=None):
+    """Get display information.
 
-def get_screen_log():
-    """Get display information using kano-settings display functions.
+    The display is queried once per report and shared with the other display
+    collectors, see :class:`kano_feedback.firmware.FirmwareProbe`.
 
     Returns:
         dict: An aggregate of display characteristics
     """
 
     try:
-        from kano_settings.system.display import get_edid, get_edid_name, get_status, \
-            list_supported_modes, get_optimal_resolution_mode, override_models
-
-        edid = get_edid()
-        model = get_edid_name(use_cached=False)
-
-        override_models(edid, model)
-
-        status = get_status()
-        supported = list_supported_modes(use_cached=False)
-        optimal = get_optimal_resolution_mode(edid, supported)
+        display = (firmware_probe or FirmwareProbe()).display()
 
         log_data = {
-            'model': model,
-            'status': status,
-            'edid': edid,
-            'supported': supported,
-            'optimal': optimal,
+            'model': display.model,
+            'status': display.status.strip(),
+            'edid': display.parsed_edid,
+            'supported': display.supported_modes(),
+            'optimal': display.preferred_mode(),
         }
         log = json.dumps(log_data, sort_keys=True, indent=4)
     except:
@@ -492,6 +1115,13 @@ def get_screen_log():
     return log
 
 
+def get_crash_summary():
+    '''
+    Returns how often each application crashed, from the coredump index
+    '''
+    return render_crash_summary(CoredumpIndex().crashes())
+
+
 def get_co_list():
     '''
     Returns a list of content object IDs currently on the system.
@@ -507,16 +1137,14 @@ def get_co_list():
 
 def get_disk_space():
     cmd = "df -h"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(native.disk_space, cmd)
 
 
 def get_lsblk():
     cmd = "lsblk"
-    o, _, _ = run_cmd(cmd)
 
-    return o
+    return _native_or_cmd(native.lsblk, cmd)
 
 
 def get_sources_list():
@@ -538,8 +1166,7 @@ def get_sources_list():
         output.append('Source file: {}'.format(src_file))
         output.append(SEPARATOR)
 
-        with open(src_file, 'r') as src_f:
-            output.append(src_f.read())
+        output.append(tail_file(src_file, max_bytes=SOURCES_LIST_MAX_BYTES))
 
         output.append(SEPARATOR)
         output.append('')
@@ -547,7 +1174,14 @@ def get_sources_list():
     return '\n'.join(output)
 
 
-def get_install_logs():
+def get_install_logs(log_state=None, time_window=None):
+    '''
+    Returns the dpkg and apt logs, one member each
+
+    dpkg.log is bisected down to the time window. The apt logs are not
+    timestamped line by line, so only those modified before the window are
+    left out
+    '''
     log_list = []
 
     log_files = [DPKG_LOG_PATH]
@@ -562,8 +1196,17 @@ def get_install_logs():
             continue
 
         try:
-            with open(log_file, 'r') as log_f:
-                contents = log_f.read()
+            # rotated logs are compressed, they cannot be cut
+            if log_file.endswith(COMPRESSED_LOG_EXTENSIONS):
+                size = os.path.getsize(log_file)
+                contents = _read_log(log_file, log_state,
+                                     time_window=time_window) \
+                    if size <= INSTALL_LOG_MAX_BYTES else with_marker('', size)
+            else:
+                time_fn = dpkg_log_time if log_file == DPKG_LOG_PATH else None
+                contents = _read_log(log_file, log_state,
+                                     max_bytes=INSTALL_LOG_MAX_BYTES,
+                                     time_window=time_window, time_fn=time_fn)
 
             log_list.append(
                 {
@@ -595,12 +1238,12 @@ def copy_screenshot(filename):
         run_cmd("cp %s %s" % (filename, SCREENSHOT_PATH))
 
 
-def copy_archive_report(target_archive):
+def copy_archive_report(target_archive, compression=DEFAULT_COMPRESSION):
     '''
-    Copies source archive (TMP_DIR/ARCHIVE_NAME) into target_archive
+    Copies source archive (see archive_path) into target_archive
     '''
     ensure_dir(TMP_DIR)
-    source_archive = os.path.join(TMP_DIR, ARCHIVE_NAME)
+    source_archive = archive_path(compression)
     if os.path.isfile(source_archive):
         _, _, rc = run_cmd("cp %s %s" % (source_archive, target_archive))
         return (rc == 0)
@@ -733,3 +1376,35 @@ def send_question_response(answers, interactive=True, tags=['os', 'feedback-widg
         thank_you.run()
 
     return True
+
+
+# The functions doing the collection, by the name the collectors give in
+# kano_feedback.collectors.COLLECTORS
+COLLECTOR_FNS = {
+    'get_app_logs': get_app_logs,
+    'get_boot_config': get_boot_config,
+    'get_cmdline': get_cmdline,
+    'get_co_list': get_co_list,
+    'get_cpu_info': get_cpu_info,
+    'get_crash_summary': get_crash_summary,
+    'get_disk_space': get_disk_space,
+    'get_dmesg': get_dmesg,
+    'get_edid': get_edid,
+    'get_hdmi_info': get_hdmi_info,
+    'get_install_logs': get_install_logs,
+    'get_lsblk': get_lsblk,
+    'get_lsof': get_lsof,
+    'get_mem_stats': get_mem_stats,
+    'get_packages': get_packages,
+    'get_process_tree': get_process_tree,
+    'get_processes': get_processes,
+    'get_screen_log': get_screen_log,
+    'get_sources_list': get_sources_list,
+    'get_stamp': get_stamp,
+    'get_syslog': get_syslog,
+    'get_syslog_json': get_syslog_json,
+    'get_usb_devices': get_usb_devices,
+    'get_version': get_version,
+    'get_wifi_info': get_wifi_info,
+    'get_xorg_log': get_xorg_log,
+}
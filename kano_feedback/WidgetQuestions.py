@@ -10,13 +10,24 @@
 #
 
 import os
-import csv
 import time
+import threading
 from kano.network import is_internet
 from kano_profile.tracker import track_data
 from kano_world.connection import request_wrapper
 from kano.logging import logger
 
+from kano_feedback.prompt_cache import PromptCache
+from kano_feedback.response_store import ResponseStore
+
+
+# Question IDs being migrated to the Dashboard will go in this list
+# Disabling "How would you rate Kano from 0 to 10" and "What did you like..."
+DISABLED_QIDS = frozenset([
+    "5787ac06e98ae8816fb86b15",
+    "578cbf79b1eafe4c58c76932"
+])
+
 
 class WidgetPrompts:
     '''
@@ -30,18 +41,74 @@ class WidgetPrompts:
         # The default prompt is used in the unlikely event
         # there are no more questions to be answered
         self.cache_file = os.path.join(os.path.expanduser('~'),
-                                       '.feedback-widget-sent.csv')
+                                       '.feedback-widget-responses.log')
+        # Where older versions kept the responses, migrated on first use
+        self.legacy_cache_file = os.path.join(os.path.expanduser('~'),
+                                              '.feedback-widget-sent.csv')
 
         self.prompts = None
         self.current_prompt = None
         self.current_prompt_idx = -1
 
+        # The questions as of the last sync, shown until the next one
+        self.prompt_cache = PromptCache(
+            os.path.join(os.path.expanduser('~'),
+                         '.feedback-widget-questions.json')
+        )
+
+        # The responses, loaded the first time they are needed
+        self._cache = None
+        self._cache_lock = threading.Lock()
+
     def load_prompts(self):
         '''
-        Try to get the questions from Kano Network
+        Try to get the questions from Kano Network, showing the ones
+        saved by the last sync in the meantime. This blocks on the network,
+        the widget calls the steps below from a worker thread instead
         '''
-        if self._load_remote_prompts():
-            self.current_prompt = self._get_next_prompt()
+        if self.prompts is None:
+            cached = self.load_cached_prompts()
+            if cached:
+                self.set_prompts(cached)
+
+        _, prompts = self.fetch_prompts()
+        if prompts is not None:
+            self.set_prompts(prompts)
+
+    def load_cached_prompts(self):
+        '''
+        Get the prompts saved by the last sync, and the responses, from disk.
+        Returns the prompts, None if there are none saved
+        '''
+        self._cache_load().load()
+        return self.prompt_cache.load() or None
+
+    def fetch_prompts(self, num_retries=10):
+        '''
+        Get the prompts from Kano Network.
+        Returns whether they could be fetched, and the new prompts, None if
+        they did not change
+        '''
+        changed = self._load_remote_prompts(num_retries)
+        if changed is None:
+            return False, None
+
+        return True, self.prompt_cache.questions if changed else None
+
+    def set_prompts(self, prompts):
+        '''
+        Switch to a new list of prompts, staying on the current one if it is
+        still there. This only works in memory, once the responses are loaded
+        '''
+        current_id = self.get_current_prompt_id()
+        self.prompts = prompts
+        self.current_prompt_idx = -1
+        for idx, prompt in enumerate(prompts):
+            if prompt['id'] == current_id:
+                self.current_prompt_idx = idx - 1
+                break
+
+        self.current_prompt = self._get_next_prompt()
 
     def get_current_prompt(self):
         '''
@@ -144,10 +211,22 @@ class WidgetPrompts:
         '''
         return self._cache_get_all(offline=True)
 
+    def save_responses(self):
+        '''
+        Makes sure the responses marked so far are on disk. They are synced
+        in batches otherwise, so that marking a response stays cheap
+        '''
+        return self._cache_load().sync()
+
     def _load_remote_prompts(self, num_retries=10):
         '''
         Get the prompts/questions through a request,
         retrying <num_retries> if network is not up.
+        Only the questions created since the last sync are requested, except
+        for a full sync once a day.
+
+        Returns True when the questions changed, None if they could not be
+        fetched.
         '''
         for attempt in xrange(0, num_retries):
             if attempt != 0:
@@ -158,41 +237,29 @@ class WidgetPrompts:
 
             try:
                 # Contact Kano questions API
-                success, error, res = request_wrapper('get', '/questions')
+                since = self.prompt_cache.since()
+                success, error, res = request_wrapper(
+                    'get', self.prompt_cache.endpoint(since)
+                )
 
                 if not success:
                     logger.warn('Error loading prompts from API (try {}): {}'
                                 .format(attempt, error))
                     continue
 
-                prompts = sorted(res['questions'],
-                                 key=lambda k: k['date_created'])
-
-                if not len(prompts):
-                    return False
-
-                self.prompts = prompts
-
-                return True
+                return self.prompt_cache.update(res['questions'], since)
 
             except Exception as exception:
                 logger.error('Error loading prompts (try {}): {}'
                              .format(attempt, exception))
 
-        return False
+        return None
 
     def _get_next_prompt(self):
         '''
         Jump to the next available question that has not been answered yet
         '''
 
-        # Question IDs being migrated to the Dashboard will go in this list
-        # Disabling "How would you rate Kano from 0 to 10" and "What did you like..."
-        disabled_qids = [
-            "5787ac06e98ae8816fb86b15",
-            "578cbf79b1eafe4c58c76932"
-        ]
-
         next_prompt = None
         iterations = 0
         try:
@@ -207,8 +274,9 @@ class WidgetPrompts:
 
                 # prompt has not been answered yet, take it,
                 # unless it is in the "disabled" list.
-                if not self._cache_is_prompt_responded(next_prompt) and \
-                   next_prompt_id not in disabled_qids:
+                if not self._cache_is_prompt_responded(next_prompt,
+                                                       next_prompt_id) and \
+                   next_prompt_id not in DISABLED_QIDS:
 
                     return next_prompt
 
@@ -228,81 +296,36 @@ class WidgetPrompts:
         to be sent at a later stage.
         '''
 
-        found = False
         if not offline:
-            # answers that have been sent are marked without answer or question ID
+            # answers that have been sent are marked without the answer
             answer = 'yes'
-            qid = None
-
-        # Replace the cached response if it's offline
-        cached = self._cache_get_all()
-        for row in cached:
-            if row[0] == prompt:
-                row[1] = answer
-                row[2] = qid
-                found = True
 
-        if not found:
-            # Or add it if it's not saved
-            cached.append([prompt, answer, qid])
+        # Replaces the cached response if it's offline, or adds it
+        if not self._cache_load().put(prompt, answer, qid):
+            logger.debug("Could not save the response to {}"
+                         .format(self.cache_file))
 
-        cached = self._cache_save_all(cached)
-
-    def _cache_is_prompt_responded(self, prompt):
+    def _cache_is_prompt_responded(self, prompt, qid=None):
         '''
-        Find out if a question has been responded
+        Find out if a question has been responded, by its text or its ID
         '''
-        cached = self._cache_get_all()
-        for row in cached:
-            if row[0] == prompt:
-                return True
-
-        return False
+        return self._cache_load().is_responded(prompt, qid)
 
-    def _cache_get_all(self, offline=False):
+    def _cache_load(self):
         '''
-        Loads the complete cache of prompts and answers, answered and postponed
+        Opens the store of responses the first time it is needed
         '''
-        cached_prompts = []
-        try:
-            with open(self.cache_file) as csvfile:
-                reader = csv.reader(csvfile, quoting=csv.QUOTE_NONNUMERIC)
-                for row in reader:
-                    if row[0]:
-                        row[0] = row[0].decode('utf-8')
-                    if row[1]:
-                        row[1] = row[1].decode('utf-8')
-                    if row[2]:
-                        row[2] = row[2].decode('utf-8')
-
-                    if offline:
-                        if row[1] != 'yes':
-                            # this is an offline answer
-                            cached_prompts.append([row[0], row[1], row[2]])
-                    else:
-                        cached_prompts.append([row[0], row[1], row[2]])
-        except Exception as e:
-            logger.debug("Exception in _cache_get_all: {}".format(str(e)))
+        with self._cache_lock:
+            if self._cache is None:
+                self._cache = ResponseStore(
+                    self.cache_file, legacy_path=self.legacy_cache_file
+                )
 
-        return cached_prompts
+        return self._cache
 
-    def _cache_save_all(self, rows):
+    def _cache_get_all(self, offline=False):
         '''
-        Saves the cache back to disk.
+        Returns the complete cache of prompts and answers, answered and
+        postponed, or only the offline answers
         '''
-        try:
-            with open(self.cache_file, 'w') as csvfile:
-                writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
-                for row in rows:
-                    if row[0]:
-                        row[0] = row[0].encode('utf-8')
-                    if row[1]:
-                        row[1] = row[1].encode('utf-8')
-                    if row[2]:
-                        row[2] = row[2].encode('utf-8')
-                    writer.writerow([row[0], row[1], row[2]])
-        except Exception as e:
-            logger.debug("Exception in _cache_save_all: {}".format(str(e)))
-            return False
-
-        return True
+        return self._cache_load().rows(offline=offline)
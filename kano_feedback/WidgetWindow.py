@@ -8,8 +8,11 @@
 # The MainWindow for the Desktop Feedback Widget
 
 
+import threading
 from gi.repository import Gtk, Gdk, GObject
 
+GObject.threads_init()
+
 from kano.gtk3.application_window import ApplicationWindow
 from kano.gtk3.scrolled_window import ScrolledWindow
 from kano.gtk3.buttons import OrangeButton
@@ -18,6 +21,7 @@ from kano.gtk3.apply_styles import apply_styling_to_screen, \
 from kano_profile.tracker import track_action
 from kano_feedback.DataSender import send_question_response
 from kano_feedback.WidgetQuestions import WidgetPrompts
+from kano_feedback.refresh_scheduler import RefreshScheduler, LinkMonitor
 from kano_feedback.Media import media_dir
 from kano_feedback.SliderInput import SliderInput
 from kano_feedback.RadioInput import RadioInput
@@ -41,51 +45,133 @@ class WidgetWindow(ApplicationWindow):
                                    self.HEIGHT_COMPACT)
 
         self.wprompts = WidgetPrompts()
-        self.wprompts.load_prompts()
+        self._loading_prompts = False
+        self._fetch_timer = None
+        self._shown_prompt = None
+        self._scheduler = RefreshScheduler()
+        # Without the link events, refreshes only happen on schedule
+        self._link_monitor = LinkMonitor(
+            lambda: GObject.idle_add(self._link_up)
+        )
+        self._link_monitor.start()
 
         self._initialise_window()
 
-        if not self.wprompts.get_current_prompt():
-            self.hide_until_more_questions()
-            return
-
-        self.position_widget()
+        # Nothing is shown until the prompts are loaded in the background
+        self.hide()
         # Catch the window state event to avoid minimising and losing
         # the window
         self.connect("window-state-event", self._unminimise_if_minimised)
 
+        self._load_prompts_async()
+
     def hide_until_more_questions(self):
         '''
         Hide the widget and set a timer to get new questions
         '''
-        delay = 15 * 60 * 1000
         self.hide()
-        GObject.timeout_add(delay, self.timer_fetch_questions)
+        self._shown_prompt = None
+        self._cancel_fetch_timer()
+
+        delay = int(self._scheduler.next_delay() * 1000)
+        self._fetch_timer = GObject.timeout_add(delay,
+                                                self.timer_fetch_questions)
 
         return
 
+    def _cancel_fetch_timer(self):
+        if self._fetch_timer is not None:
+            GObject.source_remove(self._fetch_timer)
+            self._fetch_timer = None
+
     def timer_fetch_questions(self):
         '''
-        This function will periodically call the Questions API
-        Until we get questions for the user, then show the widget again
+        This function will call the Questions API when scheduled,
+        until we get questions for the user, then show the widget again
+        '''
+        self._fetch_timer = None
+        self._load_prompts_async()
+
+        # The next call is scheduled once this one is done
+        return False
+
+    def _link_up(self):
+        '''
+        The network came up, refresh straight away if the widget is waiting
+        for questions and the last try was offline
+        '''
+        if self._shown_prompt is None and self._scheduler.link_up():
+            self._cancel_fetch_timer()
+            self._load_prompts_async()
+
+        return False
+
+    def _load_prompts_async(self):
+        '''
+        Load the prompts on a worker thread, first the ones saved on disk,
+        then from the Questions API, so that the window never waits on them.
+        They are handed back to the GTK main loop as they come
         '''
-        self.wprompts.load_prompts()
+        if self._loading_prompts:
+            return
+
+        self._loading_prompts = True
+        load_cached = self.wprompts.prompts is None
+
+        def load():
+            online, prompts = False, None
+            try:
+                if load_cached:
+                    cached = self.wprompts.load_cached_prompts()
+                    if cached:
+                        GObject.idle_add(self._prompts_loaded, cached, False)
+
+                # Retries are left to the scheduler
+                online, prompts = self.wprompts.fetch_prompts(num_retries=1)
+            except Exception as exception:
+                logger.error('Error loading prompts: {}'.format(exception))
+            finally:
+                GObject.idle_add(self._prompts_loaded, prompts, True, online)
+
+        thread = threading.Thread(target=load)
+        thread.daemon = True
+        thread.start()
+
+    def _prompts_loaded(self, prompts, done, online=True):
+        '''
+        Show the prompts loaded by the worker thread, from the main loop
+        '''
+        if done:
+            self._loading_prompts = False
+            self._scheduler.record(online, changed=prompts is not None)
+
+        if prompts is not None:
+            self.wprompts.set_prompts(prompts)
+
         nextp = self.wprompts.get_current_prompt()
         if nextp:
-            self.set_keep_below(True)
-            self.show()
-            self.position_widget()
-            self._shrink()
+            if nextp != self._shown_prompt:
+                self._show_prompt(nextp)
+        elif done:
+            self.hide_until_more_questions()
 
-            self._prompt.set_text(nextp)
+        # Only run once
+        return False
 
-            # Only change the textbuffer if type is correct
-            if self.wprompts.get_current_prompt_type() == "text":
-                self._input_widget.get_buffer().set_text('')
+    def _show_prompt(self, prompt):
+        '''
+        Show the widget again with a new prompt
+        '''
+        self._cancel_fetch_timer()
 
-            return False
-        else:
-            return True
+        self._pack_input_widget()
+        self._prompt.set_text(prompt)
+        self._shown_prompt = prompt
+
+        self.set_keep_below(True)
+        self.show()
+        self.position_widget()
+        self._shrink()
 
     def position_widget(self):
         '''
@@ -383,11 +469,15 @@ class WidgetWindow(ApplicationWindow):
             # Save the answer as offline to send it later
             self.wprompts.mark_prompt(prompt, answer, qid, offline=True, rotate=True)
 
+        # The responses marked above go to disk together
+        self.wprompts.save_responses()
+
         # Get next available question on the queue
         nextp = self.wprompts.get_current_prompt()
         if nextp:
             self._pack_input_widget()
             self._prompt.set_text(nextp)
+            self._shown_prompt = nextp
             # This isn't needed anymore because the replace the text widget by default
 
             # Disable send button
@@ -0,0 +1,164 @@
+# app_logs.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Exports the Kano app logs for a report in a single streaming pass.
+#
+# Each entry is read once and written both as a raw line and as compact
+# JSON, straight to files, so the memory used does not grow with the logs.
+
+
+import json
+import os
+import time
+
+from kano_feedback.time_window import json_log_time
+
+
+def app_log_dirs():
+    """Get where :mod:`kano.logging` writes the app logs, system wide and
+    for the user."""
+    from kano.logging import SYSTEM_LOGS_DIR, USER_LOGS_DIR
+
+    return [
+        os.path.expanduser(SYSTEM_LOGS_DIR),
+        os.path.expanduser(USER_LOGS_DIR),
+    ]
+
+
+class TimestampFormatter(object):
+    """Formats UNIX timestamps as ``datetime.isoformat`` does, in local
+    time.
+
+    Consecutive entries are mostly logged within the same second, so the
+    formatted second is kept and only the microseconds are formatted again.
+    """
+
+    def __init__(self):
+        self._second = None
+        self._formatted = None
+
+    def format(self, timestamp):
+        second = int(timestamp)
+        # rounded as datetime.fromtimestamp does
+        micro = int(round((timestamp - second) * 1000000))
+        if micro >= 1000000:
+            second += 1
+            micro -= 1000000
+
+        if second != self._second:
+            self._second = second
+            self._formatted = time.strftime('%Y-%m-%dT%H:%M:%S',
+                                            time.localtime(second))
+
+        if not micro:
+            return self._formatted
+
+        return '{}.{:06d}'.format(self._formatted, micro)
+
+
+def list_app_logs(log_dirs=None):
+    """Get the app log files, in the order they are exported.
+
+    Args:
+        log_dirs (list): Directories holding the logs, defaults to
+            :func:`app_log_dirs`
+    """
+    if log_dirs is None:
+        log_dirs = app_log_dirs()
+
+    log_files = []
+    for log_dir in log_dirs:
+        if not os.path.isdir(log_dir):
+            continue
+
+        for log_name in sorted(os.listdir(log_dir)):
+            log_file = os.path.join(log_dir, log_name)
+            if os.path.isfile(log_file):
+                log_files.append(log_file)
+
+    return log_files
+
+
+def _iter_entries(log_f, start, end):
+    log_f.seek(start)
+    left = end - start
+    while left > 0:
+        line = log_f.readline(left)
+        if not line:
+            break
+        left -= len(line)
+
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict):
+            yield entry
+
+
+def export_app_logs(raw_f, json_f, log_dirs=None, log_state=None,
+                    time_window=None):
+    """Write the app logs as raw lines and as newline delimited JSON.
+
+    The raw output has a ``LOGFILE: <path>`` line per log followed by its
+    entries, e.g.
+    ``2014-09-30T10:18:54.532015 kano-updater info: Return value: 0``. The
+    JSON output has one compact object per entry, with the path of its log
+    in ``log_file``.
+
+    Args:
+        raw_f (file): Where the raw lines are written
+        json_f (file): Where the JSON entries are written
+        log_dirs (list): Directories holding the logs, defaults to
+            :func:`app_log_dirs`
+        log_state (LogState): Only the entries logged since the last report
+            are exported when it is incremental, and the time of the last
+            entry of each log is recorded, see
+            :class:`kano_feedback.log_state.LogState`
+        time_window (TimeWindow): Only the entries within it are exported,
+            found by bisecting the logs, see
+            :class:`kano_feedback.time_window.TimeWindow`
+
+    Returns:
+        int: The number of entries exported
+    """
+    formatter = TimestampFormatter()
+    exported = 0
+
+    for log_file in list_app_logs(log_dirs):
+        app_name = os.path.basename(log_file).split('.')[0]
+        since = log_state.app_log_since(log_file) if log_state else None
+        last_time = None
+
+        raw_f.write('LOGFILE: {}\n'.format(log_file))
+        with open(log_file, 'r') as log_f:
+            log_f.seek(0, 2)
+            start, end = 0, log_f.tell()
+            if time_window:
+                start, end = time_window.span(log_f, json_log_time, start, end)
+
+            for entry in _iter_entries(log_f, start, end):
+                stamp = entry.get('time')
+                if since is not None and stamp is not None and \
+                        stamp <= since:
+                    continue
+
+                raw_f.write(u'{} {} {}: {}\n'.format(
+                    formatter.format(stamp) if stamp is not None else '',
+                    app_name, entry.get('level', ''),
+                    entry.get('message', '')
+                ).encode('utf-8'))
+                entry['log_file'] = log_file
+                json_f.write(json.dumps(entry, separators=(',', ':')))
+                json_f.write('\n')
+
+                exported += 1
+                if stamp is not None:
+                    last_time = max(last_time, stamp)
+
+        if log_state and last_time is not None:
+            log_state.app_log_read(log_file, last_time)
+
+    return exported
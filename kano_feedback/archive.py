@@ -0,0 +1,387 @@
+# archive.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Builds the report archive straight from the collected data.
+
+
+import bz2
+import functools
+import io
+import os
+import tarfile
+import time
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from kano_feedback.task_pool import default_pool_size, run_tasks
+from kano_feedback.streaming import TeeFile
+
+
+class Compression(object):
+    """Compression methods for the report archive. See ``source`` for the
+    values."""
+
+    NONE = 'none'
+    GZIP = 'gzip'
+    PGZIP = 'pgzip'  # gzip compressed in parallel, one member per block
+    BZ2 = 'bz2'
+    XZ = 'xz'  # needs the lzma module
+
+
+DEFAULT_COMPRESSION = Compression.GZIP
+
+# (lowest, highest, default) level of each compression method
+COMPRESSION_LEVELS = {
+    Compression.NONE: (0, 0, 0),
+    Compression.GZIP: (1, 9, 6),
+    Compression.PGZIP: (1, 9, 6),
+    Compression.BZ2: (1, 9, 9),
+    Compression.XZ: (0, 9, 6),
+}
+
+# File name extension of the archive for each compression method
+ARCHIVE_EXTENSIONS = {
+    Compression.NONE: '.tar',
+    Compression.GZIP: '.tar.gz',
+    Compression.PGZIP: '.tar.gz',
+    Compression.BZ2: '.tar.bz2',
+    Compression.XZ: '.tar.xz',
+}
+
+# Size of the blocks compressed independently by Compression.PGZIP
+PGZIP_BLOCK_SIZE = 1024 * 1024
+
+
+def available_compressions():
+    """Get the compression methods which can be used on this system.
+
+    Returns:
+        list: The :class:`Compression` values, sorted by name
+    """
+    methods = set(COMPRESSION_LEVELS)
+    if lzma is None:
+        methods.discard(Compression.XZ)
+
+    return sorted(methods)
+
+
+def archive_extension(compression):
+    """Get the file name extension of an archive compressed with
+    ``compression``, e.g. ``.tar.xz``."""
+    return ARCHIVE_EXTENSIONS[compression]
+
+
+_ZLIB_COMPRESS_TYPE = type(zlib.compressobj())
+
+
+def _gzip_block(block, level):
+    # wbits of 16 + MAX_WBITS produce a complete gzip member
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush()
+
+
+class _CompressedWriter(object):
+    """File-like object compressing what is written to it into ``raw``."""
+
+    def __init__(self, raw, compressor=None):
+        self.raw = raw
+        self.raw_bytes = 0
+        self.seconds = 0.0
+        self._compressor = compressor
+
+    def write(self, data):
+        self.raw_bytes += len(data)
+        start = time.time()
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self.seconds += time.time() - start
+
+        if data:
+            self.raw.write(data)
+
+    def flush(self):
+        # Only zlib can push out what it has so far and carry on
+        if isinstance(self._compressor, _ZLIB_COMPRESS_TYPE):
+            start = time.time()
+            self.raw.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.seconds += time.time() - start
+
+    def close(self):
+        if self._compressor is not None:
+            start = time.time()
+            self.raw.write(self._compressor.flush())
+            self.seconds += time.time() - start
+            self._compressor = None
+
+
+class _ParallelGzipWriter(_CompressedWriter):
+    """Splits the data into blocks and gzips them on all the cores.
+
+    Each block becomes a gzip member of its own, and members are written in
+    order. Concatenated gzip members are a valid gzip file so the result can
+    be read by any gzip decoder. zlib releases the GIL while it compresses.
+    """
+
+    def __init__(self, raw, level, workers=None, block_size=None):
+        super(_ParallelGzipWriter, self).__init__(raw)
+        self.level = level
+        self.workers = workers or default_pool_size()
+        self.block_size = block_size or PGZIP_BLOCK_SIZE
+        self._pending = []
+        self._pending_size = 0
+
+    def write(self, data):
+        self.raw_bytes += len(data)
+        self._pending.append(data)
+        self._pending_size += len(data)
+
+        # Wait until there is a block for each worker
+        if self._pending_size >= self.block_size * self.workers:
+            self._compress_pending(final=False)
+
+    def _compress_pending(self, final):
+        start = time.time()
+        data = ''.join(self._pending)
+        split = len(data) if final else \
+            len(data) - len(data) % self.block_size
+
+        jobs = [
+            (str(offset), functools.partial(
+                _gzip_block, data[offset:offset + self.block_size], self.level
+            ))
+            for offset in xrange(0, split, self.block_size)
+        ]
+        for result in run_tasks(jobs, max_workers=self.workers):
+            if result.failed:
+                raise IOError(result.error)
+            self.raw.write(result.contents)
+
+        self._pending = [data[split:]]
+        self._pending_size = len(data) - split
+        self.seconds += time.time() - start
+
+    def flush(self):
+        if self._pending_size:
+            self._compress_pending(final=True)
+
+    def close(self):
+        self.flush()
+
+
+def _open_writer(raw, compression, level, workers):
+    if compression not in COMPRESSION_LEVELS:
+        raise ValueError('Unknown compression: {}'.format(compression))
+
+    lowest, highest, default = COMPRESSION_LEVELS[compression]
+    if level is None:
+        level = default
+    if not lowest <= level <= highest:
+        raise ValueError('Compression level for {} must be {}-{}'
+                         .format(compression, lowest, highest))
+
+    if compression == Compression.GZIP:
+        return _CompressedWriter(raw, zlib.compressobj(
+            level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        ))
+    elif compression == Compression.PGZIP:
+        return _ParallelGzipWriter(raw, level, workers=workers)
+    elif compression == Compression.BZ2:
+        return _CompressedWriter(raw, bz2.BZ2Compressor(level))
+    elif compression == Compression.XZ:
+        if lzma is None:
+            raise ValueError('xz compression needs the lzma module')
+        return _CompressedWriter(raw, lzma.LZMACompressor(preset=level))
+
+    return _CompressedWriter(raw)
+
+
+class _FixedSizeReader(object):
+    """Reads exactly ``size`` bytes of a file which may change while it is
+    copied. The end of a file which grew is left out and a file which shrank
+    is padded with NUL bytes, so the member always matches its header."""
+
+    def __init__(self, fileobj, size):
+        self._fileobj = fileobj
+        self._left = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._fileobj.read(size)
+        self._left -= size
+
+        return data + '\0' * (size - len(data))
+
+
+class ArchiveBuilder(object):
+    """Writes the report archive without staging the members on disk.
+
+    Collected contents are added from memory and existing files are streamed
+    from their location, so every byte is written to the SD card only once.
+    The tar stream is compressed on the fly. Use it as a context manager or
+    call :meth:`close` when done.
+
+    Args:
+        path (str): Where to write the archive
+        mtime (float): Modification time given to the members added from
+            memory. Defaults to now
+        compression (str): One of the :class:`Compression` values
+        level (int): Compression level, see :const:`COMPRESSION_LEVELS`.
+            Defaults to the default level of the compression method
+        workers (int): Number of cores used by :const:`Compression.PGZIP`
+        tee (file): Also receives the compressed archive as it is written,
+            e.g. a :class:`kano_feedback.streaming.StreamPipe`
+
+    Attributes:
+        members (list): Names of the members added so far
+        stats (dict): Set when the archive is closed. Holds the
+            ``compression``, ``level``, ``raw_bytes``, ``compressed_bytes``,
+            ``ratio`` and ``seconds`` spent compressing
+    """
+
+    def __init__(self, path, mtime=None, compression=DEFAULT_COMPRESSION,
+                 level=None, workers=None, tee=None):
+        self.path = path
+        self.mtime = mtime if mtime is not None else time.time()
+        self.members = []
+        self.stats = None
+
+        self.compression = compression
+        self.level = level if level is not None \
+            else COMPRESSION_LEVELS.get(compression, (0, 0, 0))[2]
+
+        self._fileobj = open(path, 'w+b')
+        raw = TeeFile(self._fileobj, tee) if tee is not None \
+            else self._fileobj
+        try:
+            self._writer = _open_writer(raw, compression, level, workers)
+        except ValueError:
+            self._fileobj.close()
+            raise
+        self._tar = tarfile.open(mode='w|', fileobj=self._writer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is not None:
+            self._fileobj.close()
+
+    def _new_info(self, name, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = self.mtime
+        info.mode = 0o644
+        return info
+
+    def add_contents(self, name, contents):
+        """Add a member from data held in memory.
+
+        Args:
+            name (str): Name of the member in the archive
+            contents (str): Data of the member, unicode is encoded as UTF-8
+        """
+        if isinstance(contents, unicode):
+            contents = contents.encode('utf-8')
+
+        self.add_stream(name, io.BytesIO(contents), len(contents))
+
+    def add_stream(self, name, fileobj, size):
+        """Add a member from a file-like object.
+
+        Args:
+            name (str): Name of the member in the archive
+            fileobj (file): Object to read exactly ``size`` bytes from
+            size (int): Number of bytes of the member
+        """
+        self._tar.addfile(self._new_info(name, size), fileobj)
+        self.members.append(name)
+
+    def add_file(self, name, path):
+        """Add a member by streaming an existing file into the archive.
+
+        The member has the size of the file when it was opened, see
+        :class:`_FixedSizeReader` for files changing meanwhile.
+
+        Args:
+            name (str): Name of the member in the archive
+            path (str): Path of the file to copy
+
+        Returns:
+            bool: Whether the file could be added
+        """
+        try:
+            with open(path, 'rb') as src:
+                info = self._tar.gettarinfo(arcname=name, fileobj=src)
+                self._tar.addfile(info, _FixedSizeReader(src, info.size))
+        except (IOError, OSError):
+            return False
+
+        self.members.append(name)
+        return True
+
+    def flush(self):
+        """Push what has been added so far through the compressor.
+
+        Used when the archive is streamed so members are sent as soon as
+        they are added. Only gzip based compressions can do this, with a
+        small cost in ratio.
+        """
+        # the tar stream holds back up to a record, its padding is only
+        # written on close so what it has can go out now
+        stream = self._tar.fileobj
+        if stream.buf:
+            stream.fileobj.write(stream.buf)
+            stream.buf = b''
+
+        self._writer.flush()
+
+    def close(self):
+        """Finish writing the archive.
+
+        Returns:
+            file: The archive, opened for reading from the start
+        """
+        if not self._tar.closed:
+            self._tar.close()
+            self._writer.close()
+            self._fileobj.flush()
+
+            compressed_bytes = self._fileobj.tell()
+            raw_bytes = self._writer.raw_bytes
+            self.stats = {
+                'compression': self.compression,
+                'level': self.level,
+                'raw_bytes': raw_bytes,
+                'compressed_bytes': compressed_bytes,
+                'ratio': float(compressed_bytes) / raw_bytes
+                if raw_bytes else 1.0,
+                'seconds': self._writer.seconds,
+            }
+
+        self._fileobj.seek(0)
+        return self._fileobj
+
+
+def ram_tmp_dir():
+    """Get a directory to use for short lived temporary files.
+
+    Returns:
+        str: A RAM backed directory if there is one, so the SD card is not
+        written to, otherwise ``None`` to use the system default
+    """
+    shm_dir = '/dev/shm'
+    if os.path.isdir(shm_dir) and os.access(shm_dir, os.W_OK):
+        return shm_dir
+
+    return None
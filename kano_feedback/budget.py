@@ -0,0 +1,147 @@
+# budget.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Fits the members of a report in a total byte budget, the most valuable
+# first.
+#
+# The budget is for the uncompressed tar archive: every member takes a
+# header on top of its data, padded to whole blocks, and the archive ends
+# with two empty blocks padded to a whole record.
+
+
+import os
+import tarfile
+
+from kano_feedback.tail import TRUNCATION_MARKER, tail_contents, tail_file
+
+
+# Truncating a member further than this leaves nothing worth sending
+MIN_TRUNCATED_BYTES = 4 * 1024
+
+# Room for the marker of a truncated member
+MARKER_BYTES = len(TRUNCATION_MARKER.format(10 ** 12))
+
+KEPT = 'kept'
+TRUNCATED = 'truncated'
+DROPPED = 'dropped'
+
+
+def member_size(member):
+    """Get the size of a member, given as its ``contents`` or as the
+    ``path`` of a file."""
+    if member.get('path'):
+        try:
+            return os.path.getsize(member['path'])
+        except OSError:
+            return 0
+
+    contents = member.get('contents') or ''
+    # the archive holds unicode as UTF-8
+    if isinstance(contents, unicode):
+        contents = contents.encode('utf-8')
+
+    return len(contents)
+
+
+def _blocks(size):
+    return (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * \
+        tarfile.BLOCKSIZE
+
+
+def tar_header_size(name):
+    """Get the size of the headers of a member in a tar archive, with the
+    extra GNU header of names too long for the regular one."""
+    if len(name) <= tarfile.LENGTH_NAME:
+        return tarfile.BLOCKSIZE
+
+    return 2 * tarfile.BLOCKSIZE + _blocks(len(name) + 1)
+
+
+def tar_size(name, size):
+    """Get how many bytes a member of ``size`` bytes takes in a tar
+    archive, headers and padding included."""
+    return tar_header_size(name) + _blocks(size)
+
+
+def tar_budget(max_bytes):
+    """Get how many bytes the members of a tar archive may take, headers
+    included, for the whole archive to fit in ``max_bytes``."""
+    records = max_bytes // tarfile.RECORDSIZE * tarfile.RECORDSIZE
+    return max(0, records - 2 * tarfile.BLOCKSIZE)
+
+
+def _truncate(member, max_bytes):
+    if member.get('path'):
+        contents = tail_file(member['path'], max_bytes=max_bytes)
+    else:
+        contents = tail_contents(member['contents'], max_bytes)
+
+    return dict(member, path=None, contents=contents)
+
+
+def plan_budget(members, max_bytes):
+    """Decide which members of a report fit in ``max_bytes``.
+
+    Members are considered by ``priority``, the lowest value first, then in
+    their original order. A member which does not fit what is left of the
+    budget has its beginning cut off when it is ``truncatable`` and enough
+    room is left, see :const:`MIN_TRUNCATED_BYTES`, or is dropped otherwise.
+    The end of a truncated file given by ``path`` is read into ``contents``.
+
+    Members are counted as they take room in a tar archive, see
+    :func:`tar_size`, and :func:`tar_budget` gives the budget of an archive
+    of ``max_bytes``.
+
+    Args:
+        members (list): The ``{'name', 'contents' or 'path', 'priority',
+            'truncatable'}`` members of the report
+        max_bytes (int): The budget, in bytes of tar members
+
+    Returns:
+        list, list: The members to write, in the order they were considered,
+        and a ``{'name', 'priority', 'bytes', 'included_bytes', 'action'}``
+        record of the decision taken for every member
+    """
+    order = sorted(
+        xrange(len(members)),
+        key=lambda idx: (members[idx].get('priority'), idx)
+    )
+
+    left = max_bytes
+    kept = []
+    decisions = []
+    for idx in order:
+        member = members[idx]
+        size = member_size(member)
+        if not size:
+            continue
+
+        # what the data may take of what is left, in whole blocks
+        room = max(0, left - tar_header_size(member['name']))
+        room -= room % tarfile.BLOCKSIZE
+
+        if size <= room:
+            action = KEPT
+        elif member.get('truncatable') and \
+                room - MARKER_BYTES >= MIN_TRUNCATED_BYTES:
+            action = TRUNCATED
+            member = _truncate(member, room - MARKER_BYTES)
+        else:
+            action = DROPPED
+
+        included = member_size(member) if action != DROPPED else 0
+        if action != DROPPED:
+            left -= tar_size(member['name'], included)
+        if action != DROPPED:
+            kept.append(member)
+        decisions.append({
+            'name': member['name'],
+            'priority': member.get('priority'),
+            'bytes': size,
+            'included_bytes': included,
+            'action': action,
+        })
+
+    return kept, decisions
@@ -0,0 +1,245 @@
+# chunked_upload.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Resumable upload of large report archives in checksummed chunks.
+#
+# The protocol, relative to the API root:
+#
+#     POST /feedback/uploads                     {size, sha256, chunk_size}
+#         -> {upload_id}
+#     GET  /feedback/uploads/<upload_id>
+#         -> {received: [chunk index, ...]}
+#     PUT  /feedback/uploads/<upload_id>/chunks/<index>
+#         body: chunk bytes, X-Chunk-SHA256: hex digest
+#     POST /feedback/uploads/<upload_id>/complete  form fields of the report
+
+
+import functools
+import hashlib
+import json
+import os
+import time
+
+from kano_feedback.task_pool import run_tasks
+
+
+CHUNK_SIZE = 512 * 1024
+DEFAULT_STREAMS = 3
+CHUNK_RETRIES = 3
+RETRY_DELAY = 1.0
+
+UPLOADS_ENDPOINT = '/feedback/uploads'
+CHECKSUM_HEADER = 'X-Chunk-SHA256'
+
+
+def file_sha256(path, block_size=64 * 1024):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as src:
+        for block in iter(lambda: src.read(block_size), ''):
+            checksum.update(block)
+
+    return checksum.hexdigest()
+
+
+class UploadState(object):
+    """Upload session of an archive, kept next to it so it can be resumed.
+
+    Args:
+        archive_path (str): The archive being uploaded
+    """
+
+    def __init__(self, archive_path):
+        self.path = '{}.upload'.format(archive_path)
+        self.upload_id = None
+        self.size = None
+        self.sha256 = None
+        self.chunk_size = None
+
+    def load(self):
+        """Load a previous session.
+
+        Returns:
+            bool: Whether there was a readable session saved
+        """
+        try:
+            with open(self.path, 'r') as state_f:
+                state = json.load(state_f)
+            self.upload_id = state['upload_id']
+            self.size = state['size']
+            self.sha256 = state['sha256']
+            self.chunk_size = state['chunk_size']
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+
+        return True
+
+    def save(self):
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as state_f:
+            json.dump({
+                'upload_id': self.upload_id,
+                'size': self.size,
+                'sha256': self.sha256,
+                'chunk_size': self.chunk_size,
+            }, state_f)
+        os.rename(tmp_path, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def chunk_count(self):
+        return max(1, (self.size + self.chunk_size - 1) // self.chunk_size)
+
+
+class ChunkedUploader(object):
+    """Uploads a report archive in chunks over a few parallel streams.
+
+    Each chunk carries its SHA-256 so the server can reject damaged ones.
+    Chunks are retried a few times, and when the upload still fails the
+    session is kept so the next attempt only sends the chunks the server
+    has not acknowledged.
+
+    Args:
+        request_fn (function): Makes the API calls, with the interface of
+            :func:`kano_world.connection.request_wrapper`, which is the
+            default
+        chunk_size (int): Size of the chunks for new sessions, in bytes
+        streams (int): Number of chunks sent at the same time
+        retries (int): Number of times a failed chunk is retried
+        progress (UploadProgress): Updated as chunks are acknowledged
+    """
+
+    def __init__(self, request_fn=None, chunk_size=CHUNK_SIZE,
+                 streams=DEFAULT_STREAMS, retries=CHUNK_RETRIES,
+                 progress=None):
+        if request_fn is None:
+            from kano_world.connection import request_wrapper
+            request_fn = request_wrapper
+
+        self.request_fn = request_fn
+        self.chunk_size = chunk_size
+        self.streams = streams
+        self.retries = retries
+        self.progress = progress
+
+    def _start_session(self, state, archive_path):
+        state.size = os.path.getsize(archive_path)
+        state.sha256 = file_sha256(archive_path)
+        state.chunk_size = self.chunk_size
+
+        success, error, data = self.request_fn(
+            'post', UPLOADS_ENDPOINT,
+            data=json.dumps({
+                'size': state.size,
+                'sha256': state.sha256,
+                'chunk_size': state.chunk_size,
+            }),
+            headers={'Content-Type': 'application/json'}
+        )
+        if not success:
+            return False, error
+
+        try:
+            state.upload_id = data['upload_id']
+        except (KeyError, TypeError):
+            return False, 'Malformed upload session: {}'.format(data)
+        state.save()
+
+        return True, None
+
+    def _acknowledged_chunks(self, state):
+        success, dummy, data = self.request_fn(
+            'get', '{}/{}'.format(UPLOADS_ENDPOINT, state.upload_id)
+        )
+        if not success:
+            return None
+
+        try:
+            return set(data.get('received', []))
+        except (AttributeError, TypeError):
+            return None
+
+    def _send_chunk(self, state, archive_path, idx):
+        with open(archive_path, 'rb') as src:
+            src.seek(idx * state.chunk_size)
+            chunk = src.read(state.chunk_size)
+
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            CHECKSUM_HEADER: hashlib.sha256(chunk).hexdigest(),
+        }
+        endpoint = '{}/{}/chunks/{}'.format(
+            UPLOADS_ENDPOINT, state.upload_id, idx
+        )
+
+        for attempt in xrange(self.retries + 1):
+            if attempt:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+            success, dummy, dummy = self.request_fn(
+                'put', endpoint, data=chunk, headers=headers
+            )
+            if success:
+                if self.progress is not None:
+                    self.progress.update(len(chunk))
+                return True
+
+        return False
+
+    def upload(self, archive_path, fields):
+        """Upload an archive, resuming a previous session if there is one.
+
+        Args:
+            archive_path (str): The report archive
+            fields (dict): The form fields of the report, sent once all the
+                chunks are acknowledged
+
+        Returns:
+            bool, error: Whether the report was sent or the error
+        """
+        state = UploadState(archive_path)
+        acknowledged = None
+
+        if state.load() and state.size == os.path.getsize(archive_path) and \
+                state.sha256 == file_sha256(archive_path):
+            acknowledged = self._acknowledged_chunks(state)
+
+        if acknowledged is None:
+            success, error = self._start_session(state, archive_path)
+            if not success:
+                return False, error
+            acknowledged = set()
+
+        missing = [
+            idx for idx in xrange(state.chunk_count)
+            if idx not in acknowledged
+        ]
+        jobs = [
+            (str(idx), functools.partial(self._send_chunk, state,
+                                         archive_path, idx))
+            for idx in missing
+        ]
+        results = run_tasks(jobs, max_workers=self.streams)
+        failed = [
+            result.name for result in results
+            if result.failed or not result.contents
+        ]
+        if failed:
+            return False, '{} of {} chunks could not be sent'.format(
+                len(failed), state.chunk_count
+            )
+
+        success, error, dummy = self.request_fn(
+            'post', '{}/{}/complete'.format(UPLOADS_ENDPOINT, state.upload_id),
+            data=fields
+        )
+        if success:
+            state.delete()
+        if self.progress is not None:
+            self.progress.finish()
+
+        return success, error
@@ -0,0 +1,242 @@
+# collectors.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Registry of the feedback data collectors and the profiles selecting them.
+
+
+class Cost(object):
+    """Rough expected cost of running a collector. See ``source`` for the
+    values."""
+
+    CHEAP = 1  # reads a small file or runs a trivial command
+    MODERATE = 2  # forks a few commands or reads a larger log
+    EXPENSIVE = 3  # scans the whole system, can take seconds on a Pi
+
+
+class Priority(object):
+    """How valuable the data of a collector is, when the report has to fit a
+    byte budget. See ``source`` for the values."""
+
+    HIGH = 1  # small and needed to look into any problem
+    NORMAL = 2
+    LOW = 3  # large or rarely needed, the first to go
+
+
+class Tag(object):
+    """Tags used to group the collectors. See ``source`` for the values."""
+
+    CORE = 'core'
+    SYSTEM = 'system'
+    PROCESSES = 'processes'
+    PACKAGES = 'packages'
+    LOGS = 'logs'
+    NETWORK = 'network'
+    DISPLAY = 'display'
+    HARDWARE = 'hardware'
+    STORAGE = 'storage'
+
+
+# The resources shared by the collectors of a report
+LOG_STATE = 'log_state'  # kano_feedback.log_state.LogState of the report
+PROC_SNAPSHOT = 'proc_snapshot'  # one walk of /proc, as a SharedResource
+FIRMWARE_PROBE = 'firmware_probe'  # kano_feedback.firmware.FirmwareProbe
+TIME_WINDOW = 'time_window'  # kano_feedback.time_window.TimeWindow
+JOURNAL = 'journal'  # the newest journal entries, as a SharedResource
+
+SHARED_RESOURCES = (LOG_STATE, PROC_SNAPSHOT, FIRMWARE_PROBE, TIME_WINDOW,
+                    JOURNAL)
+
+
+class Collector(object):
+    """Declaration of a single collector.
+
+    Attributes:
+        name (str): Name of the member written in the archive
+        fn (str): Name of the function doing the collection in
+            :const:`kano_feedback.DataSender.COLLECTOR_FNS`. It is looked up
+            when the collector runs so the function can be swapped out at
+            runtime
+        cost (int): One of the :class:`Cost` values
+        needs_root (bool): Whether the collector runs commands with sudo
+        tags (frozenset): The :class:`Tag` values describing the data
+        expands (bool): Whether the function returns a list of
+            ``{'name', 'contents'}`` members rather than the contents of
+            the single ``name`` member
+        shared (tuple): Names of the resources shared by the collectors of
+            a report the function takes as keyword arguments, see
+            :const:`SHARED_RESOURCES`
+        sources (tuple): Files, directories or glob patterns the output is
+            derived from. When given, the output is cached until any of them
+            changes, see :mod:`kano_feedback.result_cache`
+        priority (int): One of the :class:`Priority` values
+        truncatable (bool): Whether the output is still of use with its
+            beginning cut off to fit a byte budget, see
+            :mod:`kano_feedback.budget`
+    """
+
+    def __init__(self, name, fn, cost=Cost.CHEAP, needs_root=False, tags=(),
+                 expands=False, shared=(), sources=(),
+                 priority=Priority.NORMAL, truncatable=True):
+        self.name = name
+        self.fn = fn
+        self.cost = cost
+        self.needs_root = needs_root
+        self.tags = frozenset(tags)
+        self.expands = expands
+        self.shared = tuple(shared)
+        self.sources = tuple(sources)
+        self.priority = priority
+        self.truncatable = truncatable
+
+    def __repr__(self):
+        return 'Collector({})'.format(self.name)
+
+
+class Profile(object):
+    """A named selection of collectors.
+
+    Attributes:
+        name (str): The name used to pick the profile
+        tags (frozenset): Only collectors with one of these tags are
+            selected, ``None`` selects any tag
+        max_cost (int): Only collectors up to this :class:`Cost` are
+            selected, ``None`` selects any cost
+        privileged (bool): Whether collectors needing root are selected
+        coredumps (bool): Whether coredumps are attached to the report
+    """
+
+    def __init__(self, name, tags=None, max_cost=None, privileged=True,
+                 coredumps=False):
+        self.name = name
+        self.tags = frozenset(tags) if tags is not None else None
+        self.max_cost = max_cost
+        self.privileged = privileged
+        self.coredumps = coredumps
+
+    def includes(self, collector):
+        if self.tags is not None and not self.tags & collector.tags:
+            return False
+
+        if self.max_cost is not None and collector.cost > self.max_cost:
+            return False
+
+        if collector.needs_root and not self.privileged:
+            return False
+
+        return True
+
+    def select(self, collectors=None):
+        """Get the collectors selected by this profile.
+
+        Args:
+            collectors (list): The :class:`Collector` objects to pick from.
+                Defaults to :const:`COLLECTORS`
+
+        Returns:
+            list: The selected collectors, keeping their original order
+        """
+        if collectors is None:
+            collectors = COLLECTORS
+
+        return [
+            collector for collector in collectors
+            if self.includes(collector)
+        ]
+
+    def __repr__(self):
+        return 'Profile({})'.format(self.name)
+
+
+# The order here is the order of the members in the archive
+COLLECTORS = [
+    Collector('kanux_version.txt', 'get_version',
+              tags=[Tag.CORE, Tag.SYSTEM], priority=Priority.HIGH),
+    Collector('kanux_stamp.txt', 'get_stamp',
+              tags=[Tag.CORE, Tag.SYSTEM], priority=Priority.HIGH),
+    Collector('process.txt', 'get_processes', cost=Cost.MODERATE,
+              tags=[Tag.PROCESSES], shared=[PROC_SNAPSHOT]),
+    Collector('process-tree.txt', 'get_process_tree', cost=Cost.MODERATE,
+              tags=[Tag.PROCESSES], shared=[PROC_SNAPSHOT]),
+    Collector('packages.txt', 'get_packages', cost=Cost.EXPENSIVE,
+              tags=[Tag.PACKAGES], sources=['/var/lib/dpkg/status'],
+              priority=Priority.LOW),
+    Collector('dmesg.txt', 'get_dmesg', cost=Cost.MODERATE,
+              tags=[Tag.CORE, Tag.SYSTEM, Tag.LOGS], priority=Priority.HIGH),
+    Collector('syslog.txt', 'get_syslog', cost=Cost.MODERATE, needs_root=True,
+              tags=[Tag.SYSTEM, Tag.LOGS, Tag.NETWORK, Tag.DISPLAY],
+              shared=[JOURNAL]),
+    Collector('syslog.json', 'get_syslog_json', cost=Cost.MODERATE,
+              needs_root=True,
+              tags=[Tag.SYSTEM, Tag.LOGS, Tag.NETWORK, Tag.DISPLAY],
+              shared=[JOURNAL]),
+    Collector('cmdline.txt', 'get_cmdline',
+              tags=[Tag.CORE, Tag.SYSTEM], priority=Priority.HIGH),
+    Collector('config.txt', 'get_boot_config',
+              tags=[Tag.CORE, Tag.SYSTEM, Tag.DISPLAY],
+              priority=Priority.HIGH),
+    Collector('wifi-info.txt', 'get_wifi_info', cost=Cost.MODERATE,
+              needs_root=True, tags=[Tag.NETWORK]),
+    Collector('usbdevices.txt', 'get_usb_devices', cost=Cost.MODERATE,
+              tags=[Tag.HARDWARE, Tag.NETWORK]),
+
+    # TODO: Remove raw logs when json ones become stable
+    Collector('app-logs', 'get_app_logs', cost=Cost.MODERATE,
+              tags=[Tag.LOGS], expands=True, shared=[LOG_STATE, TIME_WINDOW]),
+    Collector('hdmi-info.txt', 'get_hdmi_info', cost=Cost.MODERATE,
+              tags=[Tag.DISPLAY], shared=[FIRMWARE_PROBE]),
+    Collector('edid.dat', 'get_edid', cost=Cost.MODERATE,
+              tags=[Tag.DISPLAY], shared=[FIRMWARE_PROBE],
+              truncatable=False),
+    Collector('screen-log.txt', 'get_screen_log', cost=Cost.MODERATE,
+              tags=[Tag.DISPLAY], shared=[FIRMWARE_PROBE]),
+    Collector('xorg-log.txt', 'get_xorg_log', cost=Cost.MODERATE,
+              tags=[Tag.DISPLAY, Tag.LOGS], shared=[LOG_STATE, TIME_WINDOW]),
+    Collector('cpu-info.txt', 'get_cpu_info',
+              tags=[Tag.CORE, Tag.HARDWARE], priority=Priority.HIGH),
+    Collector('mem-stats.txt', 'get_mem_stats', cost=Cost.MODERATE,
+              tags=[Tag.CORE, Tag.HARDWARE, Tag.PROCESSES],
+              shared=[PROC_SNAPSHOT, FIRMWARE_PROBE], priority=Priority.HIGH),
+    Collector('lsof.txt', 'get_lsof', cost=Cost.EXPENSIVE, needs_root=True,
+              tags=[Tag.PROCESSES], shared=[PROC_SNAPSHOT],
+              priority=Priority.LOW),
+    Collector('crash-summary.txt', 'get_crash_summary',
+              tags=[Tag.CORE, Tag.PROCESSES], priority=Priority.HIGH),
+    Collector('content-objects.txt', 'get_co_list', cost=Cost.MODERATE,
+              tags=[Tag.PACKAGES], priority=Priority.LOW),
+    Collector('disk-space.txt', 'get_disk_space',
+              tags=[Tag.CORE, Tag.STORAGE], priority=Priority.HIGH),
+    Collector('lsblk.txt', 'get_lsblk',
+              tags=[Tag.STORAGE]),
+    Collector('sources-list.txt', 'get_sources_list',
+              tags=[Tag.PACKAGES],
+              sources=['/etc/apt/sources.list', '/etc/apt/sources.list.d',
+                       '/etc/apt/sources.list.d/*']),
+    Collector('install-logs', 'get_install_logs', cost=Cost.MODERATE,
+              tags=[Tag.PACKAGES, Tag.LOGS], expands=True,
+              shared=[LOG_STATE, TIME_WINDOW]),
+]
+
+
+DEFAULT_PROFILE = 'full'
+
+PROFILES = dict((profile.name, profile) for profile in [
+    Profile('quick', max_cost=Cost.CHEAP, privileged=False),
+    Profile('network', tags=[Tag.CORE, Tag.NETWORK]),
+    Profile('display', tags=[Tag.CORE, Tag.DISPLAY]),
+    Profile('full', coredumps=True),
+])
+
+
+def get_profile(name=None):
+    """Get a collection profile by name.
+
+    Args:
+        name (str): One of the keys of :const:`PROFILES`. Defaults to
+            :const:`DEFAULT_PROFILE`
+
+    Returns:
+        Profile: The matching profile or ``None`` if there is no such profile
+    """
+    return PROFILES.get(name or DEFAULT_PROFILE)
@@ -0,0 +1,324 @@
+# coredumps.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# The coredumps saved by kano-feedback-coredump, which go in the reports.
+#
+# An index records every dump as it is saved, so listing, pruning and
+# summarising the crashes does not need to scan /var/tmp or open the dumps.
+
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+
+
+COREDUMP_DIR = '/var/tmp'
+COREDUMP_PREFIX = 'core-'
+COREDUMP_NAME_RE = re.compile(
+    r'^core-(.+)-(\d+)-(\d+)-(\d+)-(\d+)\.dump(?:\.gz)?$'
+)
+COREDUMP_INDEX_PATH = os.path.join(COREDUMP_DIR, 'kano-coredumps.json')
+
+# Number of dumps kept on disk, the oldest are pruned
+COREDUMP_KEEP = 10
+
+HASH_BLOCK_SIZE = 64 * 1024
+
+# Cap on the coredumps attached to a report, the newest are kept
+COREDUMP_MAX_BYTES = 20 * 1024 * 1024
+
+
+class Coredump(object):
+    """A coredump file.
+
+    Attributes:
+        name (str): The file name, also used in the report archive
+        path (str): Where the dump is
+        size (int): Size of the dump in bytes
+        mtime (float): When the dump was saved
+    """
+
+    def __init__(self, name, path, size, mtime):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+
+    def __repr__(self):
+        return 'Coredump({})'.format(self.name)
+
+
+def parse_coredump_name(name):
+    """Get what kano-feedback-coredump put in the name of a dump,
+    ``core-<procname>-<signal>-<uid>-<gid>-<time>.dump.gz``.
+
+    Returns:
+        dict: The procname, signal, uid, gid and time, ``None`` if the name
+        does not follow the scheme
+    """
+    # the process name may itself contain dashes and dots
+    match = COREDUMP_NAME_RE.match(name)
+    if not match:
+        return None
+
+    procname, signal, uid, gid, unixtime = match.groups()
+    return {
+        'procname': procname,
+        'signal': int(signal),
+        'uid': int(uid),
+        'gid': int(gid),
+        'time': int(unixtime),
+    }
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as dump_f:
+        for block in iter(lambda: dump_f.read(HASH_BLOCK_SIZE), ''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class CoredumpIndex(object):
+    """Persistent record of the coredumps and of the crashes over time.
+
+    For each dump kept on disk, the index has its name, procname, signal,
+    uid, gid, time, size and SHA1. Per process, it also counts the crashes
+    by signal, which survives the pruning of the dumps. Dumps saved before
+    the index existed are picked up from their names.
+
+    Updates are serialised with a lock file, since processes can crash at
+    the same time.
+
+    Args:
+        path (str): Where the index is kept
+        dump_dir (str): Where the dumps are saved
+    """
+
+    def __init__(self, path=COREDUMP_INDEX_PATH, dump_dir=COREDUMP_DIR):
+        self.path = path
+        self.dump_dir = dump_dir
+
+    def load(self):
+        """Read the index, rebuilt from the dump names if there is none.
+
+        Returns:
+            dict: The ``dumps`` entries, newest first, and the ``crashes``
+            counts per process
+        """
+        try:
+            with open(self.path, 'r') as index_f:
+                index = json.load(index_f)
+            if isinstance(index, dict):
+                return index
+        except (IOError, OSError, ValueError):
+            pass
+
+        return self._rebuild()
+
+    def _rebuild(self):
+        index = {'dumps': [], 'crashes': {}}
+        try:
+            names = os.listdir(self.dump_dir)
+        except OSError:
+            return index
+
+        for name in names:
+            entry = parse_coredump_name(name)
+            if entry is None:
+                continue
+
+            try:
+                entry['size'] = os.path.getsize(
+                    os.path.join(self.dump_dir, name)
+                )
+            except OSError:
+                continue
+            entry.update({'name': name, 'sha1': None})
+            index['dumps'].append(entry)
+            self._count(index, entry)
+
+        index['dumps'].sort(key=lambda entry: entry['time'], reverse=True)
+        return index
+
+    @staticmethod
+    def _count(index, entry):
+        crashes = index['crashes'].setdefault(
+            entry['procname'], {'count': 0, 'signals': {}, 'last': 0}
+        )
+        crashes['count'] += 1
+        signal = str(entry['signal'])
+        crashes['signals'][signal] = crashes['signals'].get(signal, 0) + 1
+        crashes['last'] = max(crashes['last'], entry['time'])
+
+    def _save(self, index):
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as index_f:
+            json.dump(index, index_f)
+        os.rename(tmp_path, self.path)
+
+    def _update(self, update_fn):
+        with open('{}.lock'.format(self.path), 'a') as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            index = self.load()
+            result = update_fn(index)
+            self._save(index)
+
+        return result
+
+    def add(self, path):
+        """Record a dump which was just saved.
+
+        Args:
+            path (str): The dump, named as kano-feedback-coredump does
+
+        Returns:
+            dict: The new entry, ``None`` if the name does not follow the
+            scheme
+        """
+        name = os.path.basename(path)
+        entry = parse_coredump_name(name)
+        if entry is None:
+            return None
+
+        entry.update({
+            'name': name,
+            'size': os.path.getsize(path),
+            'sha1': _file_hash(path),
+        })
+
+        def add_entry(index):
+            others = [
+                dump for dump in index['dumps'] if dump['name'] != name
+            ]
+            # a rebuilt index already counted the dump
+            if len(others) == len(index['dumps']):
+                self._count(index, entry)
+            index['dumps'] = sorted(others + [entry],
+                                    key=lambda dump: dump['time'],
+                                    reverse=True)
+
+        self._update(add_entry)
+        return entry
+
+    def prune(self, keep=COREDUMP_KEEP):
+        """Delete the oldest dumps, only keeping the ``keep`` newest.
+
+        Returns:
+            list: The names of the deleted dumps
+        """
+        def prune_entries(index):
+            pruned = index['dumps'][keep:]
+            index['dumps'] = index['dumps'][:keep]
+            for entry in pruned:
+                try:
+                    os.remove(os.path.join(self.dump_dir, entry['name']))
+                except OSError:
+                    pass
+
+            return [entry['name'] for entry in pruned]
+
+        return self._update(prune_entries)
+
+    def dumps(self):
+        """Get the entries of the dumps on disk, newest first."""
+        return self.load()['dumps']
+
+    def crashes(self):
+        """Get the crash counts, per process.
+
+        Returns:
+            dict: For each procname, the total ``count``, the count per
+            ``signals`` and the time of the ``last`` crash
+        """
+        return self.load()['crashes']
+
+
+def render_crash_summary(crashes):
+    """Render the crash counts of :meth:`CoredumpIndex.crashes`, the
+    processes which crashed most first.
+
+    Returns:
+        str: One line per process, empty if nothing crashed
+    """
+    lines = []
+    for procname, counts in sorted(
+            crashes.iteritems(),
+            key=lambda item: (-item[1]['count'], item[0])):
+        signals = ', '.join(
+            'signal {} x{}'.format(signal, count)
+            for signal, count in sorted(counts['signals'].iteritems(),
+                                        key=lambda item: int(item[0]))
+        )
+        lines.append('{} crashed {} times ({}), last at {}\n'.format(
+            procname, counts['count'], signals,
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(counts['last']))
+        ))
+
+    return ''.join(lines)
+
+
+def list_coredumps(dump_dir=COREDUMP_DIR, index=None):
+    """Find the coredumps saved on the system, from the index when given.
+
+    Returns:
+        list: The :class:`Coredump` objects, newest first
+    """
+    if index is not None:
+        dump_dir = index.dump_dir
+        names = [entry['name'] for entry in index.dumps()]
+    else:
+        try:
+            names = os.listdir(dump_dir)
+        except OSError:
+            return []
+
+    dumps = []
+    for name in names:
+        if not name.startswith(COREDUMP_PREFIX):
+            continue
+
+        path = os.path.join(dump_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        dumps.append(Coredump(name, path, stat.st_size, stat.st_mtime))
+
+    dumps.sort(key=lambda dump: (dump.mtime, dump.name), reverse=True)
+    return dumps
+
+
+def select_coredumps(dumps, max_bytes=COREDUMP_MAX_BYTES):
+    """Pick the coredumps to attach to a report within a byte budget.
+
+    The dumps are taken in order, so newest first from
+    :func:`list_coredumps`. One which does not fit what is left of the budget
+    is skipped, the following smaller ones may still fit.
+
+    Args:
+        dumps (list): The :class:`Coredump` objects to pick from
+        max_bytes (int): The budget, ``None`` for no limit
+
+    Returns:
+        tuple: The lists of the selected and of the skipped dumps
+    """
+    selected = []
+    skipped = []
+    left = max_bytes
+    for dump in dumps:
+        if left is not None and dump.size > left:
+            skipped.append(dump)
+            continue
+
+        selected.append(dump)
+        if left is not None:
+            left -= dump.size
+
+    return selected, skipped
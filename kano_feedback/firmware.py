@@ -0,0 +1,239 @@
+# firmware.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Queries the Raspberry Pi firmware and the display once per report.
+#
+# The memory and display collectors used to fork vcgencmd and tvservice
+# separately, dumping the EDID twice. The probe runs the queries in batches,
+# one shell per batch, and keeps the answers so every collector of a report
+# shares them.
+
+
+import tempfile
+import threading
+import uuid
+
+from kano_feedback.archive import ram_tmp_dir
+
+
+# The vcgencmd queries gathered in mem-stats.txt
+GENCMD_MEM = [
+    'get_mem arm',
+    'get_mem gpu',
+    'get_mem reloc',
+    'get_mem reloc_total',
+    'get_mem malloc',
+    'get_mem malloc_total',
+    'mem_reloc_stats',
+]
+
+# What vcgencmd answers to queries it does not know
+GENCMD_UNKNOWN = 'error=1 error_msg="Command not registered"\n'
+
+# The groups of display modes listed by tvservice
+MODE_GROUPS = ['CEA', 'DMT']
+
+# How tvservice marks the mode preferred by the display
+PREFERRED_MODE = '(prefer)'
+
+
+class DisplayInfo(object):
+    """What the display collectors need to know about the display.
+
+    Attributes:
+        status (str): Output of ``tvservice -s``
+        edid (str): The raw EDID bytes, empty if they could not be read
+        parsed_edid (str): Output of ``edidparser`` for the EDID
+        name (str): Output of ``tvservice -n``
+        modes (dict): Output of ``tvservice -m`` for each group of
+            :const:`MODE_GROUPS`
+    """
+
+    def __init__(self, status='', edid='', parsed_edid='', name='',
+                 modes=None):
+        self.status = status
+        self.edid = edid
+        self.parsed_edid = parsed_edid
+        self.name = name
+        self.modes = modes or {}
+
+    @property
+    def model(self):
+        """str: The name of the display, empty if it is unknown"""
+        return self.name.partition('device_name=')[2].strip()
+
+    def supported_modes(self):
+        """Get the modes the display supports.
+
+        Returns:
+            dict: The lines of ``tvservice -m`` listing a mode, by group
+        """
+        return dict(
+            (group, [
+                line.strip() for line in self.modes.get(group, '').splitlines()
+                if 'mode ' in line
+            ])
+            for group in MODE_GROUPS
+        )
+
+    def preferred_mode(self):
+        """Get the mode the display prefers, as ``tvservice -m`` lists it,
+        ``None`` if it has no preference."""
+        for group, modes in sorted(self.supported_modes().iteritems()):
+            for mode in modes:
+                if mode.startswith(PREFERRED_MODE):
+                    return '{} {}'.format(group, mode)
+
+        return None
+
+
+class ShellBackend(object):
+    """Runs the firmware tools, a whole batch of them in a single shell.
+
+    Args:
+        run_fn (function): Runs a shell command and returns its output like
+            :func:`kano.utils.run_cmd`. Defaults to that function
+    """
+
+    def __init__(self, run_fn=None):
+        if run_fn is None:
+            from kano.utils import run_cmd
+            run_fn = run_cmd
+
+        self.run_fn = run_fn
+
+    def run_batch(self, cmds):
+        """Run commands one after the other in a single shell.
+
+        Returns:
+            list: The output of each command
+        """
+        marker = 'kano-feedback-{}'.format(uuid.uuid4().hex)
+        out, _, _ = self.run_fn(
+            '; echo {}; '.format(marker).join(cmds)
+        )
+        outputs = out.split('{}\n'.format(marker))
+
+        # a command killing the shell leaves the following ones out
+        return outputs + [''] * (len(cmds) - len(outputs))
+
+    def vcgencmd(self, queries):
+        """Get the answers of the firmware to ``vcgencmd`` queries.
+
+        Returns:
+            list: The output of each query
+        """
+        return self.run_batch(
+            ['vcgencmd {}'.format(query) for query in queries]
+        )
+
+    def display(self):
+        """Get the state of the display, its EDID and its modes.
+
+        The EDID is dumped into a RAM backed temporary file, see
+        :func:`kano_feedback.archive.ram_tmp_dir`, and only parsed when the
+        dump succeeded.
+
+        Returns:
+            DisplayInfo: The state of the display
+        """
+        with tempfile.NamedTemporaryFile(dir=ram_tmp_dir(),
+                                         suffix='.dat') as edid_f:
+            outputs = self.run_batch([
+                'tvservice -s',
+                'tvservice -n',
+                'tvservice -d {0} > /dev/null && edidparser {0}'.format(
+                    edid_f.name
+                ),
+            ] + ['tvservice -m {}'.format(group) for group in MODE_GROUPS])
+            edid = edid_f.read()
+
+        status, name, parsed_edid = outputs[:3]
+        return DisplayInfo(status, edid, parsed_edid, name=name,
+                           modes=dict(zip(MODE_GROUPS, outputs[3:])))
+
+
+class FakeBackend(object):
+    """Stands in for the firmware tools away from a Pi.
+
+    Args:
+        gencmd (dict): The answer to each ``vcgencmd`` query
+        display (DisplayInfo): The state of the display
+
+    Attributes:
+        calls (list): The method called for each batch, to check the
+            batching
+    """
+
+    def __init__(self, gencmd=None, display=None):
+        self.gencmd = gencmd or {}
+        self.display_info = display or DisplayInfo()
+        self.calls = []
+
+    def vcgencmd(self, queries):
+        self.calls.append(('vcgencmd', list(queries)))
+        return [self.gencmd.get(query, GENCMD_UNKNOWN) for query in queries]
+
+    def display(self):
+        self.calls.append(('display', None))
+        return self.display_info
+
+
+class FirmwareProbe(object):
+    """Answers the firmware and display questions of a report, once each.
+
+    The answers are kept for the lifetime of the probe, a report shares one
+    probe between its collectors. It is thread safe.
+
+    Args:
+        backend: Does the querying, :class:`ShellBackend` by default or a
+            :class:`FakeBackend`
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._gencmd = {}
+        self._display = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = ShellBackend()
+        return self._backend
+
+    def vcgencmd(self, queries):
+        """Get the answers of the firmware to ``vcgencmd`` queries.
+
+        The queries which were not answered yet go in a single batch.
+
+        Args:
+            queries (list): The queries, e.g. ``'get_mem arm'``
+
+        Returns:
+            list: The output of each query, in order
+        """
+        with self._lock:
+            missing = [
+                query for query in queries if query not in self._gencmd
+            ]
+            if missing:
+                self._gencmd.update(
+                    zip(missing, self.backend.vcgencmd(missing))
+                )
+
+            return [self._gencmd[query] for query in queries]
+
+    def display(self):
+        """Get the state of the display and its EDID.
+
+        Returns:
+            DisplayInfo: The state of the display
+        """
+        with self._lock:
+            if self._display is None:
+                self._display = self.backend.display()
+
+            return self._display
@@ -0,0 +1,196 @@
+# journal.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Reads the end of the systemd journal as structured entries.
+#
+# journalctl is asked for the newest entries first and stops after the
+# number kept, so the cost follows the size of the report rather than the
+# size of the journal, which keeps growing with the uptime of the Pi.
+
+
+import json
+import pipes
+import re
+import time
+
+
+JOURNAL_MAX_ENTRIES = 1000
+
+# The fields kept in the structured output
+JOURNAL_FIELDS = (
+    '__REALTIME_TIMESTAMP',
+    '_BOOT_ID',
+    'PRIORITY',
+    '_SYSTEMD_UNIT',
+    'SYSLOG_IDENTIFIER',
+    '_COMM',
+    '_PID',
+    'MESSAGE',
+)
+
+CURSOR_TIME_RE = re.compile(r'(?:^|;)t=([0-9a-f]+)(?:;|$)')
+
+
+def entry_time(entry):
+    """Get the time of a journal entry, in microseconds."""
+    try:
+        return int(entry['__REALTIME_TIMESTAMP'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def cursor_time(cursor):
+    """Get the time of the entry a journal cursor points to, in
+    microseconds, ``None`` if the cursor does not tell."""
+    match = CURSOR_TIME_RE.search(cursor or '')
+    if not match:
+        return None
+
+    return int(match.group(1), 16)
+
+
+def entry_message(entry):
+    """Get the message of a journal entry, which journalctl gives as a list
+    of bytes when it is not printable."""
+    message = entry.get('MESSAGE', '')
+    if isinstance(message, list):
+        return '[{} blob data]'.format(len(message))
+
+    return message or ''
+
+
+class JournalReader(object):
+    """Reads the newest entries of the journal, optionally filtered.
+
+    Args:
+        run_fn (function): Runs a shell command and returns its output like
+            :func:`kano.utils.run_cmd`. Defaults to that function
+        max_entries (int): The number of entries kept, the newest ones
+        priority (str): Only keep entries up to this priority, e.g. ``err``
+            or ``3``, as ``journalctl --priority`` takes it
+        units (list): Only keep the entries of these systemd units
+        sudo (bool): Whether journalctl is run as root, to see the entries
+            of every user
+    """
+
+    def __init__(self, run_fn=None, max_entries=JOURNAL_MAX_ENTRIES,
+                 priority=None, units=(), sudo=True):
+        if run_fn is None:
+            from kano.utils import run_cmd
+            run_fn = run_cmd
+
+        self.run_fn = run_fn
+        self.max_entries = max_entries
+        self.priority = priority
+        self.units = list(units)
+        self.sudo = sudo
+
+    def command(self, cursor=None, time_window=None):
+        """Get the journalctl command reading the entries.
+
+        Args:
+            cursor (str): The cursor of the last entry already read. Only
+                the entries of the current boot are read when there is
+                neither a cursor nor a time window
+            time_window (TimeWindow): Only read the entries within it, see
+                :class:`kano_feedback.time_window.TimeWindow`
+
+        Returns:
+            str: The shell command
+        """
+        args = [
+            'journalctl', '--output=json', '--reverse',
+            '--lines={}'.format(self.max_entries),
+        ]
+        if not cursor and not time_window:
+            args.append('--boot')
+        if self.priority is not None:
+            args.append('--priority={}'.format(pipes.quote(self.priority)))
+        for unit in self.units:
+            args.append('--unit={}'.format(pipes.quote(unit)))
+        if time_window:
+            args += time_window.journalctl_args()
+        if self.sudo:
+            args.insert(0, 'sudo')
+
+        return ' '.join(args)
+
+    def read(self, cursor=None, time_window=None):
+        """Read the newest entries, after ``cursor`` when given.
+
+        Returns:
+            list: The entries, as dicts of the journal fields, oldest first
+        """
+        out, _, _ = self.run_fn(self.command(cursor, time_window))
+        since = cursor_time(cursor)
+
+        entries = []
+        for line in out.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            # newest first, so everything from the cursor on was read before
+            if cursor and entry.get('__CURSOR') == cursor:
+                break
+            stamp = entry_time(entry)
+            if since is not None and stamp is not None and stamp < since:
+                break
+
+            entries.append(entry)
+
+        entries.reverse()
+        return entries
+
+
+def newest_cursor(entries):
+    """Get the cursor of the newest entry, ``None`` if there is none."""
+    if not entries:
+        return None
+
+    return entries[-1].get('__CURSOR')
+
+
+def render_short(entries):
+    """Render entries as ``journalctl`` does by default.
+
+    Returns:
+        str: One line per entry, the continuation lines of a message
+        indented, UTF-8 encoded
+    """
+    lines = []
+    for entry in entries:
+        stamp = entry_time(entry)
+        date = time.strftime('%b %d %H:%M:%S', time.localtime(
+            stamp / 1000000.0 if stamp is not None else 0
+        ))
+        ident = entry.get('SYSLOG_IDENTIFIER') or entry.get('_COMM') or ''
+        pid = '[{}]'.format(entry['_PID']) if entry.get('_PID') else ''
+        prefix = u'{} {} {}{}: '.format(
+            date, entry.get('_HOSTNAME', 'localhost'), ident, pid
+        )
+        lines.append(prefix + entry_message(entry).replace(
+            '\n', '\n' + ' ' * len(prefix)
+        ))
+
+    return u''.join(line + u'\n' for line in lines).encode('utf-8')
+
+
+def render_json(entries):
+    """Render entries as JSON, one entry per line, keeping
+    :const:`JOURNAL_FIELDS`.
+
+    Returns:
+        str: The JSON stream
+    """
+    return ''.join(
+        json.dumps(
+            dict((field, entry[field])
+                 for field in JOURNAL_FIELDS if field in entry),
+            sort_keys=True
+        ) + '\n'
+        for entry in entries
+    )
@@ -13,8 +13,12 @@ from kano.utils.file_operations import touch
 from kano_feedback.DataSender import send_data, take_screenshot, \
     copy_archive_report, delete_tmp_dir
 from kano_feedback.utils import ensure_internet, ensure_kano_world_login
+from kano_feedback.archive import DEFAULT_COMPRESSION, COMPRESSION_LEVELS, \
+    archive_extension, available_compressions
+from kano_feedback.collectors import DEFAULT_PROFILE, PROFILES
 from kano_feedback.paths import Path
 from kano_feedback.return_codes import RC
+from kano_feedback.time_window import parse_time
 
 
 def _check_can_create_file_flag(flag_path):
@@ -39,7 +43,50 @@ def main(args):
     if args['--flag'] and not _check_can_create_file_flag(args['--flag']):
         return RC.CANNOT_CREATE_FLAG
 
-    report_file = args['--output'] or Path.DEFAULT_REPORT_PATH
+    profile = args['--profile'] or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        print 'Unknown profile {}, use one of: {}'.format(
+            profile, ', '.join(sorted(PROFILES))
+        )
+        return RC.INCORRECT_ARGS
+
+    compression = args['--compression'] or DEFAULT_COMPRESSION
+    if compression not in available_compressions():
+        print 'Unsupported compression {}, use one of: {}'.format(
+            compression, ', '.join(available_compressions())
+        )
+        return RC.INCORRECT_ARGS
+
+    report_file = args['--output'] or \
+        Path.DEFAULT_REPORT_STEM + archive_extension(compression)
+
+    compression_level = None
+    if args['--level']:
+        lowest, highest, _ = COMPRESSION_LEVELS[compression]
+        if not args['--level'].isdigit() or \
+                not lowest <= int(args['--level']) <= highest:
+            print 'Compression level for {} must be {}-{}'.format(
+                compression, lowest, highest
+            )
+            return RC.INCORRECT_ARGS
+        compression_level = int(args['--level'])
+
+    max_bytes = None
+    if args['--max-bytes']:
+        if not args['--max-bytes'].isdigit():
+            print 'The report size must be a number of bytes'
+            return RC.INCORRECT_ARGS
+        max_bytes = int(args['--max-bytes'])
+
+    window = {}
+    for option in ['--since', '--until']:
+        if not args[option]:
+            continue
+        try:
+            window[option.lstrip('-')] = parse_time(args[option])
+        except ValueError:
+            print 'Unsupported time for {}: {}'.format(option, args[option])
+            return RC.INCORRECT_ARGS
 
     if args['--with-checks'] or args['--just-checks']:
         if not ensure_internet():
@@ -61,7 +108,15 @@ def main(args):
         True,
         subject=args['--title'] or 'Kano OS: Feedback Report Logs',
         network_send=args['--send'],
-        logs_path=args['--logs']
+        logs_path=args['--logs'],
+        profile=profile,
+        compression=compression,
+        compression_level=compression_level,
+        chunked=args['--chunked'],
+        incremental=args['--incremental'],
+        max_bytes=max_bytes,
+        log_templates=args['--templates'],
+        **window
     )
     if not successful:
         print 'Error from send_data: {}'.format(error)
@@ -74,7 +129,7 @@ def main(args):
             print 'Could not create file flag {}'.format(args['--flag'])
             return RC.ERROR_CREATE_FLAG
 
-    successful = copy_archive_report(report_file)
+    successful = copy_archive_report(report_file, compression)
     delete_tmp_dir()
 
     if successful:
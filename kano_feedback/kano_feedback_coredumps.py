@@ -0,0 +1,57 @@
+# kano_feedback_coredumps.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# The main functionality of the kano-feedback-coredumps binary.
+
+
+import datetime
+
+from kano_feedback.coredumps import COREDUMP_KEEP, CoredumpIndex, \
+    render_crash_summary
+from kano_feedback.return_codes import RC
+
+
+def _list_dumps(index):
+    for entry in index.dumps():
+        print '{}  {}  signal {}  uid {}  {} bytes  {}  {}'.format(
+            datetime.datetime.fromtimestamp(entry['time']).isoformat(),
+            entry['procname'],
+            entry['signal'],
+            entry['uid'],
+            entry['size'],
+            entry['sha1'] or '-',
+            entry['name']
+        )
+
+
+def main(args):
+    """The main functionality of the kano-feedback-coredumps binary.
+
+    Returns:
+        int: Exit code as documented in :class:`.return_codes.RC`
+    """
+
+    keep = COREDUMP_KEEP
+    if args['--keep']:
+        if not args['--keep'].isdigit():
+            return RC.INCORRECT_ARGS
+        keep = int(args['--keep'])
+
+    index = CoredumpIndex()
+
+    if args['--add']:
+        if index.add(args['--add']) is None:
+            return RC.COREDUMP_NOT_INDEXED
+
+    if args['--prune']:
+        index.prune(keep)
+
+    if args['--list']:
+        _list_dumps(index)
+
+    if args['--stats']:
+        print render_crash_summary(index.crashes()),
+
+    return RC.SUCCESS
@@ -0,0 +1,52 @@
+# kano_feedback_spool.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# The main functionality of the kano-feedback-spool binary.
+
+
+import datetime
+
+from kano_feedback.DataSender import send_spooled_report
+from kano_feedback.paths import Path
+from kano_feedback.return_codes import RC
+from kano_feedback.spool import ReportSpool, SpoolDrainer
+
+
+def _list_spool(spool):
+    for entry in spool.entries():
+        print '{}  {}  {} bytes  {} attempts  {}'.format(
+            entry.entry_id,
+            datetime.datetime.fromtimestamp(entry.created).isoformat(),
+            entry.size,
+            entry.attempts,
+            entry.payload.get('subject', '')
+        )
+
+
+def main(args):
+    """The main functionality of the kano-feedback-spool binary.
+
+    Returns:
+        int: Exit code as documented in :class:`.return_codes.RC`
+    """
+
+    spool = ReportSpool(Path.REPORT_SPOOL_DIR)
+
+    if args['--list']:
+        _list_spool(spool)
+
+    if args['--drain']:
+        max_runtime = None
+        if args['--max-runtime']:
+            if not args['--max-runtime'].isdigit():
+                return RC.INCORRECT_ARGS
+            max_runtime = int(args['--max-runtime'])
+
+        drainer = SpoolDrainer(spool, send_spooled_report,
+                               max_runtime=max_runtime)
+        if not drainer.drain():
+            return RC.SPOOL_NOT_DRAINED
+
+    return RC.SUCCESS
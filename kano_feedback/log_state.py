@@ -0,0 +1,237 @@
+# log_state.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Remembers how much of each log was sent with the last successful report.
+
+
+import json
+import os
+import threading
+import uuid
+
+
+class LogState(object):
+    """Tracks what the log collectors gathered, to only send what is new.
+
+    For every log file the inode and the offset reached are kept, for the
+    Kano app logs the time of the last entry and for the journal its cursor.
+    The positions reached by the current report are only saved by
+    :meth:`commit`, once the report was sent.
+
+    In incremental mode the collectors resume from the saved positions, as
+    long as the source was not rotated or truncated in the meantime.
+    Collectors run in parallel so all the methods are thread safe.
+
+    Positions can be recorded on behalf of collectors, see
+    :meth:`for_collectors`, and forgotten if what those collectors gathered
+    does not make it whole into the report, see :meth:`forget`.
+
+    Args:
+        path (str): Where the state is kept, ``None`` to not persist it
+        incremental (bool): Whether collectors should resume from the
+            positions of the last successful report
+
+    Attributes:
+        report_id (str): Unique ID of the report being collected
+    """
+
+    def __init__(self, path=None, incremental=False):
+        self.path = path
+        self.incremental = incremental
+        self.report_id = uuid.uuid4().hex
+
+        self._saved = self._load()
+        self._pending = {'files': {}, 'app_logs': {}}
+        # the collectors which recorded each pending position
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self.path:
+            return {}
+
+        try:
+            with open(self.path, 'r') as state_f:
+                state = json.load(state_f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        return state if isinstance(state, dict) else {}
+
+    @property
+    def previous_report_id(self):
+        """str: ID of the report this one follows on from, if incremental"""
+        if not self.incremental:
+            return None
+
+        return self._saved.get('report_id')
+
+    def file_offset(self, path, stat):
+        """Get where to start reading a log file from.
+
+        Args:
+            path (str): The log file
+            stat (os.stat_result): The current stat of the file
+
+        Returns:
+            int: The offset reached by the last report if the file is the
+            same and was not truncated since, 0 otherwise
+        """
+        if not self.incremental:
+            return 0
+
+        saved = self._saved.get('files', {}).get(path)
+        if not saved or saved.get('inode') != stat.st_ino or \
+                saved.get('offset', 0) > stat.st_size:
+            return 0
+
+        return saved['offset']
+
+    def _tag(self, key, collectors):
+        if collectors:
+            self._collectors.setdefault(key, set()).update(collectors)
+
+    def file_read(self, path, stat, offset, collectors=()):
+        """Record that a log file was read up to ``offset``."""
+        with self._lock:
+            self._pending['files'][path] = {
+                'inode': stat.st_ino,
+                'offset': offset,
+            }
+            self._tag(('files', path), collectors)
+
+    def app_log_since(self, log_file):
+        """Get the time of the last app log entry already sent.
+
+        Returns:
+            float: A UNIX timestamp or ``None`` to send all entries
+        """
+        if not self.incremental:
+            return None
+
+        return self._saved.get('app_logs', {}).get(log_file)
+
+    def app_log_read(self, log_file, last_time, collectors=()):
+        """Record the time of the last app log entry collected."""
+        with self._lock:
+            previous = self._pending['app_logs'].get(log_file)
+            self._pending['app_logs'][log_file] = max(previous, last_time)
+            self._tag(('app_logs', log_file), collectors)
+
+    @property
+    def journal_cursor(self):
+        """str: Journal cursor to continue from or ``None`` for this boot"""
+        if not self.incremental:
+            return None
+
+        return self._saved.get('journal_cursor')
+
+    def journal_read(self, cursor, collectors=()):
+        """Record the cursor of the last journal entry collected."""
+        with self._lock:
+            self._pending['journal_cursor'] = cursor
+            self._tag(('journal_cursor', None), collectors)
+
+    def for_collectors(self, collectors):
+        """Get a view of the state recording the positions on behalf of
+        ``collectors``, to hand to them.
+
+        Returns:
+            CollectorLogState: The view
+        """
+        return CollectorLogState(self, collectors)
+
+    def forget(self, collectors):
+        """Drop the positions recorded on behalf of ``collectors``, so that
+        the next incremental report collects the same entries again, e.g.
+        because they were cut from this one."""
+        collectors = set(collectors)
+        with self._lock:
+            for key, tags in self._collectors.items():
+                if not tags & collectors:
+                    continue
+
+                kind, name = key
+                if kind == 'journal_cursor':
+                    self._pending.pop(kind, None)
+                else:
+                    self._pending[kind].pop(name, None)
+                del self._collectors[key]
+
+    def metadata(self):
+        """Get the description of the report to add to its metadata.
+
+        Returns:
+            dict: The report ID, whether it is incremental and the report
+            it follows on from
+        """
+        metadata = {
+            'report_id': self.report_id,
+            'incremental': self.incremental,
+        }
+        if self.previous_report_id:
+            metadata['previous_report_id'] = self.previous_report_id
+
+        return metadata
+
+    def commit(self):
+        """Save the positions reached once the report was sent.
+
+        Sources which were not collected this time keep their old position.
+
+        Returns:
+            bool: Whether the state was saved
+        """
+        if not self.path:
+            return False
+
+        with self._lock:
+            state = {
+                'report_id': self.report_id,
+                'files': dict(self._saved.get('files', {})),
+                'app_logs': dict(self._saved.get('app_logs', {})),
+                'journal_cursor': self._saved.get('journal_cursor'),
+            }
+            state['files'].update(self._pending['files'])
+            state['app_logs'].update(self._pending['app_logs'])
+            if self._pending.get('journal_cursor'):
+                state['journal_cursor'] = self._pending['journal_cursor']
+
+        tmp_path = '{}.tmp'.format(self.path)
+        try:
+            with open(tmp_path, 'w') as state_f:
+                json.dump(state, state_f)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            return False
+
+        self._saved = state
+        return True
+
+
+class CollectorLogState(object):
+    """A :class:`LogState` as seen by some collectors, recording the
+    positions they reach on their behalf.
+
+    Args:
+        log_state (LogState): The state of the report
+        collectors (list): Names of the collectors
+    """
+
+    def __init__(self, log_state, collectors):
+        self._log_state = log_state
+        self.collectors = tuple(collectors)
+
+    def __getattr__(self, name):
+        return getattr(self._log_state, name)
+
+    def file_read(self, path, stat, offset):
+        self._log_state.file_read(path, stat, offset, self.collectors)
+
+    def app_log_read(self, log_file, last_time):
+        self._log_state.app_log_read(log_file, last_time, self.collectors)
+
+    def journal_read(self, cursor):
+        self._log_state.journal_read(cursor, self.collectors)
@@ -0,0 +1,442 @@
+# native.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Collectors reading /proc, /sys and the dpkg database directly, rather
+# than forking the commands which would print the same thing.
+#
+# Forking is expensive on the single core boards, so these render output
+# equivalent to the commands they replace. They raise IOError or OSError
+# when the interfaces they need are missing, in which case the caller is
+# expected to fall back to the command.
+
+
+import math
+import os
+import re
+import time
+
+
+KANUX_VERSION_PATH = '/etc/kanux_version'
+KWIFI_CACHE_PATH = '/etc/kwifiprompt-cache.conf'
+MEMINFO_PATH = '/proc/meminfo'
+MOUNTS_PATH = '/proc/self/mounts'
+DPKG_STATUS_PATH = '/var/lib/dpkg/status'
+SYS_USB_DEVICES = '/sys/bus/usb/devices'
+SYS_BLOCK = '/sys/block'
+
+# ls shows the time rather than the year for files from the last 6 months
+LS_RECENT = 365.2425 * 24 * 60 * 60 / 2
+
+SECTOR_SIZE = 512
+
+USB_CLASSES = {
+    0x01: 'Audio',
+    0x02: 'Communications',
+    0x03: 'Human Interface Device',
+    0x05: 'Physical Interface Device',
+    0x06: 'Imaging',
+    0x07: 'Printer',
+    0x08: 'Mass Storage',
+    0x09: 'Hub',
+    0x0a: 'CDC Data',
+    0x0b: 'Chip/SmartCard',
+    0x0d: 'Content Security',
+    0x0e: 'Video',
+    0x0f: 'Personal Healthcare',
+    0x10: 'Audio/Video',
+    0xdc: 'Diagnostic',
+    0xe0: 'Wireless',
+    0xef: 'Miscellaneous Device',
+    0xfe: 'Application Specific Interface',
+    0xff: 'Vendor Specific Class',
+}
+
+DPKG_WANT = {
+    'unknown': 'u',
+    'install': 'i',
+    'hold': 'h',
+    'deinstall': 'r',
+    'purge': 'p',
+}
+DPKG_EFLAG = {
+    'ok': ' ',
+    'reinstreq': 'R',
+}
+DPKG_STATUS = {
+    'not-installed': 'n',
+    'config-files': 'c',
+    'half-installed': 'H',
+    'unpacked': 'U',
+    'half-configured': 'F',
+    'triggers-awaited': 'W',
+    'triggers-pending': 't',
+    'installed': 'i',
+}
+DPKG_HEADER = (
+    'Desired=Unknown/Install/Remove/Purge/Hold\n'
+    '| Status=Not/Inst/Conf-files/Unpacked/halF-conf/Half-inst/'
+    'trig-aWait/Trig-pend\n'
+    '|/ Err?=(none)/Reinst-required (Status,Err: uppercase=bad)\n'
+)
+
+
+def _read(path):
+    with open(path, 'r') as file_obj:
+        return file_obj.read()
+
+
+def _read_attr(path, default=None):
+    try:
+        return _read(path).strip()
+    except (IOError, OSError):
+        return default
+
+
+def _table(rows, align_right=(), min_widths=()):
+    """Render rows as columns separated by a space, as the commands do."""
+    min_widths = list(min_widths) + [0] * len(rows[0])
+    widths = [max([len(row[col]) for row in rows] + [min_widths[col]])
+              for col in xrange(len(rows[0]))]
+    lines = []
+    for row in rows:
+        cells = [
+            cell.rjust(width) if col in align_right else cell.ljust(width)
+            for col, (cell, width) in enumerate(zip(row, widths))
+        ]
+        lines.append(' '.join(cells).rstrip())
+
+    return '\n'.join(lines) + '\n'
+
+
+def ls_time(mtime, now=None):
+    """Format a modification time the way ``ls -l`` does."""
+    now = now if now is not None else time.time()
+    stamp = time.localtime(mtime)
+    if now - LS_RECENT < mtime <= now:
+        return '{} {} {}'.format(time.strftime('%b', stamp), stamp.tm_mday,
+                                 time.strftime('%H:%M', stamp))
+
+    return '{} {} {}'.format(time.strftime('%b', stamp), stamp.tm_mday,
+                             stamp.tm_year)
+
+
+def kanux_version(path=KANUX_VERSION_PATH):
+    """Equivalent of ``ls -l | awk`` for the time and ``cat`` of the OS
+    version file."""
+    return '{}\n{}'.format(ls_time(os.stat(path).st_mtime), _read(path))
+
+
+def kwifi_cache(path=KWIFI_CACHE_PATH):
+    """Equivalent of ``cat`` of the wifi cache with the key obfuscated."""
+    if not os.path.exists(path):
+        return ''
+
+    return re.sub(r'"enckey":.*', '"enckey": "obfuscated"', _read(path))
+
+
+def meminfo(path=MEMINFO_PATH):
+    """Equivalent of ``cat /proc/meminfo``."""
+    return _read(path)
+
+
+def human_size(size, ceil=False):
+    """Format a size in bytes the way ``lsblk`` and ``df -h`` do.
+
+    Args:
+        size (int): The size in bytes
+        ceil (bool): Whether to round up, as ``df`` does, rather than to
+            the nearest value, as ``lsblk`` does
+    """
+    units = ['', 'K', 'M', 'G', 'T', 'P']
+    value = float(size)
+    unit = 0
+    while value >= 1024 and unit < len(units) - 1:
+        value /= 1024
+        unit += 1
+
+    if ceil:
+        if value < 10 and unit:
+            value = math.ceil(value * 10) / 10
+            if value < 10:
+                return '{:.1f}{}'.format(value, units[unit])
+        return '{:d}{}'.format(int(math.ceil(value)), units[unit])
+
+    value = round(value, 1)
+    if value == int(value):
+        return '{:d}{}'.format(int(value), units[unit] or 'B')
+    return '{:.1f}{}'.format(value, units[unit] or 'B')
+
+
+def _mounts(path=MOUNTS_PATH):
+    mounts = []
+    for line in _read(path).splitlines():
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        # spaces in mount points are escaped as octal
+        mounts.append(tuple(
+            re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)),
+                   field)
+            for field in fields[:3]
+        ))
+
+    return mounts
+
+
+def disk_space(mounts_path=MOUNTS_PATH):
+    """Equivalent of ``df -h``, from the mounts and ``statvfs``.
+
+    Like ``df``, filesystems without any block and devices mounted a second
+    time are left out.
+    """
+    rows = [('Filesystem', 'Size', 'Used', 'Avail', 'Use%', 'Mounted on')]
+    seen = set()
+    for device, mount_point, dummy in _mounts(mounts_path):
+        try:
+            stat = os.statvfs(mount_point)
+            dev_id = os.stat(mount_point).st_dev
+        except OSError:
+            continue
+
+        if not stat.f_blocks or dev_id in seen:
+            continue
+        seen.add(dev_id)
+
+        size = stat.f_blocks * stat.f_frsize
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        avail = stat.f_bavail * stat.f_frsize
+        use = '{:d}%'.format(int(math.ceil(100.0 * used / (used + avail)))) \
+            if used + avail else '-'
+
+        rows.append((device, human_size(size, ceil=True),
+                     human_size(used, ceil=True), human_size(avail, ceil=True),
+                     use, mount_point))
+
+    return _table(rows, align_right=(1, 2, 3, 4),
+                  min_widths=(14, 5, 5, 5, 4))
+
+
+def lsblk(sys_block=SYS_BLOCK, mounts_path=MOUNTS_PATH):
+    """Equivalent of ``lsblk``, from ``/sys/block``.
+
+    Like ``lsblk``, RAM disks and empty loop devices are left out.
+    """
+    mount_points = {}
+    for device, mount_point, dummy in _mounts(mounts_path):
+        try:
+            mount_points.setdefault(os.stat(device).st_rdev, mount_point)
+        except OSError:
+            pass
+
+    def row(name, path, prefix, dev_type):
+        major, minor = _read_attr(os.path.join(path, 'dev'), '0:0') \
+            .split(':')
+        rdev = os.makedev(int(major), int(minor))
+        size = int(_read_attr(os.path.join(path, 'size'), 0)) * SECTOR_SIZE
+        removable = _read_attr(os.path.join(path, 'removable'), '0')
+        if dev_type == 'part':
+            removable = _read_attr(os.path.join(path, '..', 'removable'), '0')
+        return (prefix + name, '{}:{}'.format(major, minor), removable,
+                human_size(size), _read_attr(os.path.join(path, 'ro'), '0'),
+                dev_type, mount_points.get(rdev, ''))
+
+    def dev_number(name):
+        major, minor = _read_attr(os.path.join(sys_block, name, 'dev'),
+                                  '0:0').split(':')
+        return int(major), int(minor)
+
+    rows = [('NAME', 'MAJ:MIN', 'RM', 'SIZE', 'RO', 'TYPE', 'MOUNTPOINT')]
+    for name in sorted(os.listdir(sys_block), key=dev_number):
+        path = os.path.join(sys_block, name)
+        if name.startswith('ram') or (
+                name.startswith('loop') and
+                not int(_read_attr(os.path.join(path, 'size'), 0))):
+            continue
+
+        dev_type = 'loop' if name.startswith('loop') else 'disk'
+        rows.append(row(name, path, '', dev_type))
+
+        parts = sorted(
+            part for part in os.listdir(path)
+            if os.path.isfile(os.path.join(path, part, 'partition'))
+        )
+        for idx, part in enumerate(parts):
+            prefix = '`-' if idx == len(parts) - 1 else '|-'
+            rows.append(row(part, os.path.join(path, part), prefix, 'part'))
+
+    return _table(rows, align_right=(2, 3, 4), min_widths=(0, 0, 2, 5))
+
+
+def _usb_devices(sys_usb):
+    devices = {}
+    for name in os.listdir(sys_usb):
+        path = os.path.join(sys_usb, name)
+        if ':' in name:
+            continue
+
+        devices[name] = {
+            'path': path,
+            'bus': int(_read_attr(os.path.join(path, 'busnum'), 0)),
+            'dev': int(_read_attr(os.path.join(path, 'devnum'), 0)),
+            'vendor': _read_attr(os.path.join(path, 'idVendor'), '0000'),
+            'product': _read_attr(os.path.join(path, 'idProduct'), '0000'),
+            'description': ' '.join(filter(None, [
+                _read_attr(os.path.join(path, 'manufacturer')),
+                _read_attr(os.path.join(path, 'product')),
+            ])),
+            'speed': _read_attr(os.path.join(path, 'speed'), '?'),
+            'maxchild': _read_attr(os.path.join(path, 'maxchild'), '0'),
+            'interfaces': sorted(
+                os.path.join(sys_usb, intf) for intf in os.listdir(sys_usb)
+                if intf.startswith(name + ':')
+            ),
+        }
+
+    return devices
+
+
+def _usb_driver(path):
+    driver = os.path.join(path, 'driver')
+    if not os.path.exists(driver):
+        return '[none]'
+    return os.path.basename(os.path.realpath(driver))
+
+
+def _usb_tree_key(name):
+    # usb1, 1-1, 1-1.2 sort by bus then by port path
+    if name.startswith('usb'):
+        return (int(name[3:]), [])
+    bus, ports = name.split('-', 1)
+    return (int(bus), [int(port) for port in ports.split('.')])
+
+
+def usb_devices(sys_usb=SYS_USB_DEVICES):
+    """Equivalent of ``lsusb && lsusb -t``, from ``/sys/bus/usb``.
+
+    The descriptions are the strings reported by the devices rather than
+    the names from the USB ID database.
+    """
+    devices = _usb_devices(sys_usb)
+
+    lines = [
+        'Bus {bus:03d} Device {dev:03d}: ID {vendor}:{product} '
+        '{description}'.format(**device).rstrip()
+        for dummy, device in sorted(
+            devices.iteritems(),
+            key=lambda item: (-item[1]['bus'], -item[1]['dev'])
+        )
+    ]
+
+    for name in sorted(devices, key=_usb_tree_key):
+        device = devices[name]
+        bus, ports = _usb_tree_key(name)
+
+        if not ports:
+            lines.append(
+                '/:  Bus {:02d}.Port 1: Dev {}, Class=root_hub, '
+                'Driver={}/{}p, {}M'.format(
+                    bus, device['dev'], _usb_driver(device['path']),
+                    device['maxchild'], device['speed']
+                )
+            )
+            continue
+
+        for intf in device['interfaces']:
+            intf_class = int(_read_attr(
+                os.path.join(intf, 'bInterfaceClass'), '0'), 16)
+            driver = _usb_driver(intf)
+            if intf_class == 0x09:
+                driver = '{}/{}p'.format(driver, device['maxchild'])
+            lines.append(
+                '{}|__ Port {}: Dev {}, If {}, Class={}, Driver={}, {}M'
+                .format(
+                    '    ' * len(ports), ports[-1], device['dev'],
+                    int(_read_attr(
+                        os.path.join(intf, 'bInterfaceNumber'), '0'), 16),
+                    USB_CLASSES.get(intf_class, '[unknown]'), driver,
+                    device['speed']
+                )
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+def _dpkg_stanzas(path):
+    """Iterate over the packages in the dpkg status file.
+
+    Only the fields listed by ``dpkg-query -l`` are kept, with the first
+    line of the description.
+    """
+    fields = {}
+    with open(path, 'r') as status_f:
+        for line in status_f:
+            if not line.strip():
+                if fields:
+                    yield fields
+                fields = {}
+                continue
+
+            if line[0] in ' \t':
+                continue
+
+            key, dummy, value = line.partition(':')
+            if key in ('Package', 'Status', 'Version', 'Architecture',
+                       'Description', 'Multi-Arch'):
+                # dpkg-query keeps the trailing spaces of the description
+                fields[key] = value.lstrip().rstrip('\n')
+
+    if fields:
+        yield fields
+
+
+def dpkg_list(status_path=DPKG_STATUS_PATH):
+    """Equivalent of ``dpkg-query -l``, from the dpkg status file."""
+    rows = []
+    for fields in _dpkg_stanzas(status_path):
+        want, eflag, status = (fields.get('Status', '').split() +
+                               ['', '', ''])[:3]
+        if status in ('', 'not-installed') and \
+                want in ('', 'unknown', 'purge'):
+            continue
+
+        name = fields.get('Package', '')
+        if fields.get('Multi-Arch') == 'same':
+            name = '{}:{}'.format(name, fields.get('Architecture', ''))
+
+        rows.append((
+            (fields.get('Package', ''), fields.get('Architecture', '')),
+            DPKG_WANT.get(want, '?') + DPKG_STATUS.get(status, '?') +
+            DPKG_EFLAG.get(eflag, 'X').strip(),
+            name,
+            fields.get('Version', '<none>'),
+            fields.get('Architecture', '<none>'),
+            fields.get('Description', '(no description available)'),
+        ))
+
+    # sorted by package then architecture, then the sort key is dropped
+    rows = [row[1:] for row in sorted(rows)]
+    widths = [
+        max([len(row[col]) for row in rows] + [len(header)])
+        for col, header in enumerate(
+            ('', 'Name', 'Version', 'Architecture', 'Description'))
+    ]
+    widths[0] = 3
+
+    lines = [
+        '||/ {} {} {} {}'.format(
+            'Name'.ljust(widths[1]), 'Version'.ljust(widths[2]),
+            'Architecture'.ljust(widths[3]), 'Description'
+        ).rstrip(),
+        '+++-{}-{}-{}-{}'.format(
+            '=' * widths[1], '=' * widths[2], '=' * widths[3], '=' * widths[4]
+        ),
+    ]
+    for row in rows:
+        lines.append('{} {} {} {} {}'.format(
+            row[0].ljust(widths[0]), row[1].ljust(widths[1]),
+            row[2].ljust(widths[2]), row[3].ljust(widths[3]), row[4]
+        ))
+
+    return DPKG_HEADER + '\n'.join(lines) + '\n'
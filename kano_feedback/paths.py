@@ -6,7 +6,23 @@
 # Paths used throughout this project.
 
 
+import os
+
+
 class Path(object):
     """Paths used throughout this project."""
 
-    DEFAULT_REPORT_PATH = '/tmp/kano-feedback-cli.tar.gz'
+    # The extension of the compression method is appended
+    DEFAULT_REPORT_STEM = '/tmp/kano-feedback-cli'
+
+    REPORT_SPOOL_DIR = os.path.join(
+        os.path.expanduser('~'), '.kano-feedback-spool'
+    )
+
+    LOG_STATE_PATH = os.path.join(
+        os.path.expanduser('~'), '.kano-feedback-log-state.json'
+    )
+
+    RESULT_CACHE_DIR = os.path.join(
+        os.path.expanduser('~'), '.kano-feedback-cache'
+    )
@@ -0,0 +1,443 @@
+# proc_snapshot.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# A single walk of /proc rendered as ps, pstree and lsof would print it.
+#
+# The process, process tree, memory ranking and open files collectors all
+# render the same snapshot, so they agree with each other and /proc is only
+# walked once per report instead of once per command.
+
+
+import os
+import pwd
+import stat
+import time
+
+
+PROC_DIR = '/proc'
+
+PS_FIELDS = 'user,pid,pcpu,pmem,vsz,rss,tty=TTY,tmout,f=FLAGS,' \
+    'wchan=EXTRA-WIDE-WCHAN-COLUMN,stat,start_time,time,args'
+PS_HEADER = ('USER', 'PID', '%CPU', '%MEM', 'VSZ', 'RSS', 'TTY', 'TMOUT',
+             'FLAGS', 'EXTRA-WIDE-WCHAN-COLUMN', 'STAT', 'START', 'TIME',
+             'COMMAND')
+LSOF_HEADER = ('COMMAND', 'PID', 'USER', 'FD', 'TYPE', 'DEVICE', 'SIZE/OFF',
+               'NODE', 'NAME')
+
+# How lsof names the kind of each file
+LSOF_TYPES = [
+    (stat.S_ISREG, 'REG'),
+    (stat.S_ISDIR, 'DIR'),
+    (stat.S_ISCHR, 'CHR'),
+    (stat.S_ISBLK, 'BLK'),
+    (stat.S_ISFIFO, 'FIFO'),
+    (stat.S_ISSOCK, 'sock'),
+    (stat.S_ISLNK, 'LINK'),
+]
+
+
+class ProcessRecord(object):
+    """What the collectors need to know about a process.
+
+    Only ``/proc/<pid>/stat``, ``cmdline`` and ``wchan`` are read, the
+    owner comes from the ``/proc/<pid>`` directory itself. The threads and
+    open files are only read when asked for, see :func:`take_snapshot`.
+
+    Attributes:
+        tasks (list): ``(tid, comm)`` of the threads other than the main one
+        open_files (list): :class:`OpenFile` records of the current and root
+            directories, the executable and the file descriptors
+    """
+
+    __slots__ = ('pid', 'ppid', 'uid', 'comm', 'state', 'pgrp', 'session',
+                 'tty_nr', 'tpgid', 'flags', 'utime', 'stime', 'nice',
+                 'threads', 'starttime', 'vsize', 'rss', 'cmdline', 'wchan',
+                 'tasks', 'open_files')
+
+    def __init__(self, pid, uid, stat_line, cmdline, wchan):
+        self.pid = pid
+        self.uid = uid
+        self.cmdline = cmdline
+        self.wchan = wchan
+        self.tasks = []
+        self.open_files = []
+
+        # the command name is in brackets and can contain anything
+        self.comm = stat_line[stat_line.index('(') + 1:stat_line.rindex(')')]
+        fields = stat_line[stat_line.rindex(')') + 2:].split()
+        self.state = fields[0]
+        self.ppid = int(fields[1])
+        self.pgrp = int(fields[2])
+        self.session = int(fields[3])
+        self.tty_nr = int(fields[4])
+        self.tpgid = int(fields[5])
+        self.flags = int(fields[6])
+        self.utime = int(fields[11])
+        self.stime = int(fields[12])
+        self.nice = int(fields[16])
+        self.threads = int(fields[17])
+        self.starttime = int(fields[19])
+        self.vsize = int(fields[20])
+        self.rss = int(fields[21])
+
+    @property
+    def args(self):
+        """str: The command line, or the name in brackets for kernel
+        threads, as ``ps`` shows it"""
+        if not self.cmdline:
+            return '[{}]'.format(self.comm)
+        # ps shows control characters as question marks
+        return ''.join(
+            char if ord(char) >= 32 and ord(char) != 127 else '?'
+            for char in ' '.join(self.cmdline)
+        )
+
+
+class OpenFile(object):
+    """A file a process holds, as :func:`os.stat` found it."""
+
+    __slots__ = ('fd', 'target', 'mode', 'dev', 'size', 'ino')
+
+    def __init__(self, fd, target, info):
+        self.fd = fd
+        self.target = target
+        self.mode = info.st_mode
+        self.dev = info.st_dev
+        self.size = info.st_size
+        self.ino = info.st_ino
+
+
+class ProcSnapshot(object):
+    """The processes running at one point in time.
+
+    Attributes:
+        processes (dict): :class:`ProcessRecord` objects by PID
+        uptime (float): Seconds since boot when the snapshot was taken
+        boot_time (int): UNIX time of the boot
+        mem_total (int): Total memory, in kB
+        clock_ticks (int): Clock ticks per second of the CPU times
+        page_size (int): Size of the pages counted in the RSS
+    """
+
+    def __init__(self, processes, uptime, boot_time, mem_total,
+                 proc_dir=PROC_DIR):
+        self.processes = processes
+        self.uptime = uptime
+        self.boot_time = boot_time
+        self.mem_total = mem_total
+        self.proc_dir = proc_dir
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self._users = {}
+
+    def user(self, uid):
+        if uid not in self._users:
+            try:
+                self._users[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                self._users[uid] = str(uid)
+        return self._users[uid]
+
+    def sorted_processes(self):
+        return [self.processes[pid] for pid in sorted(self.processes)]
+
+    def cpu_percent(self, process):
+        elapsed = self.uptime - float(process.starttime) / self.clock_ticks
+        if elapsed <= 0:
+            return 0.0
+        cpu_time = float(process.utime + process.stime) / self.clock_ticks
+        return 100.0 * cpu_time / elapsed
+
+    def mem_percent(self, process):
+        if not self.mem_total:
+            return 0.0
+        return 100.0 * process.rss * self.page_size / 1024 / self.mem_total
+
+
+def _read(path):
+    with open(path, 'r') as file_obj:
+        return file_obj.read()
+
+
+def _read_tasks(pid_dir, process):
+    task_dir = os.path.join(pid_dir, 'task')
+    try:
+        tids = sorted(int(tid) for tid in os.listdir(task_dir))
+    except OSError:
+        return []
+
+    tasks = []
+    for tid in tids:
+        if tid == process.pid:
+            continue
+        try:
+            comm = _read(os.path.join(task_dir, str(tid), 'comm')).strip()
+        except (IOError, OSError):
+            comm = process.comm
+        tasks.append((tid, comm))
+
+    return tasks
+
+
+def _read_open_files(pid_dir):
+    entries = [('cwd', 'cwd'), ('rtd', 'root'), ('txt', 'exe')]
+    try:
+        entries += [
+            (fd, os.path.join('fd', fd))
+            for fd in sorted(os.listdir(os.path.join(pid_dir, 'fd')), key=int)
+        ]
+    except OSError:
+        pass
+
+    open_files = []
+    for fd, path in entries:
+        link = os.path.join(pid_dir, path)
+        try:
+            open_files.append(OpenFile(fd, os.readlink(link), os.stat(link)))
+        except OSError:
+            continue
+
+    return open_files
+
+
+def take_snapshot(proc_dir=PROC_DIR, tasks=False, open_files=False):
+    """Walk ``/proc`` once.
+
+    Processes exiting during the walk are left out. The threads and the open
+    files are read in the same walk when asked for, so that nothing is read
+    from ``/proc`` again when rendering.
+
+    Args:
+        tasks (bool): Whether to read the threads of the processes, which
+            the process tree shows
+        open_files (bool): Whether to read the open files of the processes.
+            The files of other users are only visible to root
+
+    Returns:
+        ProcSnapshot: The processes
+    """
+    uptime = float(_read(os.path.join(proc_dir, 'uptime')).split()[0])
+
+    boot_time = 0
+    for line in _read(os.path.join(proc_dir, 'stat')).splitlines():
+        if line.startswith('btime '):
+            boot_time = int(line.split()[1])
+
+    mem_total = 0
+    for line in _read(os.path.join(proc_dir, 'meminfo')).splitlines():
+        if line.startswith('MemTotal:'):
+            mem_total = int(line.split()[1])
+
+    processes = {}
+    for name in os.listdir(proc_dir):
+        if not name.isdigit():
+            continue
+
+        path = os.path.join(proc_dir, name)
+        try:
+            uid = os.stat(path).st_uid
+            stat_line = _read(os.path.join(path, 'stat'))
+            cmdline = _read(os.path.join(path, 'cmdline')).split('\0')
+            try:
+                wchan = _read(os.path.join(path, 'wchan'))
+            except (IOError, OSError):
+                wchan = ''
+        except (IOError, OSError):
+            continue
+
+        process = ProcessRecord(
+            int(name), uid, stat_line, filter(None, cmdline), wchan
+        )
+        if tasks and process.threads > 1:
+            process.tasks = _read_tasks(path, process)
+        if open_files:
+            process.open_files = _read_open_files(path)
+        processes[process.pid] = process
+
+    return ProcSnapshot(processes, uptime, boot_time, mem_total, proc_dir)
+
+
+def _columns(rows, align_left=()):
+    widths = [max(len(row[col]) for row in rows)
+              for col in xrange(len(rows[0]))]
+    lines = []
+    for row in rows:
+        # the last column is never padded
+        cells = [
+            cell.ljust(width) if col in align_left else cell.rjust(width)
+            for col, (cell, width) in enumerate(zip(row[:-1], widths))
+        ]
+        lines.append(' '.join(cells + [row[-1]]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _tty_name(tty_nr):
+    major = (tty_nr >> 8) & 0xfff
+    minor = (tty_nr & 0xff) | ((tty_nr >> 12) & 0xfff00)
+    if not tty_nr:
+        return '?'
+    if 136 <= major <= 143:
+        return 'pts/{}'.format(minor + (major - 136) * 256)
+    if major == 4:
+        return 'tty{}'.format(minor) if minor < 64 else \
+            'ttyS{}'.format(minor - 64)
+    return '?'
+
+
+def _stat_flags(process):
+    flags = process.state
+    if process.nice < 0:
+        flags += '<'
+    elif process.nice > 0:
+        flags += 'N'
+    if process.session == process.pid:
+        flags += 's'
+    if process.threads > 1:
+        flags += 'l'
+    if process.tpgid == process.pgrp and process.tpgid > 0:
+        flags += '+'
+    return flags
+
+
+def _start_time(snapshot, process, now):
+    start = time.localtime(snapshot.boot_time +
+                           process.starttime // snapshot.clock_ticks)
+    today = time.localtime(now)
+    if start.tm_year != today.tm_year:
+        return time.strftime('%Y', start)
+    if start.tm_yday != today.tm_yday:
+        return time.strftime('%b%d', start)
+    return time.strftime('%H:%M', start)
+
+
+def _cpu_time(process, clock_ticks):
+    seconds = (process.utime + process.stime) // clock_ticks
+    days, seconds = divmod(seconds, 24 * 60 * 60)
+    clock = '{:02d}:{:02d}:{:02d}'.format(seconds // 3600,
+                                          seconds // 60 % 60, seconds % 60)
+    return '{}-{}'.format(days, clock) if days else clock
+
+
+def render_processes(snapshot, now=None):
+    """Render the snapshot as ``ps -Ao`` :const:`PS_FIELDS` does."""
+    now = now if now is not None else time.time()
+    rows = [PS_HEADER]
+    for process in snapshot.sorted_processes():
+        rows.append((
+            snapshot.user(process.uid),
+            str(process.pid),
+            '{:.1f}'.format(snapshot.cpu_percent(process)),
+            '{:.1f}'.format(snapshot.mem_percent(process)),
+            str(process.vsize // 1024),
+            str(process.rss * snapshot.page_size // 1024),
+            _tty_name(process.tty_nr),
+            '-',
+            '{:o}'.format((process.flags >> 6) & 0x7),
+            process.wchan if process.wchan not in ('', '0') else '-',
+            _stat_flags(process),
+            _start_time(snapshot, process, now),
+            _cpu_time(process, snapshot.clock_ticks),
+            process.args,
+        ))
+
+    return _columns(rows, align_left=(0, 6, 9, 10))
+
+
+def render_mem_ranking(snapshot):
+    """Render the snapshot as ``ps -eo pmem,args --no-headers --sort -pmem``
+    does."""
+    ranked = sorted(snapshot.sorted_processes(),
+                    key=snapshot.mem_percent, reverse=True)
+    return ''.join(
+        '{:4.1f} {}\n'.format(snapshot.mem_percent(process), process.args)
+        for process in ranked
+    )
+
+
+def _escape(arg):
+    # pstree shows control characters as octal escapes
+    return ''.join(
+        char if 32 <= ord(char) < 127 or ord(char) >= 128
+        else '\\{:03o}'.format(ord(char))
+        for char in arg
+    )
+
+
+def render_process_tree(snapshot):
+    """Render the snapshot as ``pstree -apl`` does, threads included when
+    the snapshot read them."""
+    children = {}
+    for process in snapshot.sorted_processes():
+        parent = process.ppid if process.ppid in snapshot.processes else 0
+        children.setdefault(parent, []).append(process)
+
+    def label(process):
+        return ' '.join(['{},{}'.format(process.comm, process.pid)] +
+                        [_escape(arg) for arg in process.cmdline[1:]])
+
+    lines = []
+
+    def walk(process, prefix):
+        nodes = [
+            (label(child), child) for child in
+            sorted(children.get(process.pid, []),
+                   key=lambda child: (child.comm, child.pid))
+        ]
+        nodes += [
+            ('{{{}}},{}'.format(comm, tid), None)
+            for tid, comm in process.tasks
+        ]
+
+        for idx, (node, child) in enumerate(nodes):
+            last = idx == len(nodes) - 1
+            lines.append(prefix + ('  `-' if last else '  |-') + node)
+            if child is not None:
+                walk(child, prefix + ('    ' if last else '  | '))
+
+    for root in sorted(children.get(0, []), key=lambda root: root.pid):
+        # kernel threads hang from kthreadd which is a root of its own
+        lines.append(label(root))
+        walk(root, '')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _lsof_type(mode):
+    for check, name in LSOF_TYPES:
+        if check(mode):
+            return name
+    return 'unknown'
+
+
+def _lsof_row(snapshot, process, open_file):
+    if stat.S_ISSOCK(open_file.mode) or stat.S_ISFIFO(open_file.mode):
+        size = '0t0'
+    else:
+        size = str(open_file.size)
+
+    return (
+        process.comm[:9], str(process.pid), snapshot.user(process.uid),
+        open_file.fd, _lsof_type(open_file.mode),
+        '{},{}'.format(os.major(open_file.dev), os.minor(open_file.dev)),
+        size, str(open_file.ino), open_file.target,
+    )
+
+
+def render_open_files(snapshot):
+    """Render the snapshot as ``lsof`` does.
+
+    Only the current and root directories, the executable and the file
+    descriptors are listed, memory mapped files are left out. The snapshot
+    must have read the open files.
+    """
+    rows = [LSOF_HEADER]
+    for process in snapshot.sorted_processes():
+        rows += [
+            _lsof_row(snapshot, process, open_file)
+            for open_file in process.open_files
+        ]
+
+    return _columns(rows, align_left=(0, 2, 4))
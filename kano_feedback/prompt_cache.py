@@ -0,0 +1,139 @@
+# prompt_cache.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Local copy of the questions of the widget, synced incrementally.
+#
+# The widget shows a question from the copy as soon as it starts, without
+# waiting for the network. Syncs only ask for the questions created since
+# the newest one known, and the full list is fetched again once a day so
+# that questions taken down on the server go away.
+
+
+import json
+import os
+import time
+import urllib
+
+
+PROMPT_CACHE_VERSION = 1
+
+QUESTIONS_ENDPOINT = '/questions'
+
+# How often the full list of questions is fetched again, in seconds
+FULL_SYNC_INTERVAL = 24 * 60 * 60
+
+
+def _created(question):
+    return question['date_created']
+
+
+class PromptCache(object):
+    """The questions of the widget as of the last sync, sorted by creation
+    date.
+
+    Args:
+        path (str): Where the questions are kept
+        full_sync_interval (int): Number of seconds after which the full
+            list is fetched again rather than only the new questions
+    """
+
+    def __init__(self, path, full_sync_interval=FULL_SYNC_INTERVAL):
+        self.path = path
+        self.full_sync_interval = full_sync_interval
+        self.questions = None
+        self.full_synced = 0
+
+    def load(self):
+        """Read the questions saved by the last sync.
+
+        Returns:
+            list: The questions, ``None`` if there are none saved
+        """
+        try:
+            with open(self.path, 'r') as cache_f:
+                cache = json.load(cache_f)
+            if cache.get('version') == PROMPT_CACHE_VERSION:
+                self.questions = cache['questions']
+                self.full_synced = cache.get('full_synced', 0)
+        except (IOError, OSError, ValueError, KeyError, AttributeError):
+            pass
+
+        return self.questions
+
+    def _save(self):
+        tmp_path = '{}.tmp'.format(self.path)
+        try:
+            with open(tmp_path, 'w') as cache_f:
+                json.dump({
+                    'version': PROMPT_CACHE_VERSION,
+                    'full_synced': self.full_synced,
+                    'questions': self.questions,
+                }, cache_f)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            return False
+
+        return True
+
+    def since(self, now=None):
+        """Get the creation date of the newest question known, to only ask
+        for the newer ones.
+
+        Returns:
+            str: The date, ``None`` when the full list should be fetched
+        """
+        now = now if now is not None else time.time()
+        if not self.questions or \
+                now - self.full_synced >= self.full_sync_interval:
+            return None
+
+        return _created(self.questions[-1])
+
+    def endpoint(self, since):
+        """Get the API endpoint listing the questions created after
+        ``since``, all of them if it is ``None``."""
+        if since is None:
+            return QUESTIONS_ENDPOINT
+
+        return '{}?{}'.format(
+            QUESTIONS_ENDPOINT, urllib.urlencode({'since': since})
+        )
+
+    def update(self, questions, since=None, now=None):
+        """Merge the questions returned by a sync.
+
+        The response is taken as the full list when it was asked for, or
+        when it holds questions older than ``since``, as servers ignoring
+        the parameter return everything. The newest question known may come
+        back with the new ones.
+
+        Args:
+            questions (list): The questions returned
+            since (str): What :meth:`since` gave for the request
+
+        Returns:
+            bool: Whether the questions changed
+        """
+        now = now if now is not None else time.time()
+        questions = sorted(questions, key=_created)
+
+        if since is None or any(
+                _created(question) < since for question in questions):
+            changed = questions != self.questions
+            self.questions = questions
+            self.full_synced = now
+            self._save()
+            return changed
+
+        known = set(question['id'] for question in self.questions)
+        added = [
+            question for question in questions if question['id'] not in known
+        ]
+        if not added:
+            return False
+
+        self.questions = sorted(self.questions + added, key=_created)
+        self._save()
+        return True
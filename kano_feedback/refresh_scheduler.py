@@ -0,0 +1,158 @@
+# refresh_scheduler.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Decides when the widget asks Kano for new questions.
+#
+# New questions are rare, so the interval between refreshes grows while
+# they bring nothing new. While offline, refreshes back off exponentially,
+# with jitter so that devices do not retry together, and the network
+# coming up triggers a refresh straight away.
+
+
+import random
+import socket
+import struct
+import threading
+
+from kano_feedback.spool import backoff_delay
+
+
+REFRESH_MIN_INTERVAL = 15 * 60
+REFRESH_MAX_INTERVAL = 24 * 60 * 60
+
+OFFLINE_BACKOFF_BASE = 30
+OFFLINE_BACKOFF_MAX = 30 * 60
+
+# From linux/rtnetlink.h
+NETLINK_ROUTE = 0
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWADDR = 20
+
+NLMSG_HEADER = struct.Struct('=LHHLL')
+
+
+class RefreshScheduler(object):
+    """Works out the delay before the next refresh from how the previous
+    ones went.
+
+    Args:
+        min_interval (int): Seconds between refreshes when questions were
+            just added
+        max_interval (int): Longest time between refreshes while online
+        offline_base (int): First delay after a failed refresh, doubled on
+            every failure
+        offline_cap (int): Longest delay while offline
+    """
+
+    def __init__(self, min_interval=REFRESH_MIN_INTERVAL,
+                 max_interval=REFRESH_MAX_INTERVAL,
+                 offline_base=OFFLINE_BACKOFF_BASE,
+                 offline_cap=OFFLINE_BACKOFF_MAX):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.offline_base = offline_base
+        self.offline_cap = offline_cap
+
+        self.interval = min_interval
+        self.failures = 0
+
+    def record(self, online, changed=False):
+        """Record how a refresh went.
+
+        Args:
+            online (bool): Whether the questions could be fetched
+            changed (bool): Whether they had changed
+        """
+        if not online:
+            self.failures += 1
+            return
+
+        self.failures = 0
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * 2)
+
+    def next_delay(self):
+        """Get the number of seconds to wait before the next refresh."""
+        if self.failures:
+            return backoff_delay(self.failures - 1, base=self.offline_base,
+                                 cap=self.offline_cap)
+
+        return self.interval * random.uniform(0.75, 1.0)
+
+    def link_up(self):
+        """Find out if the network coming up calls for a refresh now, that
+        is if the last one failed."""
+        return self.failures > 0
+
+
+def parse_netlink_types(data):
+    """Get the types of the netlink messages in a datagram."""
+    types = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+
+        types.append(msg_type)
+        # messages are aligned on 4 bytes
+        offset += (length + 3) & ~3
+
+    return types
+
+
+class LinkMonitor(object):
+    """Calls back when a network interface gets an address, as told by the
+    kernel over rtnetlink. A link coming up is only usable once it has
+    one.
+
+    The callback is run on the thread of the monitor.
+
+    Args:
+        callback (function): Called without arguments on every event
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        """Start listening for the events.
+
+        Returns:
+            bool: Whether the events can be listened to, otherwise only the
+            scheduled refreshes happen
+        """
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                       NETLINK_ROUTE)
+            self._sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        except (AttributeError, socket.error):
+            self._sock = None
+            return False
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def _run(self):
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(65536)
+            except (AttributeError, socket.error):
+                break
+
+            if RTM_NEWADDR in parse_netlink_types(data):
+                self.callback()
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
@@ -0,0 +1,295 @@
+# response_store.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Append-only store of the answers given to the questions of the widget.
+#
+# Each answer is appended to a log as a single line of JSON, so marking a
+# question costs the same however many were answered before, and a crash
+# can at worst lose the line being written, never the answers already
+# saved. The log is compacted into one line per question, atomically, once
+# enough lines were superseded.
+
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# The answer recorded once an answer was sent
+SENT = 'yes'
+
+# Appended lines are synced to disk at least this often
+SYNC_EVERY = 8
+SYNC_INTERVAL = 5.0
+
+# Lines superseded by later ones before the log is compacted
+COMPACT_MIN_STALE = 64
+
+
+def is_sent(row):
+    return row[1] == SENT
+
+
+def read_legacy_csv(path):
+    """Read the rows of the CSV cache the widget used to keep.
+
+    Returns:
+        list: The ``[prompt, answer, qid]`` rows, unicode
+    """
+    import csv
+
+    rows = []
+    try:
+        with open(path) as csv_f:
+            reader = csv.reader(csv_f, quoting=csv.QUOTE_NONNUMERIC)
+            for row in reader:
+                if len(row) < 3 or not row[0]:
+                    continue
+                rows.append([
+                    field.decode('utf-8') if isinstance(field, str) and field
+                    else field or None
+                    for field in row[:3]
+                ])
+    except (IOError, OSError, ValueError, csv.Error):
+        pass
+
+    return rows
+
+
+class ResponseStore(object):
+    """The answers to the questions of the widget, indexed by question text
+    and by question ID.
+
+    Answers are kept in memory and every change is appended to the log as
+    ``[prompt, answer, qid]``. The lines are flushed straight away and
+    synced to disk in batches, every ``sync_every`` lines or
+    ``sync_interval`` seconds, whichever comes first. A line which was not
+    written completely is dropped when the log is loaded.
+
+    Args:
+        path (str): Where the log is kept
+        legacy_path (str): The CSV cache of older versions, migrated into
+            the log the first time it is opened, then removed
+        sync_every (int): Number of lines appended between syncs
+        sync_interval (float): Maximum number of seconds between syncs
+        compact_min_stale (int): Number of superseded lines after which the
+            log is compacted, at least as many as there are questions
+    """
+
+    def __init__(self, path, legacy_path=None, sync_every=SYNC_EVERY,
+                 sync_interval=SYNC_INTERVAL,
+                 compact_min_stale=COMPACT_MIN_STALE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_min_stale = compact_min_stale
+
+        self._lock = threading.RLock()
+        self._rows = None
+        self._qids = {}
+        self._log_f = None
+        self._lines = 0
+        self._unsynced = 0
+        self._synced_at = 0
+
+    def load(self):
+        """Read the log, if it was not read yet, so that the following
+        calls do not touch the disk."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._rows is not None:
+            return
+
+        self._rows = OrderedDict()
+        self._qids = {}
+        self._lines = 0
+
+        if not os.path.exists(self.path) and self.legacy_path and \
+                os.path.exists(self.legacy_path):
+            self._migrate()
+            return
+
+        valid_end = 0
+        try:
+            with open(self.path, 'rb') as log_f:
+                for line in log_f:
+                    try:
+                        if not line.endswith('\n'):
+                            raise ValueError('incomplete line')
+                        prompt, answer, qid = json.loads(line)
+                    except (ValueError, TypeError):
+                        break
+                    self._index([prompt, answer, qid])
+                    self._lines += 1
+                    valid_end += len(line)
+            # drop the line a crash left behind, later lines follow it
+            if valid_end != os.path.getsize(self.path):
+                with open(self.path, 'r+b') as log_f:
+                    log_f.truncate(valid_end)
+        except (IOError, OSError):
+            pass
+
+        if self._lines - len(self._rows) >= self._compact_threshold():
+            self.compact()
+
+    def _migrate(self):
+        for row in read_legacy_csv(self.legacy_path):
+            self._index(row)
+
+        # the CSV goes only once the log holding its rows is on disk
+        if self.compact():
+            try:
+                os.remove(self.legacy_path)
+            except OSError:
+                pass
+
+    def _index(self, row):
+        old = self._rows.get(row[0])
+        if old and old[2] and old[2] != row[2] and \
+                self._qids.get(old[2]) is old:
+            del self._qids[old[2]]
+
+        self._rows[row[0]] = row
+        if row[2]:
+            self._qids[row[2]] = row
+
+    def _compact_threshold(self):
+        return max(self.compact_min_stale, len(self._rows))
+
+    @staticmethod
+    def _encode(row):
+        return json.dumps(row, separators=(',', ':')) + '\n'
+
+    def _open_log(self):
+        if self._log_f is None:
+            self._log_f = open(self.path, 'ab')
+
+        return self._log_f
+
+    def _sync(self, force=False):
+        if not self._unsynced or self._log_f is None:
+            return
+
+        now = time.time()
+        if force or self._unsynced >= self.sync_every or \
+                now - self._synced_at >= self.sync_interval:
+            os.fsync(self._log_f.fileno())
+            self._unsynced = 0
+            self._synced_at = now
+
+    def put(self, prompt, answer, qid):
+        """Record the answer to a question, replacing any earlier one.
+
+        Args:
+            prompt (unicode): The text of the question
+            answer (unicode): The answer, :const:`SENT` once it was sent
+            qid (unicode): The ID of the question
+
+        Returns:
+            bool: Whether the answer was written to the log
+        """
+        row = [prompt, answer, qid]
+        with self._lock:
+            self._load()
+            self._index(row)
+            try:
+                log_f = self._open_log()
+                # one write per line, so a line is either there or torn
+                log_f.write(self._encode(row))
+                log_f.flush()
+                self._lines += 1
+                self._unsynced += 1
+                self._sync()
+            except (IOError, OSError):
+                return False
+
+            if self._lines - len(self._rows) >= self._compact_threshold():
+                self.compact()
+
+        return True
+
+    def get(self, prompt):
+        """Get the ``[prompt, answer, qid]`` row of a question, ``None`` if
+        it was never answered."""
+        with self._lock:
+            self._load()
+            row = self._rows.get(prompt)
+            return list(row) if row else None
+
+    def is_responded(self, prompt, qid=None):
+        """Find out if a question was answered, by its text or its ID."""
+        with self._lock:
+            self._load()
+            return prompt in self._rows or bool(qid and qid in self._qids)
+
+    def rows(self, offline=False):
+        """Get the answers, in the order the questions were first answered.
+
+        Args:
+            offline (bool): Only get the answers which were not sent yet
+
+        Returns:
+            list: The ``[prompt, answer, qid]`` rows
+        """
+        with self._lock:
+            self._load()
+            return [
+                list(row) for row in self._rows.itervalues()
+                if not offline or not is_sent(row)
+            ]
+
+    def compact(self):
+        """Rewrite the log with a single line per question.
+
+        The new log is synced and renamed over the old one, so either is
+        complete whatever happens in between.
+
+        Returns:
+            bool: Whether the log was rewritten
+        """
+        with self._lock:
+            self._load()
+            tmp_path = '{}.tmp'.format(self.path)
+            try:
+                with open(tmp_path, 'wb') as tmp_f:
+                    for row in self._rows.itervalues():
+                        tmp_f.write(self._encode(row))
+                    tmp_f.flush()
+                    os.fsync(tmp_f.fileno())
+                self.close()
+                os.rename(tmp_path, self.path)
+            except (IOError, OSError):
+                return False
+
+            self._lines = len(self._rows)
+
+        return True
+
+    def sync(self):
+        """Sync the lines appended so far to disk."""
+        with self._lock:
+            try:
+                self._sync(force=True)
+            except (IOError, OSError):
+                return False
+
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._log_f is None:
+                return
+
+            try:
+                self._sync(force=True)
+            except (IOError, OSError):
+                pass
+            self._log_f.close()
+            self._log_f = None
@@ -0,0 +1,173 @@
+# result_cache.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Persistent cache of the output of the collectors whose sources rarely
+# change.
+
+
+import glob
+import hashlib
+import os
+import time
+
+
+# Bump when the output of the cached collectors changes format
+CACHE_VERSION = 1
+
+CACHE_MAX_BYTES = 8 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def fingerprint(paths):
+    """Identify the current state of the sources of a collector.
+
+    Args:
+        paths (list): Files or directories, glob patterns are expanded
+
+    Returns:
+        str: A hash of the paths with their inode, size and modification
+        time, which changes whenever any of them does
+    """
+    digest = hashlib.sha1(str(CACHE_VERSION))
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            try:
+                stat = os.stat(path)
+                state = (stat.st_ino, stat.st_size, stat.st_mtime)
+            except OSError:
+                state = None
+            digest.update('{}\0{}\n'.format(path, state))
+
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """On-disk cache of collector output, keyed on the fingerprint of its
+    sources.
+
+    Each collector has a single entry, so a changed source replaces it.
+    Entries not used for ``max_age`` are evicted, then the least recently
+    used ones until the cache fits in ``max_bytes``.
+
+    Args:
+        cache_dir (str): Where the entries are kept
+        max_bytes (int): Maximum total size of the entries
+        max_age (int): Maximum time since an entry was last used, in seconds
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES,
+                 max_age=CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, '{}.cache'.format(name))
+
+    def get(self, name, key):
+        """Get the cached output of a collector.
+
+        Args:
+            name (str): Name of the collector
+            key (str): The current :func:`fingerprint` of its sources
+
+        Returns:
+            str: The output or ``None`` if there is none for ``key``
+        """
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as cache_f:
+                if cache_f.readline().rstrip('\n') != key:
+                    return None
+                contents = cache_f.read()
+            # the modification time tracks the last use for the eviction
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+
+        return contents
+
+    def put(self, name, key, contents):
+        """Keep the output of a collector for its current sources.
+
+        Returns:
+            bool: Whether the output was cached
+        """
+        if not isinstance(contents, str):
+            return False
+
+        path = self._path(name)
+        tmp_path = '{}.tmp'.format(path)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(tmp_path, 'wb') as cache_f:
+                cache_f.write('{}\n'.format(key))
+                cache_f.write(contents)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self, now=None):
+        """Drop the entries which were not used for too long or do not fit.
+
+        Returns:
+            list: The names of the evicted collectors
+        """
+        now = now if now is not None else time.time()
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith('.cache'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        # least recently used first
+        entries.sort()
+        total = sum(size for dummy, size, dummy in entries)
+        evicted = []
+        for used, size, name in entries:
+            if now - used <= self.max_age and total <= self.max_bytes:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+            evicted.append(name[:-len('.cache')])
+
+        return evicted
+
+    def wrap(self, name, paths, collector_fn):
+        """Serve a collector from the cache while its sources are unchanged.
+
+        Args:
+            name (str): Name of the collector
+            paths (list): The sources of the output, see :func:`fingerprint`
+            collector_fn (function): The collector
+
+        Returns:
+            function: Runs the collector only when its output is not cached
+        """
+        def cached_collector():
+            key = fingerprint(paths)
+            contents = self.get(name, key)
+            if contents is None:
+                contents = collector_fn()
+                self.put(name, key, contents)
+            return contents
+
+        return cached_collector
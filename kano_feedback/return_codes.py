@@ -21,3 +21,9 @@ class RC(object):
     ERROR_SEND_DATA = 10
     ERROR_COPY_ARCHIVE = 11
     ERROR_CREATE_FLAG = 12
+
+    # kano-feedback-spool specific.
+    SPOOL_NOT_DRAINED = 20
+
+    # kano-feedback-coredumps specific.
+    COREDUMP_NOT_INDEXED = 30
@@ -0,0 +1,371 @@
+# spool.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# On-disk spool of the reports which could not be sent yet.
+
+
+import errno
+import fcntl
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+from kano_feedback.chunked_upload import UploadState
+
+
+SPOOL_MAX_AGE = 30 * 24 * 60 * 60
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+# Reports spooled before the extension was recorded were all gzipped
+DEFAULT_EXTENSION = '.tar.gz'
+
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+
+
+def backoff_delay(attempts, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Get how long to wait before the next attempt.
+
+    The delay doubles with every attempt up to ``cap`` and is randomised so
+    that devices which went offline together do not retry together.
+
+    Args:
+        attempts (int): Number of attempts which failed so far
+
+    Returns:
+        float: Number of seconds to wait
+    """
+    delay = min(cap, base * 2 ** min(attempts, 32))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def archive_path_extension(path):
+    """Get the extension of an archive file name, from its first dot,
+    e.g. ``.tar.bz2``."""
+    name = os.path.basename(path)
+    dot = name.find('.')
+    return name[dot:] if dot > 0 else DEFAULT_EXTENSION
+
+
+class SpoolEntry(object):
+    """A report waiting in the spool.
+
+    Attributes:
+        entry_id (str): Unique name of the report in the spool
+        created (float): When the report was spooled
+        payload (dict): The form fields of the report
+        size (int): Size of the archive, in bytes
+        attempts (int): Number of failed attempts to send it
+        next_attempt (float): Earliest time to try sending it again
+        last_error (str): The error of the last attempt
+        extension (str): File name extension of the archive, which tells
+            how it is compressed
+    """
+
+    def __init__(self, spool_dir, entry_id, created=None, payload=None,
+                 size=0, attempts=0, next_attempt=0, last_error=None,
+                 extension=DEFAULT_EXTENSION):
+        self.spool_dir = spool_dir
+        self.entry_id = entry_id
+        self.created = created if created is not None else time.time()
+        self.payload = payload or {}
+        self.size = size
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+        self.last_error = last_error
+        self.extension = extension
+
+    @property
+    def archive_path(self):
+        return os.path.join(self.spool_dir, self.entry_id + self.extension)
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.spool_dir, '{}.json'.format(self.entry_id))
+
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'payload': self.payload,
+            'size': self.size,
+            'attempts': self.attempts,
+            'next_attempt': self.next_attempt,
+            'last_error': self.last_error,
+            'extension': self.extension,
+        }
+
+    def __repr__(self):
+        return 'SpoolEntry({})'.format(self.entry_id)
+
+
+class ReportSpool(object):
+    """Bounded on-disk spool of finished reports.
+
+    Every report is kept as its archive plus a JSON file with its metadata.
+    Reports older than ``max_age`` are evicted, then the oldest ones until
+    the spool fits in ``max_bytes``.
+
+    Args:
+        spool_dir (str): Where the reports are kept
+        max_age (int): Maximum age of a report, in seconds
+        max_bytes (int): Maximum total size of the archives
+    """
+
+    def __init__(self, spool_dir, max_age=SPOOL_MAX_AGE,
+                 max_bytes=SPOOL_MAX_BYTES):
+        self.spool_dir = spool_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def _write_meta(self, entry):
+        tmp_path = '{}.tmp'.format(entry.meta_path)
+        with open(tmp_path, 'w') as meta_f:
+            json.dump(entry.to_dict(), meta_f)
+        os.rename(tmp_path, entry.meta_path)
+
+    def add(self, archive_path, payload):
+        """Move a report archive into the spool.
+
+        The session of a chunked upload of the archive moves with it, so
+        that sending it from the spool resumes the upload, see
+        :class:`kano_feedback.chunked_upload.UploadState`.
+
+        Args:
+            archive_path (str): The finished report archive, it is moved
+            payload (dict): The form fields of the report
+
+        Returns:
+            SpoolEntry: The spooled report, ``None`` if it is larger than
+            the whole spool, the archive is then left where it is
+        """
+        size = os.path.getsize(archive_path)
+        if size > self.max_bytes:
+            return None
+
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+
+        entry = SpoolEntry(
+            self.spool_dir,
+            '{}-{}'.format(int(time.time()), uuid.uuid4().hex[:8]),
+            payload=payload,
+            size=size,
+            extension=archive_path_extension(archive_path)
+        )
+        shutil.move(archive_path, entry.archive_path)
+        upload_path = UploadState(archive_path).path
+        if os.path.exists(upload_path):
+            shutil.move(upload_path, UploadState(entry.archive_path).path)
+        # The metadata goes last, a report without it is not in the spool
+        self._write_meta(entry)
+
+        # older reports make room for the new one
+        self.evict(keep=entry)
+
+        return entry
+
+    def entries(self):
+        """Get the reports in the spool.
+
+        Returns:
+            list: The :class:`SpoolEntry` objects, oldest first
+        """
+        try:
+            names = os.listdir(self.spool_dir)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+
+            entry_id = name[:-len('.json')]
+            try:
+                with open(os.path.join(self.spool_dir, name), 'r') as meta_f:
+                    meta = json.load(meta_f)
+                entry = SpoolEntry(self.spool_dir, entry_id, **meta)
+            except (IOError, OSError, ValueError, TypeError):
+                continue
+
+            if os.path.exists(entry.archive_path):
+                entries.append(entry)
+
+        return sorted(entries, key=lambda entry: entry.created)
+
+    def remove(self, entry):
+        for path in (entry.meta_path, entry.archive_path,
+                     UploadState(entry.archive_path).path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def mark_failed(self, entry, error):
+        """Record a failed attempt and schedule the next one."""
+        entry.attempts += 1
+        entry.last_error = error
+        entry.next_attempt = time.time() + backoff_delay(entry.attempts)
+        self._write_meta(entry)
+
+    def evict(self, now=None, keep=None):
+        """Drop the reports which are too old or do not fit in the spool.
+
+        Args:
+            keep (SpoolEntry): A report never to drop, counted in the size
+                of the spool
+
+        Returns:
+            list: The evicted :class:`SpoolEntry` objects
+        """
+        now = now if now is not None else time.time()
+        keep_id = keep.entry_id if keep is not None else None
+        entries = self.entries()
+        evicted = [
+            entry for entry in entries
+            if now - entry.created > self.max_age and
+            entry.entry_id != keep_id
+        ]
+        kept = [entry for entry in entries if entry not in evicted]
+
+        total = sum(entry.size for entry in kept)
+        candidates = [
+            entry for entry in kept if entry.entry_id != keep_id
+        ]
+        while candidates and total > self.max_bytes:
+            oldest = candidates.pop(0)
+            total -= oldest.size
+            evicted.append(oldest)
+
+        for entry in evicted:
+            self.remove(entry)
+
+        return evicted
+
+    def lock(self):
+        """Take the drain lock of the spool without waiting.
+
+        Returns:
+            file: The lock, held until it is closed, or ``None`` if another
+            process holds it
+        """
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+
+        lock_f = open(os.path.join(self.spool_dir, '.lock'), 'w')
+        try:
+            fcntl.flock(lock_f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as exception:
+            lock_f.close()
+            if exception.errno in (errno.EAGAIN, errno.EACCES):
+                return None
+            raise
+
+        return lock_f
+
+
+class SpoolDrainer(threading.Thread):
+    """Background worker sending the spooled reports.
+
+    Reports are sent oldest first once they are due. A failed report is
+    retried with exponential backoff, see :func:`backoff_delay`, and while
+    offline the worker waits with the same backoff. The worker stops when
+    the spool is empty, when ``max_runtime`` is over or on :meth:`stop`.
+
+    Args:
+        spool (ReportSpool): The spool to drain
+        send_fn (function): Called with the archive path and the payload of
+            a report, returns a ``(success, error)`` tuple
+        is_online (function): Returns whether there is connectivity.
+            Defaults to :func:`kano.network.is_internet`
+        max_runtime (float): Seconds after which to give up, ``None`` to
+            keep going until the spool is empty
+    """
+
+    MIN_WAIT = 1
+
+    def __init__(self, spool, send_fn, is_online=None, max_runtime=None):
+        super(SpoolDrainer, self).__init__(name='spool-drainer')
+        self.daemon = True
+
+        if is_online is None:
+            from kano.network import is_internet
+            is_online = is_internet
+
+        self.spool = spool
+        self.send_fn = send_fn
+        self.is_online = is_online
+        self.max_runtime = max_runtime
+        self.sent = []
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        self.drain()
+
+    def _wait(self, seconds, deadline):
+        seconds = max(seconds, self.MIN_WAIT)
+        if deadline is not None:
+            seconds = min(seconds, max(deadline - time.time(), 0))
+        self._stop_event.wait(seconds)
+
+    def drain(self):
+        """Send the spooled reports, blocking until done.
+
+        Returns:
+            bool: Whether the spool was emptied
+        """
+        lock = self.spool.lock()
+        if lock is None:
+            return False
+
+        deadline = time.time() + self.max_runtime \
+            if self.max_runtime is not None else None
+        offline_attempts = 0
+
+        try:
+            while not self._stop_event.is_set():
+                if deadline is not None and time.time() >= deadline:
+                    return False
+
+                self.spool.evict()
+                entries = self.spool.entries()
+                if not entries:
+                    return True
+
+                now = time.time()
+                due = [entry for entry in entries if entry.next_attempt <= now]
+                if not due:
+                    self._wait(min(entry.next_attempt for entry in entries) -
+                               now, deadline)
+                    continue
+
+                if not self.is_online():
+                    self._wait(backoff_delay(offline_attempts), deadline)
+                    offline_attempts += 1
+                    continue
+                offline_attempts = 0
+
+                for entry in due:
+                    if self._stop_event.is_set():
+                        break
+
+                    success, error = self.send_fn(entry.archive_path,
+                                                  entry.payload)
+                    if success:
+                        self.spool.remove(entry)
+                        self.sent.append(entry.entry_id)
+                    else:
+                        self.spool.mark_failed(entry, error)
+        finally:
+            lock.close()
+
+        return False
@@ -0,0 +1,211 @@
+# streaming.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Pipes the report archive into the upload while it is being built.
+
+
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+
+# Size the pipe hands chunks to the upload at, at most
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StreamPipe(object):
+    """Bounded, thread safe pipe of bytes from the archive to the upload.
+
+    The archive writer calls :meth:`write` and :meth:`close` from one thread
+    while the upload iterates over the pipe in another. Writes block when
+    the upload falls behind so that memory use stays bounded.
+
+    Args:
+        max_chunks (int): Number of writes buffered before blocking
+    """
+
+    _EOF = object()
+    _POLL_SECONDS = 0.5
+
+    def __init__(self, max_chunks=64):
+        self.failed = False
+        self._queue = Queue(max_chunks)
+        self._abandoned = threading.Event()
+
+    def _put(self, item):
+        while not self._abandoned.is_set():
+            try:
+                self._queue.put(item, timeout=self._POLL_SECONDS)
+                return
+            except Full:
+                continue
+
+    def write(self, data):
+        if data:
+            self._put(data)
+
+    def close(self, failed=False):
+        """Signal the upload that there is no more data.
+
+        Args:
+            failed (bool): Whether the archive could not be built, the
+                upload is then aborted with an error
+        """
+        self.failed = failed
+        self._put(self._EOF)
+
+    def abandon(self):
+        """Stop waiting on the upload, later writes are dropped."""
+        self._abandoned.set()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+
+    def __iter__(self):
+        while True:
+            chunks = [self._queue.get()]
+            size = len(chunks[0]) if chunks[0] is not self._EOF else 0
+
+            # Coalesce what is already there to avoid many tiny chunks
+            while chunks[-1] is not self._EOF and size < STREAM_CHUNK_SIZE:
+                try:
+                    chunk = self._queue.get_nowait()
+                except Empty:
+                    break
+                chunks.append(chunk)
+                if chunk is not self._EOF:
+                    size += len(chunk)
+
+            finished = chunks[-1] is self._EOF
+            if finished:
+                chunks.pop()
+
+            if chunks:
+                yield ''.join(chunks)
+
+            if finished:
+                if self.failed:
+                    raise IOError('The report archive could not be built')
+                return
+
+
+class TeeFile(object):
+    """File-like object writing everything to two destinations."""
+
+    def __init__(self, primary, secondary):
+        self.primary = primary
+        self.secondary = secondary
+
+    def write(self, data):
+        self.primary.write(data)
+        self.secondary.write(data)
+
+    def flush(self):
+        self.primary.flush()
+
+    def tell(self):
+        return self.primary.tell()
+
+
+class UploadProgress(object):
+    """Tracks how much of a report has been uploaded.
+
+    Args:
+        callback (function): Called with this object every time more data
+            is sent and when the upload finishes. It is called from the
+            uploading thread, GUI code should hand over with
+            ``GObject.idle_add``
+
+    Attributes:
+        bytes_sent (int): Number of bytes handed to the connection so far
+        finished (bool): Whether the upload is over
+    """
+
+    def __init__(self, callback=None):
+        self.bytes_sent = 0
+        self.finished = False
+        self.started = time.time()
+        self._callback = callback
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return max(time.time() - self.started, 1e-6)
+
+    @property
+    def rate(self):
+        """float: Average upload rate so far, in bytes per second"""
+        return self.bytes_sent / self.elapsed
+
+    def update(self, sent):
+        # Parallel uploads update it from several threads
+        with self._lock:
+            self.bytes_sent += sent
+        if self._callback:
+            self._callback(self)
+
+    def finish(self):
+        self.finished = True
+        if self._callback:
+            self._callback(self)
+
+    def __repr__(self):
+        return 'UploadProgress({} bytes, {:.0f} B/s)'.format(
+            self.bytes_sent, self.rate
+        )
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def multipart_content_type(boundary):
+    return 'multipart/form-data; boundary={}'.format(boundary)
+
+
+def multipart_stream(boundary, fields, file_field, filename, file_chunks,
+                     progress=None):
+    """Generate a ``multipart/form-data`` body without holding it in memory.
+
+    It is given to ``requests`` as ``data`` so the body is sent with chunked
+    transfer encoding as it is produced.
+
+    Args:
+        boundary (str): The multipart boundary, see
+            :func:`multipart_content_type` for the matching header
+        fields (dict): Plain form fields, sent first
+        file_field (str): Name of the form field holding the file
+        filename (str): Name of the file sent to the server
+        file_chunks (iterable): Produces the contents of the file
+        progress (UploadProgress): Updated as the body is consumed
+
+    Yields:
+        str: Pieces of the request body
+    """
+    def sent(chunk):
+        if progress is not None:
+            progress.update(len(chunk))
+        return chunk
+
+    for name, value in sorted(fields.iteritems()):
+        yield sent(
+            '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'
+            .format(boundary, name, _encode(value or ''))
+        )
+
+    yield sent(
+        '--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+        'Content-Type: application/octet-stream\r\n\r\n'
+        .format(boundary, file_field, filename)
+    )
+
+    for chunk in file_chunks:
+        yield sent(chunk)
+
+    yield sent('\r\n--{}--\r\n'.format(boundary))
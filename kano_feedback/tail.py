@@ -0,0 +1,142 @@
+# tail.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Bounded readers for the end of large log files.
+
+
+import io
+import os
+
+
+TRUNCATION_MARKER = '[... {} bytes truncated by kano-feedback ...]\n'
+BLOCK_SIZE = 8 * 1024
+
+
+def lines_offset(file_obj, max_lines, start=0, end=None,
+                 block_size=BLOCK_SIZE):
+    """Find where the last lines of a file begin.
+
+    The file is read backwards a block at a time, so only the end of it is
+    ever read.
+
+    Args:
+        file_obj (file): The file, opened for reading
+        max_lines (int): Number of lines to keep
+        start (int): Offset not to go back beyond
+        end (int): Offset where the file ends, defaults to its size
+
+    Returns:
+        int: The offset of the first of the last ``max_lines`` lines
+    """
+    if end is None:
+        end = os.fstat(file_obj.fileno()).st_size
+
+    if end <= start:
+        return end
+
+    # the final newline ends the last line rather than starting a new one
+    file_obj.seek(end - 1)
+    newlines_left = max_lines + (1 if file_obj.read(1) == '\n' else 0)
+
+    pos = end
+    while pos > start:
+        read_size = min(block_size, pos - start)
+        pos -= read_size
+        file_obj.seek(pos)
+        block = file_obj.read(read_size)
+
+        idx = len(block)
+        while True:
+            idx = block.rfind('\n', 0, idx)
+            if idx < 0:
+                break
+
+            newlines_left -= 1
+            if newlines_left <= 0:
+                return pos + idx + 1
+
+    return start
+
+
+def read_tail(file_obj, max_bytes=None, max_lines=None, start=0, end=None):
+    """Read the end of a file, without loading the rest of it.
+
+    When the file is cut at ``max_bytes``, the partial line at the cut is
+    dropped too.
+
+    Args:
+        file_obj (file): The file, opened for reading
+        max_bytes (int): Most bytes to read, ``None`` for no limit
+        max_lines (int): Most lines to read, ``None`` for no limit
+        start (int): Offset to read from at the earliest
+        end (int): Offset to read up to, defaults to the size of the file
+
+    Returns:
+        str, int: The contents read and the number of bytes left out
+        between ``start`` and them
+    """
+    if end is None:
+        end = os.fstat(file_obj.fileno()).st_size
+
+    begin = min(start, end)
+    if max_lines is not None:
+        begin = max(begin, lines_offset(file_obj, max_lines, begin, end))
+
+    if max_bytes is not None and end - begin > max_bytes:
+        begin = end - max_bytes
+        file_obj.seek(begin - 1)
+        if file_obj.read(1) != '\n':
+            partial = file_obj.readline(end - begin)
+            if partial.endswith('\n'):
+                begin += len(partial)
+
+    file_obj.seek(begin)
+    contents = file_obj.read(end - begin)
+
+    return contents, begin - min(start, end)
+
+
+def with_marker(contents, truncated):
+    """Prefix the contents with :const:`TRUNCATION_MARKER` if truncated."""
+    if not truncated:
+        return contents
+
+    return TRUNCATION_MARKER.format(truncated) + contents
+
+
+def tail_file(path, max_bytes=None, max_lines=None):
+    """Get the end of a file, marking where it was truncated.
+
+    Args:
+        path (str): The file to read
+        max_bytes (int): Most bytes to read, ``None`` for no limit
+        max_lines (int): Most lines to read, ``None`` for no limit
+
+    Returns:
+        str: The end of the file, starting with :const:`TRUNCATION_MARKER`
+        if the beginning was left out
+    """
+    with open(path, 'r') as file_obj:
+        return with_marker(*read_tail(file_obj, max_bytes=max_bytes,
+                                      max_lines=max_lines))
+
+
+def tail_contents(contents, max_bytes):
+    """Keep the end of already collected contents, marking where they were
+    truncated, see :func:`read_tail`.
+
+    Args:
+        contents (str): The contents, unicode is encoded as UTF-8
+        max_bytes (int): Most bytes to keep
+
+    Returns:
+        str: The end of the contents, starting with
+        :const:`TRUNCATION_MARKER` if the beginning was left out
+    """
+    if isinstance(contents, unicode):
+        contents = contents.encode('utf-8')
+
+    return with_marker(*read_tail(io.BytesIO(contents), max_bytes=max_bytes,
+                                  end=len(contents)))
@@ -0,0 +1,172 @@
+# task_pool.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Runs independent tasks concurrently on a bounded pool of threads.
+#
+# The data collectors of a report, the blocks of the parallel gzip writer
+# and the chunks of a resumable upload all go through it.
+
+
+import multiprocessing
+import threading
+import time
+import traceback
+from Queue import Queue, Empty
+
+
+def default_pool_size():
+    """Get the number of workers to use when none is given.
+
+    Returns:
+        int: The number of cores on the board, at least 1
+    """
+    try:
+        return max(1, multiprocessing.cpu_count())
+    except NotImplementedError:
+        return 1
+
+
+class TaskResult(object):
+    """The outcome of running a single task.
+
+    Attributes:
+        name (str): The name the task was submitted with
+        contents: Whatever the task returned, ``None`` if it failed
+        error (str): The formatted traceback if the task raised
+        duration (float): Wall time spent in the task, in seconds
+    """
+
+    def __init__(self, name, contents=None, error=None, duration=0.0):
+        self.name = name
+        self.contents = contents
+        self.error = error
+        self.duration = duration
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def __repr__(self):
+        return 'TaskResult({}, failed={})'.format(self.name, self.failed)
+
+
+class SharedResource(object):
+    """A value several collectors of a report need, computed only once.
+
+    The first collector calling :meth:`get` computes it, the others wait
+    for it. When computing it fails, the next call tries again.
+
+    Args:
+        factory (function): Computes the value, called without arguments
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._done = False
+
+    def get(self):
+        with self._lock:
+            if not self._done:
+                self._value = self._factory()
+                self._done = True
+
+        return self._value
+
+
+def _run_one(name, task_fn):
+    start = time.time()
+    try:
+        contents = task_fn()
+        error = None
+    except Exception:
+        contents = None
+        error = traceback.format_exc()
+
+    return TaskResult(name, contents, error, time.time() - start)
+
+
+def iter_tasks(jobs, max_workers=None, costs=None):
+    """Run independent tasks at the same time on a bounded thread pool.
+
+    The tasks spend most of their time waiting on forked commands, disk
+    reads, the network or zlib, which all release the GIL, so threads are
+    enough to overlap them. A failing task does not affect the others, its
+    traceback is kept in its result instead.
+
+    Results are yielded in the order of ``jobs``, each one as soon as it and
+    all the ones before it are done, so the caller can start working on
+    them while the remaining tasks are still running.
+
+    Args:
+        jobs (list): Tuples of ``(name, callable)``, the callables take no
+            arguments
+        max_workers (int): Maximum number of tasks running at once.
+            Defaults to :func:`default_pool_size`
+        costs (list): Expected cost of each job. When given, the most
+            expensive jobs are started first so that they do not end up
+            running alone once the cheap ones are done
+
+    Yields:
+        TaskResult: The result of each job, in the same order as
+        ``jobs`` regardless of the order in which they finished
+    """
+    if not jobs:
+        return
+
+    if max_workers is None:
+        max_workers = default_pool_size()
+    max_workers = max(1, min(max_workers, len(jobs)))
+
+    if max_workers == 1:
+        for name, task_fn in jobs:
+            yield _run_one(name, task_fn)
+        return
+
+    start_order = range(len(jobs))
+    if costs is not None:
+        # sorted() is stable, equal costs are started in submission order
+        start_order = sorted(start_order, key=lambda idx: -costs[idx])
+
+    results = [None] * len(jobs)
+    finished = threading.Condition()
+    pending = Queue()
+    for idx in start_order:
+        pending.put((idx, jobs[idx]))
+
+    def worker():
+        while True:
+            try:
+                idx, (name, task_fn) = pending.get_nowait()
+            except Empty:
+                return
+            result = _run_one(name, task_fn)
+            with finished:
+                results[idx] = result
+                finished.notify_all()
+
+    for idx in xrange(max_workers):
+        thread = threading.Thread(target=worker,
+                                  name='task-{}'.format(idx))
+        thread.daemon = True
+        thread.start()
+
+    for idx in xrange(len(jobs)):
+        with finished:
+            while results[idx] is None:
+                finished.wait()
+        yield results[idx]
+
+
+def run_tasks(jobs, max_workers=None, costs=None):
+    """Run the tasks and wait for all of them to finish.
+
+    See :func:`iter_tasks` for the arguments.
+
+    Returns:
+        list: A :class:`TaskResult` per job, in the same order as ``jobs``
+    """
+    return list(iter_tasks(jobs, max_workers=max_workers, costs=costs))
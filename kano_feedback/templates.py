@@ -0,0 +1,253 @@
+# templates.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Groups the lines of the logs into templates, after the Drain log parser.
+#
+# Logs are often dominated by the same message repeated with different
+# numbers, e.g. a reconnect loop. Each template is reported once with its
+# count, when it was first and last seen and a few of its values, which is
+# much quicker to go through than the logs themselves.
+
+
+import re
+
+
+# The parameters of a template
+WILDCARD = '<*>'
+
+# Tokens holding a digit are taken as parameters straight away
+VARIABLE_TOKEN_RE = re.compile(r'\d')
+
+SYSLOG_LINE_RE = re.compile(
+    r'^(\w{3} [ \d]\d \d\d:\d\d:\d\d) \S+ ([^:\[]+)(?:\[\d+\])?: (.*)$'
+)
+XORG_LINE_RE = re.compile(r'^\[\s*(\d+\.\d+)\] (.*)$')
+APP_LOG_LINE_RE = re.compile(r'^(\d{4}-\d\d-\d\dT\S+) (\S+ \S+: .*)$')
+
+
+def parse_syslog_line(line):
+    """Split a line of syslog.txt into its time and message, dropping the
+    host name and the PID."""
+    match = SYSLOG_LINE_RE.match(line)
+    if not match:
+        return None
+
+    stamp, ident, message = match.groups()
+    return stamp, '{}: {}'.format(ident, message)
+
+
+def parse_xorg_line(line):
+    """Split a line of the Xorg log into its time, from the start of the
+    server, and message."""
+    match = XORG_LINE_RE.match(line)
+    return match.groups() if match else None
+
+
+def parse_app_log_line(line):
+    """Split a line of app-logs.txt into its time and message."""
+    match = APP_LOG_LINE_RE.match(line)
+    return match.groups() if match else None
+
+
+# The members of a report which are mined, with how to parse their lines
+LINE_PARSERS = {
+    'syslog.txt': parse_syslog_line,
+    'xorg-log.txt': parse_xorg_line,
+    'app-logs.txt': parse_app_log_line,
+}
+
+
+class Template(object):
+    """A group of similar log lines.
+
+    Attributes:
+        tokens (list): The words of the template, :const:`WILDCARD` where
+            the lines differ
+        count (int): Number of lines in the group
+        first (str): Time of the first line
+        last (str): Time of the last line
+        samples (list): The parameters of the first distinct lines
+    """
+
+    def __init__(self, tokens, stamp):
+        self.tokens = list(tokens)
+        self.count = 0
+        self.first = stamp
+        self.last = stamp
+        self.samples = []
+
+    def similarity(self, tokens):
+        """Get the share of the words of a line matching the template."""
+        same = sum(
+            1 for template_token, token in zip(self.tokens, tokens)
+            if template_token == token
+        )
+        return float(same) / len(tokens)
+
+    def add(self, tokens, raw_tokens, stamp, max_samples):
+        self.tokens = [
+            template_token if template_token == token else WILDCARD
+            for template_token, token in zip(self.tokens, tokens)
+        ]
+        self.count += 1
+        self.last = stamp
+
+        if len(self.samples) < max_samples:
+            values = tuple(
+                raw for raw, template_token in zip(raw_tokens, self.tokens)
+                if template_token == WILDCARD
+            )
+            if values and values not in self.samples:
+                self.samples.append(values)
+
+    def __str__(self):
+        return ' '.join(self.tokens)
+
+
+class TemplateMiner(object):
+    """Groups log messages into templates in a single pass.
+
+    As in Drain, messages are sorted into a fixed depth tree by their number
+    of words and their first words, then matched against the few templates
+    of their leaf. The work per message is bounded, so mining is linear in
+    the size of the logs.
+
+    Args:
+        similarity (float): Share of matching words for a message to join a
+            template
+        depth (int): Number of leading words sorting the messages
+        max_templates (int): Templates per leaf of the tree, further
+            messages join the closest template
+        max_samples (int): Number of sample parameters kept per template
+    """
+
+    def __init__(self, similarity=0.5, depth=2, max_templates=100,
+                 max_samples=3):
+        self.similarity = similarity
+        self.depth = depth
+        self.max_templates = max_templates
+        self.max_samples = max_samples
+        self.lines = 0
+        self._leaves = {}
+        self._templates = []
+
+    def add(self, message, stamp=None):
+        """Add a message to its template.
+
+        Args:
+            message (str): The message, without its time
+            stamp (str): When the message was logged
+        """
+        raw_tokens = message.split()
+        if not raw_tokens:
+            return
+
+        tokens = [
+            WILDCARD if VARIABLE_TOKEN_RE.search(token) else token
+            for token in raw_tokens
+        ]
+        leaf_key = (len(tokens),) + tuple(tokens[:self.depth])
+        leaf = self._leaves.setdefault(leaf_key, [])
+
+        best, best_similarity = None, -1
+        for template in leaf:
+            template_similarity = template.similarity(tokens)
+            if template_similarity > best_similarity:
+                best, best_similarity = template, template_similarity
+
+        if best is None or (best_similarity < self.similarity and
+                            len(leaf) < self.max_templates):
+            best = Template(tokens, stamp)
+            leaf.append(best)
+            self._templates.append(best)
+
+        best.add(tokens, raw_tokens, stamp, self.max_samples)
+        self.lines += 1
+
+    def templates(self):
+        """Get the templates, the most frequent first."""
+        return sorted(self._templates, key=lambda template: -template.count)
+
+    def render(self):
+        """Render the templates with their count, first and last time and
+        sample parameters.
+
+        Returns:
+            str: One line per template, followed by its samples
+        """
+        lines = []
+        for template in self.templates():
+            lines.append('{:>7}  {} .. {}  {}'.format(
+                template.count, template.first, template.last, template
+            ))
+            if template.samples:
+                lines.append('         e.g. {}'.format(' | '.join(
+                    ' '.join(values) for values in template.samples
+                )))
+
+        return ''.join(line + '\n' for line in lines)
+
+
+class LogSummary(object):
+    """Mines the templates of the logs of a report, one miner per log.
+
+    Args:
+        parsers (dict): For the name of each member mined, the function
+            splitting its lines into their time and message. Defaults to
+            :const:`LINE_PARSERS`
+        miner_args: Passed on to :class:`TemplateMiner`
+    """
+
+    def __init__(self, parsers=None, **miner_args):
+        self.parsers = parsers if parsers is not None else LINE_PARSERS
+        self.miner_args = miner_args
+        self.miners = {}
+
+    def add_member(self, member):
+        """Mine a member of the report, if it is a log of interest.
+
+        Args:
+            member (dict): The ``{'name', 'contents' or 'path'}`` member
+        """
+        parser = self.parsers.get(member['name'])
+        if parser is None:
+            return
+
+        miner = self.miners.setdefault(
+            member['name'], TemplateMiner(**self.miner_args)
+        )
+        if member.get('path'):
+            with open(member['path'], 'r') as log_f:
+                self._mine_lines(miner, parser, log_f)
+        elif member.get('contents'):
+            self._mine_lines(miner, parser,
+                             member['contents'].splitlines())
+
+    @staticmethod
+    def _mine_lines(miner, parser, lines):
+        for line in lines:
+            parsed = parser(line.rstrip('\n'))
+            if parsed:
+                stamp, message = parsed
+                miner.add(message, stamp)
+
+    def render(self):
+        """Render the templates of every log mined.
+
+        Returns:
+            str: A section per log, empty if nothing was mined
+        """
+        sections = []
+        for name in sorted(self.miners):
+            miner = self.miners[name]
+            if not miner.lines:
+                continue
+
+            templates = miner.templates()
+            sections.append('== {}: {} lines, {} templates ==\n{}'.format(
+                name, miner.lines, len(templates), miner.render()
+            ))
+
+        return '\n'.join(sections)
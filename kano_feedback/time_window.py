@@ -0,0 +1,222 @@
+# time_window.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Restricts the logs gathered to a window of time around an incident.
+#
+# Timestamped logs are in chronological order, so the window is found by
+# bisecting the file on disk, a few reads whatever the size of the log.
+
+
+import json
+import re
+import time
+
+
+TIME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+]
+RELATIVE_TIME_RE = re.compile(r'^(\d+)([smhd])$')
+RELATIVE_TIME_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# As written by journalctl --since and --until
+JOURNAL_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DPKG_LOG_TIME_RE = re.compile(r'^(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d) ')
+
+
+def parse_time(value, now=None):
+    """Parse a time given on the command line.
+
+    Args:
+        value (str): A local time, e.g. ``2019-06-01 14:30``, or a time
+            relative to now, e.g. ``10m`` for 10 minutes ago. The units are
+            s, m, h and d
+        now (float): The current time, for relative times
+
+    Returns:
+        float: The time as a UNIX timestamp
+
+    Raises:
+        ValueError: If the value is not in one of the supported formats
+    """
+    value = value.strip()
+    relative = RELATIVE_TIME_RE.match(value)
+    if relative:
+        now = now if now is not None else time.time()
+        amount, unit = relative.groups()
+        return now - int(amount) * RELATIVE_TIME_UNITS[unit]
+
+    for time_format in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except ValueError:
+            continue
+
+    raise ValueError('Unsupported time: {}'.format(value))
+
+
+def dpkg_log_time(line):
+    """Get the time of a line of dpkg.log, ``None`` if it has none."""
+    # strptime is not safe to call from the collector threads
+    match = DPKG_LOG_TIME_RE.match(line)
+    if not match:
+        return None
+
+    return time.mktime(
+        tuple(int(field) for field in match.groups()) + (0, 0, -1)
+    )
+
+
+def json_log_time(line):
+    """Get the time of an entry of a Kano JSON log, ``None`` if it has
+    none."""
+    try:
+        return float(json.loads(line)['time'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _next_stamped_line(log_f, pos, start, end, time_fn):
+    """Find the first line with a time beginning at or after ``pos``.
+
+    Returns:
+        tuple: The offset of the line and its time, ``end`` and ``None`` if
+        there is no such line
+    """
+    if pos > start:
+        # finish the line pos is in, unless pos begins a line
+        log_f.seek(pos - 1)
+        log_f.readline()
+    else:
+        log_f.seek(start)
+
+    while True:
+        line_start = log_f.tell()
+        if line_start >= end:
+            return end, None
+
+        stamp = time_fn(log_f.readline())
+        if stamp is not None:
+            return line_start, stamp
+
+
+def bisect_log(log_f, timestamp, time_fn, start=0, end=None, after=False):
+    """Find where a time falls in a chronological log, in O(log n) reads.
+
+    Lines without a time, e.g. the continuation of a multiline entry, are
+    skipped over. A clock change while logging, common on the Pi which has
+    no real time clock, only makes the result approximate.
+
+    Args:
+        log_f (file): The log, opened for reading
+        timestamp (float): The time to look for
+        time_fn (function): Gets the time of a line, ``None`` if it has none
+        start (int): Offset where the search starts
+        end (int): Offset where the search stops. Defaults to the size of
+            the file
+        after (bool): Whether to find the first line strictly after
+            ``timestamp`` rather than at or after it
+
+    Returns:
+        int: The offset of the first line at or after ``timestamp``, ``end``
+        if there is none
+    """
+    if end is None:
+        log_f.seek(0, 2)
+        end = log_f.tell()
+
+    low, high = start, end
+    while low < high:
+        middle = (low + high) // 2
+        dummy, stamp = _next_stamped_line(log_f, middle, start, end, time_fn)
+        if stamp is None or stamp > timestamp or \
+                (stamp == timestamp and not after):
+            high = middle
+        else:
+            low = middle + 1
+
+    return _next_stamped_line(log_f, low, start, end, time_fn)[0]
+
+
+class TimeWindow(object):
+    """A window of time the logs are restricted to.
+
+    An empty window, with neither bound, keeps everything and is false.
+
+    Args:
+        since (float): UNIX timestamp of the start of the window, included
+        until (float): UNIX timestamp of the end of the window, included
+    """
+
+    def __init__(self, since=None, until=None):
+        self.since = since
+        self.until = until
+
+    def __nonzero__(self):
+        return self.since is not None or self.until is not None
+
+    def contains(self, timestamp):
+        if self.since is not None and timestamp < self.since:
+            return False
+
+        if self.until is not None and timestamp > self.until:
+            return False
+
+        return True
+
+    def ends_before(self, mtime):
+        """Whether a log last modified at ``mtime`` ended before the window.
+        """
+        return self.since is not None and mtime < self.since
+
+    def span(self, log_f, time_fn, start=0, end=None):
+        """Find the part of a chronological log within the window.
+
+        See :func:`bisect_log` for the arguments.
+
+        Returns:
+            tuple: The offsets where the window begins and ends
+        """
+        if end is None:
+            log_f.seek(0, 2)
+            end = log_f.tell()
+
+        if self.since is not None:
+            start = bisect_log(log_f, self.since, time_fn, start, end)
+        if self.until is not None:
+            end = bisect_log(log_f, self.until, time_fn, start, end,
+                             after=True)
+
+        return start, end
+
+    def journalctl_args(self):
+        """Get the journalctl options restricting it to the window.
+
+        Returns:
+            list: The options, already quoted for the shell
+        """
+        args = []
+        for option, timestamp in [('since', self.since),
+                                  ('until', self.until)]:
+            if timestamp is not None:
+                args.append("--{}='{}'".format(option, time.strftime(
+                    JOURNAL_TIME_FORMAT, time.localtime(timestamp)
+                )))
+
+        return args
+
+    def metadata(self):
+        """Get the window to record in the report, nothing if it is empty.
+        """
+        metadata = {}
+        if self.since is not None:
+            metadata['since'] = self.since
+        if self.until is not None:
+            metadata['until'] = self.until
+
+        return metadata
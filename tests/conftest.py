@@ -13,6 +13,7 @@
 from tests.fixtures.apt_sources import *
 from tests.fixtures.console_mode import *
 from tests.fixtures.logs import *
+from tests.fixtures.upload_server import *
 
 from tests.fixtures.patch_toolset_paths import *
 from tests.fixtures.patch_profile_paths import *
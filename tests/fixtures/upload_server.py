@@ -0,0 +1,174 @@
+#
+# upload_server.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Local stand-in for the chunked feedback upload API, to test offline.
+#
+# It can also be run on its own and used with request functions built by
+# make_request_fn():
+#
+#     python -m tests.fixtures.upload_server [port]
+#
+
+
+import cgi
+import hashlib
+import json
+import re
+import sys
+import threading
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import pytest
+import requests
+
+
+class UploadStore(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.completed = []
+        self.chunk_puts = 0
+
+        # Number of chunk uploads to reject, to simulate a dropped link
+        self.fail_next_chunks = 0
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    CHUNK_RE = re.compile(r'^/feedback/uploads/(\w+)/chunks/(\d+)$')
+    STATUS_RE = re.compile(r'^/feedback/uploads/(\w+)$')
+    COMPLETE_RE = re.compile(r'^/feedback/uploads/(\w+)/complete$')
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _reply(self, code, data=None):
+        body = json.dumps(data or {})
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path == '/feedback/uploads':
+            session = json.loads(self._body())
+            upload_id = uuid.uuid4().hex
+            session['chunks'] = {}
+            with self.store.lock:
+                self.store.uploads[upload_id] = session
+            return self._reply(200, {'upload_id': upload_id})
+
+        match = self.COMPLETE_RE.match(self.path)
+        if not match or match.group(1) not in self.store.uploads:
+            return self._reply(404)
+
+        session = self.store.uploads[match.group(1)]
+        data = ''.join(
+            chunk for dummy, chunk in sorted(session['chunks'].iteritems())
+        )
+        if len(data) != session['size'] or \
+                hashlib.sha256(data).hexdigest() != session['sha256']:
+            return self._reply(409, {'error': 'Incomplete upload'})
+
+        form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                environ={'REQUEST_METHOD': 'POST'})
+        with self.store.lock:
+            self.store.completed.append({
+                'fields': dict((key, form.getvalue(key)) for key in form),
+                'data': data,
+            })
+            del self.store.uploads[match.group(1)]
+
+        return self._reply(200, {'success': True})
+
+    def do_GET(self):
+        match = self.STATUS_RE.match(self.path)
+        if not match or match.group(1) not in self.store.uploads:
+            return self._reply(404)
+
+        session = self.store.uploads[match.group(1)]
+        return self._reply(200, {'received': sorted(session['chunks'])})
+
+    def do_PUT(self):
+        match = self.CHUNK_RE.match(self.path)
+        body = self._body()
+        if not match or match.group(1) not in self.store.uploads:
+            return self._reply(404)
+
+        with self.store.lock:
+            self.store.chunk_puts += 1
+            if self.store.fail_next_chunks > 0:
+                self.store.fail_next_chunks -= 1
+                return self._reply(503)
+
+        if hashlib.sha256(body).hexdigest() != \
+                self.headers.get('X-Chunk-SHA256'):
+            return self._reply(400, {'error': 'Checksum mismatch'})
+
+        session = self.store.uploads[match.group(1)]
+        with self.store.lock:
+            session['chunks'][int(match.group(2))] = body
+
+        return self._reply(200, {'received': int(match.group(2))})
+
+
+class UploadServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), UploadHandler)
+        self.store = UploadStore()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+def make_request_fn(base_url):
+    """Build a function with the interface of ``request_wrapper`` talking to
+    ``base_url`` instead of the Kano World API."""
+
+    def request_fn(method, endpoint, data=None, headers=None, **kwargs):
+        try:
+            res = getattr(requests, method)(
+                base_url + endpoint, data=data, headers=headers
+            )
+        except requests.exceptions.ConnectionError:
+            return False, 'Connection error', None
+
+        if res.ok:
+            return True, None, res.json()
+        return False, res.text, None
+
+    return request_fn
+
+
+@pytest.fixture(scope='function')
+def upload_server():
+    server = UploadServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    server = UploadServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
+    print 'Serving the upload API on {}'.format(server.url)
+    server.serve_forever()
@@ -0,0 +1,92 @@
+#
+# test_app_logs.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests exporting the Kano app logs in a single pass
+#
+
+
+import datetime
+import io
+import json
+
+import pytest
+
+from kano_feedback.app_logs import TimestampFormatter, export_app_logs
+from kano_feedback.log_state import LogState
+
+
+START = 1559390400.0
+
+
+def _app_log(log_dir, name, entries):
+    log_dir.ensure(dir=True)
+    log_dir.join(name).write(''.join(
+        json.dumps(entry) + '\n' for entry in entries
+    ))
+
+
+def _entry(offset, message):
+    return {'time': START + offset, 'level': 'info', 'pid': 42,
+            'message': message}
+
+
+@pytest.mark.parametrize('timestamp', [
+    START, START + 0.5, START + 0.1234567, START + 0.9999996, START + 61.25,
+])
+def test_timestamps_as_isoformat(timestamp):
+    formatter = TimestampFormatter()
+    formatter.format(START + 0.25)
+
+    assert formatter.format(timestamp) == \
+        datetime.datetime.fromtimestamp(timestamp).isoformat()
+
+
+def test_raw_and_json_in_one_pass(tmpdir):
+    log_dir = tmpdir.join('kano')
+    _app_log(log_dir, 'kano-updater.log', [
+        _entry(0, 'Checking for updates'),
+        _entry(1.5, 'Return value: 0'),
+    ])
+    log_dir.join('kano-updater.log').write('not json\n', mode='a')
+    raw_f = io.BytesIO()
+    json_f = io.BytesIO()
+
+    assert export_app_logs(raw_f, json_f, log_dirs=[str(log_dir)]) == 2
+
+    log_file = str(log_dir.join('kano-updater.log'))
+    time_0 = datetime.datetime.fromtimestamp(START).isoformat()
+    time_1 = datetime.datetime.fromtimestamp(START + 1.5).isoformat()
+    assert raw_f.getvalue() == (
+        'LOGFILE: {}\n'.format(log_file) +
+        '{} kano-updater info: Checking for updates\n'.format(time_0) +
+        '{} kano-updater info: Return value: 0\n'.format(time_1)
+    )
+    entries = [json.loads(line) for line in json_f.getvalue().splitlines()]
+    assert entries == [
+        dict(_entry(0, 'Checking for updates'), log_file=log_file),
+        dict(_entry(1.5, 'Return value: 0'), log_file=log_file),
+    ]
+    assert ', ' not in json_f.getvalue()
+
+
+def test_incremental(tmpdir):
+    log_dir = tmpdir.join('kano')
+    _app_log(log_dir, 'kano-feedback.log', [_entry(0, 'first')])
+    state_path = str(tmpdir.join('state.json'))
+
+    first = LogState(state_path, incremental=True)
+    export_app_logs(io.BytesIO(), io.BytesIO(), log_dirs=[str(log_dir)],
+                    log_state=first)
+    first.commit()
+
+    _app_log(log_dir, 'kano-feedback.log',
+             [_entry(0, 'first'), _entry(5, 'second')])
+    json_f = io.BytesIO()
+    export_app_logs(io.BytesIO(), json_f, log_dirs=[str(log_dir)],
+                    log_state=LogState(state_path, incremental=True))
+
+    assert [json.loads(line)['message']
+            for line in json_f.getvalue().splitlines()] == ['second']
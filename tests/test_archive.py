@@ -0,0 +1,144 @@
+#
+# test_archive.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that the report archive is built and compressed correctly
+#
+
+
+import io
+import os
+import tarfile
+import zlib
+
+import pytest
+
+from kano_feedback.archive import ArchiveBuilder, Compression, \
+    archive_extension, available_compressions
+from tests.fixtures.helpers import random_file
+
+
+MEMBERS = [
+    ('metadata.json', random_file()),
+    ('syslog.txt', random_file() * 50),
+    ('empty.txt', ''),
+]
+
+
+@pytest.mark.parametrize('compression', available_compressions())
+def test_archive_roundtrip(tmpdir, compression):
+    archive_path = str(tmpdir.join('bug_report.tar.gz'))
+    on_disk = tmpdir.join('screenshot.png')
+    on_disk.write(random_file())
+
+    with ArchiveBuilder(archive_path, compression=compression) as archive:
+        for name, contents in MEMBERS:
+            archive.add_contents(name, contents)
+        assert archive.add_file('screenshot.png', str(on_disk))
+        assert not archive.add_file('missing.txt', str(tmpdir.join('nope')))
+
+    archive_f = archive.close()
+
+    with tarfile.open(mode='r', fileobj=archive_f) as tar:
+        assert tar.getnames() == \
+            [name for name, _ in MEMBERS] + ['screenshot.png']
+        for name, contents in MEMBERS:
+            assert tar.extractfile(name).read() == contents
+        assert tar.extractfile('screenshot.png').read() == on_disk.read()
+
+    assert archive.stats['compression'] == compression
+    assert archive.stats['compressed_bytes'] == os.path.getsize(archive_path)
+    if compression != Compression.NONE:
+        assert archive.stats['compressed_bytes'] < archive.stats['raw_bytes']
+
+
+@pytest.mark.parametrize('change', [-6, 6])
+def test_add_file_changing_size(tmpdir, change):
+    archive_path = str(tmpdir.join('bug_report.tar'))
+    log = tmpdir.join('syslog.txt')
+    log.write('line 1\nline 2\n')
+
+    with ArchiveBuilder(archive_path, compression=Compression.NONE) as archive:
+        gettarinfo = archive._tar.gettarinfo
+
+        def resize(*args, **kwargs):
+            info = gettarinfo(*args, **kwargs)
+            # the file is written to between its header and its copy
+            log.write('line 1\n' if change < 0 else 'line 1\nline 2\nmore\n')
+            return info
+
+        archive._tar.gettarinfo = resize
+        assert archive.add_file('syslog.txt', str(log))
+        archive.add_contents('metadata.json', '{}')
+
+    with tarfile.open(mode='r', fileobj=archive.close()) as tar:
+        assert tar.getnames() == ['syslog.txt', 'metadata.json']
+        expected = 'line 1\n\0\0\0\0\0\0\0' if change < 0 else \
+            'line 1\nline 2\n'
+        assert tar.extractfile('syslog.txt').read() == expected
+        assert tar.extractfile('metadata.json').read() == '{}'
+
+
+def test_flush_sends_members_added_so_far(tmpdir):
+    archive_path = str(tmpdir.join('bug_report.tar.gz'))
+    sent = io.BytesIO()
+
+    with ArchiveBuilder(archive_path, compression=Compression.GZIP,
+                        tee=sent) as archive:
+        archive.add_contents('metadata.json', '{"title": "Test"}')
+        archive.flush()
+
+        # the member went out whole, before the end of the archive
+        raw = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+            sent.getvalue()
+        )
+        assert len(raw) == 2 * tarfile.BLOCKSIZE
+        assert raw[tarfile.BLOCKSIZE:].startswith('{"title": "Test"}')
+
+        archive.add_contents('syslog.txt', 'logs')
+
+    with tarfile.open(mode='r', fileobj=archive.close()) as tar:
+        assert tar.getnames() == ['metadata.json', 'syslog.txt']
+        assert tar.extractfile('syslog.txt').read() == 'logs'
+
+
+def test_parallel_gzip_writes_multiple_members(tmpdir, monkeypatch):
+    import kano_feedback.archive as archive_module
+    monkeypatch.setattr(archive_module, 'PGZIP_BLOCK_SIZE', 4096)
+
+    archive_path = str(tmpdir.join('bug_report.tar.gz'))
+    contents = random_file() * 500
+
+    with ArchiveBuilder(archive_path, compression=Compression.PGZIP,
+                        workers=4) as archive:
+        archive.add_contents('big.txt', contents)
+
+    with open(archive_path, 'rb') as archive_f:
+        data = archive_f.read()
+    # Every block starts with the gzip magic number
+    assert data.count(b'\x1f\x8b\x08') > 1
+
+    with tarfile.open(archive_path, mode='r:gz') as tar:
+        assert tar.extractfile('big.txt').read() == contents
+
+
+@pytest.mark.parametrize('compression, level', [
+    ('zip', None),
+    (Compression.GZIP, 0),
+    (Compression.BZ2, 10),
+])
+def test_invalid_compression(tmpdir, compression, level):
+    with pytest.raises(ValueError):
+        ArchiveBuilder(str(tmpdir.join('archive')), compression=compression,
+                       level=level)
+
+
+def test_archive_extensions():
+    for compression in available_compressions():
+        extension = archive_extension(compression)
+        assert extension.startswith('.tar')
+
+    assert archive_extension(Compression.NONE) == '.tar'
+    assert archive_extension(Compression.BZ2) == '.tar.bz2'
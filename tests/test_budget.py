@@ -0,0 +1,112 @@
+#
+# test_budget.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests fitting the members of a report in a byte budget
+#
+
+
+import os
+
+from kano_feedback.archive import ArchiveBuilder, Compression
+from kano_feedback.budget import DROPPED, KEPT, MIN_TRUNCATED_BYTES, \
+    TRUNCATED, member_size, plan_budget, tar_budget
+from kano_feedback.collectors import Priority
+from kano_feedback.tail import TRUNCATION_MARKER
+
+
+def _member(name, size, priority, truncatable=True):
+    line = 'x' * 99 + '\n'
+    return {
+        'name': name,
+        'contents': line * (size // 100),
+        'priority': priority,
+        'truncatable': truncatable,
+    }
+
+
+def test_most_valuable_first():
+    members = [
+        _member('lsof.txt', 20000, Priority.LOW),
+        _member('syslog.txt', 20000, Priority.NORMAL),
+        _member('edid.dat', 10000, Priority.NORMAL, truncatable=False),
+        _member('dmesg.txt', 5000, Priority.HIGH),
+    ]
+
+    kept, decisions = plan_budget(members, 27000)
+
+    assert [member['name'] for member in kept] == \
+        ['dmesg.txt', 'syslog.txt']
+    actions = dict(
+        (decision['name'], decision['action']) for decision in decisions
+    )
+    assert actions == {
+        'dmesg.txt': KEPT,
+        'syslog.txt': KEPT,
+        'edid.dat': DROPPED,
+        'lsof.txt': DROPPED,
+    }
+    assert sum(decision['included_bytes'] for decision in decisions) <= 27000
+
+
+def test_truncates_to_what_is_left():
+    members = [
+        _member('dmesg.txt', 5000, Priority.HIGH),
+        _member('syslog.txt', 50000, Priority.NORMAL),
+    ]
+
+    kept, decisions = plan_budget(members, 5000 + MIN_TRUNCATED_BYTES * 2)
+
+    assert decisions[1]['action'] == TRUNCATED
+    syslog = kept[1]['contents']
+    assert syslog.startswith(TRUNCATION_MARKER.split('{}')[0])
+    assert syslog.endswith('x' * 99 + '\n')
+    assert len(syslog) <= MIN_TRUNCATED_BYTES * 2
+
+
+def test_truncates_files_from_their_end(tmpdir):
+    log = tmpdir.join('app-logs.txt')
+    log.write(_member('app-logs.txt', 50000, Priority.NORMAL)['contents'])
+    members = [{'name': 'app-logs.txt', 'path': str(log),
+                'priority': Priority.NORMAL, 'truncatable': True}]
+
+    kept, decisions = plan_budget(members, MIN_TRUNCATED_BYTES * 2)
+
+    assert decisions[0]['action'] == TRUNCATED
+    assert not kept[0]['path']
+    assert len(kept[0]['contents']) <= MIN_TRUNCATED_BYTES * 2
+
+
+def test_truncates_unicode_contents():
+    line = u'caf\xe9 ' * 20 + u'\n'
+    members = [{'name': 'syslog.txt', 'contents': line * 1000,
+                'priority': Priority.NORMAL, 'truncatable': True}]
+
+    kept, decisions = plan_budget(members, MIN_TRUNCATED_BYTES * 2)
+
+    assert decisions[0]['bytes'] == len(line.encode('utf-8')) * 1000
+    assert decisions[0]['action'] == TRUNCATED
+    assert kept[0]['contents'].endswith(line.encode('utf-8'))
+    assert len(kept[0]['contents']) <= MIN_TRUNCATED_BYTES * 2
+
+
+def test_tar_fits_in_budget(tmpdir):
+    members = [
+        _member('member-{}.txt'.format(idx), 700 + idx * 37, Priority.NORMAL)
+        for idx in range(40)
+    ] + [_member('x' * 150, 3000, Priority.LOW)]
+    max_bytes = 60000
+
+    kept, decisions = plan_budget(members, tar_budget(max_bytes))
+
+    archive_path = str(tmpdir.join('bug_report.tar'))
+    with ArchiveBuilder(archive_path, compression=Compression.NONE) as archive:
+        for member in kept:
+            archive.add_contents(member['name'], member['contents'])
+    archive.close()
+
+    assert sum(member_size(member) for member in members) < max_bytes
+    assert DROPPED in [decision['action'] for decision in decisions]
+    assert os.path.getsize(archive_path) <= max_bytes
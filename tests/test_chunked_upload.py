@@ -0,0 +1,116 @@
+#
+# test_chunked_upload.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that large reports are uploaded in resumable chunks
+#
+
+
+import os
+
+from kano_feedback.chunked_upload import ChunkedUploader, UploadState
+from kano_feedback.streaming import UploadProgress
+from tests.fixtures.helpers import random_file
+from tests.fixtures.upload_server import make_request_fn
+
+
+CHUNK_SIZE = 1024
+FIELDS = {'subject': 'Test report', 'text': 'Some description'}
+
+
+def _archive(tmpdir):
+    archive = tmpdir.join('bug_report.tar.gz')
+    archive.write(random_file() * 100)
+    return str(archive)
+
+
+def _uploader(server, **kwargs):
+    kwargs.setdefault('chunk_size', CHUNK_SIZE)
+    kwargs.setdefault('retries', 0)
+    return ChunkedUploader(request_fn=make_request_fn(server.url), **kwargs)
+
+
+def test_chunked_upload(tmpdir, upload_server):
+    archive = _archive(tmpdir)
+    progress = UploadProgress()
+
+    success, error = _uploader(upload_server, progress=progress) \
+        .upload(archive, FIELDS)
+
+    assert success, error
+    assert len(upload_server.store.completed) == 1
+    completed = upload_server.store.completed[0]
+    with open(archive, 'rb') as archive_f:
+        assert completed['data'] == archive_f.read()
+    assert completed['fields'] == FIELDS
+
+    assert progress.bytes_sent == os.path.getsize(archive)
+    assert progress.finished
+    assert not os.path.exists(UploadState(archive).path)
+
+
+def test_chunked_upload_resumes(tmpdir, upload_server):
+    archive = _archive(tmpdir)
+    chunk_count = (os.path.getsize(archive) + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+    # The link drops for a few chunks
+    upload_server.store.fail_next_chunks = 3
+    success, dummy = _uploader(upload_server, streams=1) \
+        .upload(archive, FIELDS)
+
+    assert not success
+    assert not upload_server.store.completed
+    assert os.path.exists(UploadState(archive).path)
+
+    # Only the chunks which were not acknowledged are sent again
+    success, error = _uploader(upload_server).upload(archive, FIELDS)
+
+    assert success, error
+    assert upload_server.store.chunk_puts == chunk_count + 3
+    with open(archive, 'rb') as archive_f:
+        assert upload_server.store.completed[0]['data'] == archive_f.read()
+
+
+def test_chunked_upload_retries_chunks(tmpdir, upload_server, monkeypatch):
+    import kano_feedback.chunked_upload as chunked_upload
+    monkeypatch.setattr(chunked_upload, 'RETRY_DELAY', 0)
+
+    archive = _archive(tmpdir)
+    upload_server.store.fail_next_chunks = 2
+
+    success, error = _uploader(upload_server, retries=2) \
+        .upload(archive, FIELDS)
+
+    assert success, error
+
+
+def test_chunked_upload_malformed_session(tmpdir):
+    archive = _archive(tmpdir)
+    uploader = ChunkedUploader(request_fn=lambda *args, **kwargs:
+                               (True, None, {}), chunk_size=CHUNK_SIZE)
+
+    success, error = uploader.upload(archive, FIELDS)
+
+    assert not success
+    assert 'Malformed upload session' in error
+    assert not os.path.exists(UploadState(archive).path)
+
+
+def test_chunked_upload_restarts_changed_archive(tmpdir, upload_server):
+    archive = _archive(tmpdir)
+
+    upload_server.store.fail_next_chunks = 1000
+    assert not _uploader(upload_server).upload(archive, FIELDS)[0]
+    upload_server.store.fail_next_chunks = 0
+
+    # The archive was rebuilt in the meantime, the old session is dropped
+    with open(archive, 'wb') as archive_f:
+        archive_f.write(random_file() * 10)
+
+    success, error = _uploader(upload_server).upload(archive, FIELDS)
+
+    assert success, error
+    with open(archive, 'rb') as archive_f:
+        assert upload_server.store.completed[0]['data'] == archive_f.read()
@@ -0,0 +1,70 @@
+#
+# test_collectors.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that the collection profiles select the expected collectors
+#
+
+
+import pytest
+
+from kano_feedback.collectors import COLLECTORS, PROFILES, DEFAULT_PROFILE, \
+    SHARED_RESOURCES, Cost, Tag, get_profile
+
+
+def test_collector_names_are_unique():
+    names = [collector.name for collector in COLLECTORS]
+    assert len(names) == len(set(names))
+
+
+def test_shared_resources_are_known():
+    for collector in COLLECTORS:
+        assert set(collector.shared) <= set(SHARED_RESOURCES)
+
+
+def test_full_profile_selects_everything():
+    profile = get_profile('full')
+
+    assert profile.select() == COLLECTORS
+    assert profile.coredumps
+
+
+def test_default_profile():
+    assert get_profile() is PROFILES[DEFAULT_PROFILE]
+
+
+def test_unknown_profile():
+    assert get_profile('does-not-exist') is None
+
+
+def test_quick_profile_is_cheap_and_unprivileged():
+    selected = get_profile('quick').select()
+
+    assert selected
+    for collector in selected:
+        assert collector.cost == Cost.CHEAP
+        assert not collector.needs_root
+
+    assert not get_profile('quick').coredumps
+
+
+@pytest.mark.parametrize('profile_name, tag', [
+    ('network', Tag.NETWORK),
+    ('display', Tag.DISPLAY),
+])
+def test_targeted_profiles(profile_name, tag):
+    selected = get_profile(profile_name).select()
+    names = [collector.name for collector in selected]
+
+    for collector in COLLECTORS:
+        if tag in collector.tags or Tag.CORE in collector.tags:
+            assert collector.name in names
+        else:
+            assert collector.name not in names
+
+    # Selection keeps the archive order
+    assert selected == [
+        collector for collector in COLLECTORS if collector in selected
+    ]
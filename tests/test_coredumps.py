@@ -0,0 +1,81 @@
+#
+# test_coredumps.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests picking the coredumps attached to a report
+#
+
+
+import hashlib
+import os
+
+from kano_feedback.coredumps import CoredumpIndex, list_coredumps, \
+    parse_coredump_name, render_crash_summary, select_coredumps
+
+
+def _dump(dump_dir, name, size, mtime):
+    dump = dump_dir.join(name)
+    dump.write('x' * size)
+    os.utime(str(dump), (mtime, mtime))
+
+
+def test_newest_first_within_budget(tmpdir):
+    _dump(tmpdir, 'core-make-11-1000-1000-100.dump.gz', 30, 100)
+    _dump(tmpdir, 'core-xorg-6-0-0-200.dump.gz', 80, 200)
+    _dump(tmpdir, 'core-kano-updater-11-0-0-300.dump.gz', 50, 300)
+    _dump(tmpdir, 'screenshot.png', 10, 400)
+
+    dumps = list_coredumps(str(tmpdir))
+    assert [dump.mtime for dump in dumps] == [300, 200, 100]
+
+    selected, skipped = select_coredumps(dumps, max_bytes=100)
+    assert [dump.mtime for dump in selected] == [300, 100]
+    assert [dump.mtime for dump in skipped] == [200]
+
+    assert select_coredumps(dumps, max_bytes=None) == (dumps, [])
+
+
+def test_no_dump_dir(tmpdir):
+    assert list_coredumps(str(tmpdir.join('missing'))) == []
+
+
+def test_parse_coredump_name():
+    assert parse_coredump_name('core-python2.7-11-1000-1000-300.dump.gz') == {
+        'procname': 'python2.7', 'signal': 11, 'uid': 1000, 'gid': 1000,
+        'time': 300,
+    }
+    assert parse_coredump_name('core-kano-updater-6-0-0-1.dump')['procname'] \
+        == 'kano-updater'
+    assert parse_coredump_name('core-broken.dump.gz') is None
+
+
+def test_index_add_prune_and_stats(tmpdir):
+    index = CoredumpIndex(str(tmpdir.join('index.json')), str(tmpdir))
+    # saved before the index existed
+    _dump(tmpdir, 'core-make-11-1000-1000-100.dump.gz', 10, 100)
+
+    for unixtime in [200, 300]:
+        name = 'core-make-6-1000-1000-{}.dump.gz'.format(unixtime)
+        _dump(tmpdir, name, 10, unixtime)
+        entry = index.add(str(tmpdir.join(name)))
+        assert entry['sha1'] == hashlib.sha1('x' * 10).hexdigest()
+
+    assert [entry['time'] for entry in index.dumps()] == [300, 200, 100]
+    assert index.crashes() == {
+        'make': {'count': 3, 'signals': {'6': 2, '11': 1}, 'last': 300}
+    }
+    assert render_crash_summary(index.crashes()).startswith(
+        'make crashed 3 times (signal 6 x2, signal 11 x1), last at '
+    )
+
+    assert index.prune(keep=1) == [
+        'core-make-6-1000-1000-200.dump.gz',
+        'core-make-11-1000-1000-100.dump.gz',
+    ]
+    assert [dump.name for dump in list_coredumps(index=index)] == \
+        ['core-make-6-1000-1000-300.dump.gz']
+    assert not tmpdir.join('core-make-11-1000-1000-100.dump.gz').exists()
+    # the history survives the pruning
+    assert index.crashes()['make']['count'] == 3
@@ -35,12 +35,11 @@ EXPECTED_FILES = [
     ExpectedFile(filename='packages.txt', fn='get_packages', contents=random_file()),
     ExpectedFile(filename='dmesg.txt', fn='get_dmesg', contents=random_file()),
     ExpectedFile(filename='syslog.txt', fn='get_syslog', contents=random_file()),
-    # ExpectedFile(filename='cmdline.txt', fn='read_file_fn', contents=random_file()),
-    # ExpectedFile(filename='config.txt', fn='read_file_fn', contents=random_file()),
+    ExpectedFile(filename='syslog.json', fn='get_syslog_json', contents=random_file()),
+    ExpectedFile(filename='cmdline.txt', fn='get_cmdline', contents=random_file()),
+    ExpectedFile(filename='config.txt', fn='get_boot_config', contents=random_file()),
     ExpectedFile(filename='wifi-info.txt', fn='get_wifi_info', contents=random_file()),
     ExpectedFile(filename='usbdevices.txt', fn='get_usb_devices', contents=random_file()),
-    ExpectedFile(filename='app-logs.txt', fn='get_app_logs_raw', contents=random_file()),
-    ExpectedFile(filename='app-logs-json.txt', fn='get_app_logs_json', contents=random_file()),
     ExpectedFile(filename='hdmi-info.txt', fn='get_hdmi_info', contents=random_file()),
     ExpectedFile(filename='edid.dat', fn='get_edid', contents=random_file()),
     ExpectedFile(filename='screen-log.txt', fn='get_screen_log', contents=random_file()),
@@ -85,6 +84,7 @@ def test_send_data(mocker, requests_mock, console_mode, monkeypatch, stub):
 
     import kano_feedback.DataSender as DataSender
     monkeypatch.setattr(DataSender, 'get_metadata_archive', get_archive_stub)
+    monkeypatch.setattr(DataSender, 'is_internet', lambda: True)
 
     # Call function under test
     DataSender.send_data(desc, True, subject=title)
@@ -93,7 +93,76 @@ def test_send_data(mocker, requests_mock, console_mode, monkeypatch, stub):
     assert len(post_mock.request_history) == 1
 
     assert get_archive_stub.call_count == 1
-    get_archive_stub.assert_called_with(title=title, desc=desc)
+    get_archive_stub.assert_called_with(
+        title=title, desc=desc, profile='full',
+        compression='gzip', compression_level=None,
+        log_state=mocker.ANY, time_window=mocker.ANY, max_bytes=None,
+        log_templates=False, stream_to=mocker.ANY
+    )
+    assert not get_archive_stub.call_args[1]['log_state'].incremental
+    assert not get_archive_stub.call_args[1]['time_window']
+
+
+def test_send_data_offline_spools(mocker, requests_mock, console_mode,
+                                  monkeypatch, stub):
+    stub.apply({
+        'kano.notifications.display_generic_notification': '[func]',
+        'kano_world.functions': {
+            'get_email': lambda: 'test@kano.me',
+            'get_mixed_username': lambda: 'testuser',
+        },
+    })
+    post_mock = requests_mock.post(
+        'https://worldapi.kes.kano.me/feedback',
+        json={'result': 200}
+    )
+
+    import io
+    import kano_feedback.DataSender as DataSender
+    monkeypatch.setattr(DataSender, 'get_metadata_archive',
+                        lambda *args, **kwargs: io.BytesIO(b'Fake archive'))
+    monkeypatch.setattr(DataSender, 'is_internet', lambda: False)
+    spool_stub = mocker.stub()
+    spool_stub.return_value = True
+    monkeypatch.setattr(DataSender, 'spool_report', spool_stub)
+    cleanup_stub = mocker.stub()
+    monkeypatch.setattr(DataSender.logging, 'cleanup', cleanup_stub)
+
+    # Call function under test
+    success, error = DataSender.send_data('test description', True,
+                                          subject='test title')
+
+    # Verify the report was kept for later rather than sent
+    assert success
+    assert error is None
+    assert not post_mock.request_history
+    assert spool_stub.call_count == 1
+    assert spool_stub.call_args[0][0] == DataSender.archive_path()
+    assert spool_stub.call_args[0][1]['subject'] == 'test title'
+    # a spooled report counts as submitted
+    assert cleanup_stub.call_count == 1
+
+
+def test_send_spooled_report_resumes_upload(tmpdir, monkeypatch,
+                                            console_mode):
+    import kano_feedback.DataSender as DataSender
+
+    archive = tmpdir.join('report.tar.gz')
+    archive.write('archive contents')
+    tmpdir.join('report.tar.gz.upload').write('{}')
+
+    uploads = []
+
+    class FakeUploader(object):
+        def upload(self, archive_path, fields):
+            uploads.append((archive_path, fields))
+            return True, None
+
+    monkeypatch.setattr(DataSender, 'ChunkedUploader', FakeUploader)
+
+    assert DataSender.send_spooled_report(str(archive), {'subject': 'Test'}) \
+        == (True, None)
+    assert uploads == [(str(archive), {'subject': 'Test'})]
 
 
 def test_get_metadata_archive(fs, monkeypatch, console_mode):
@@ -104,9 +173,9 @@ def test_get_metadata_archive(fs, monkeypatch, console_mode):
     imp.reload(DataSender)
 
     for expected_f in EXPECTED_FILES:
-        if hasattr(DataSender, expected_f.fn):
-            monkeypatch.setattr(
-                DataSender, expected_f.fn, expected_f.mock_fn
+        if expected_f.fn in DataSender.COLLECTOR_FNS:
+            monkeypatch.setitem(
+                DataSender.COLLECTOR_FNS, expected_f.fn, expected_f.mock_fn
             )
 
     # Call function under test
@@ -131,7 +200,25 @@ def test_get_metadata_archive(fs, monkeypatch, console_mode):
         for expected_f in EXPECTED_FILES:
             filepath = os.path.join(extraction_path, expected_f.filename)
             with open(filepath, 'r') as archive_f:
-                assert expected_f.contents == archive_f.read()
+                contents = archive_f.read()
+
+            # The metadata also identifies the report
+            if expected_f.filename == 'metadata.json':
+                metadata = json.loads(contents)
+                assert metadata.pop('report_id')
+                assert not metadata.pop('incremental')
+                assert json.loads(expected_f.contents) == metadata
+                continue
+
+            assert expected_f.contents == contents
+
+
+def test_collectors_are_registered(console_mode):
+    import kano_feedback.DataSender as DataSender
+    from kano_feedback.collectors import COLLECTORS
+
+    for collector in COLLECTORS:
+        assert callable(DataSender.COLLECTOR_FNS[collector.fn])
 
 
 def test_get_sources_list(fix_toolset, console_mode, apt_sources):
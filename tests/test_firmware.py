@@ -0,0 +1,101 @@
+#
+# test_firmware.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that the firmware and the display are only queried once per report
+#
+
+
+import re
+import subprocess
+
+from kano_feedback.task_pool import run_tasks
+from kano_feedback.firmware import GENCMD_MEM, GENCMD_UNKNOWN, DisplayInfo, \
+    FakeBackend, FirmwareProbe, ShellBackend
+
+
+GENCMD = dict(
+    (query, '{}=64M\n'.format(query.split()[-1])) for query in GENCMD_MEM
+)
+
+
+def test_vcgencmd_queries_are_batched():
+    backend = FakeBackend(gencmd=GENCMD)
+    probe = FirmwareProbe(backend)
+
+    assert probe.vcgencmd(GENCMD_MEM) == [GENCMD[q] for q in GENCMD_MEM]
+    assert probe.vcgencmd(['get_mem gpu', 'measure_temp']) == \
+        [GENCMD['get_mem gpu'], GENCMD_UNKNOWN]
+
+    # one batch for all the memory queries, then only the new one
+    assert backend.calls == [
+        ('vcgencmd', GENCMD_MEM),
+        ('vcgencmd', ['measure_temp']),
+    ]
+
+
+def test_display_is_shared_between_collectors():
+    display = DisplayInfo(status='state 0x12000a [HDMI CEA (16) RGB lim 16:9]',
+                          edid='\x00\xff\xff\xff', parsed_edid='HDMI')
+    backend = FakeBackend(display=display)
+    probe = FirmwareProbe(backend)
+
+    results = run_tasks([
+        ('collector-{}'.format(idx), lambda: probe.display().edid)
+        for idx in range(4)
+    ], max_workers=4)
+
+    assert [result.contents for result in results] == ['\x00\xff\xff\xff'] * 4
+    assert backend.calls == [('display', None)]
+
+
+def test_shell_backend_runs_a_batch_in_one_shell():
+    cmds = []
+
+    def run_fn(cmd):
+        cmds.append(cmd)
+        return subprocess.check_output(cmd, shell=True), '', 0
+
+    backend = ShellBackend(run_fn=run_fn)
+
+    assert backend.run_batch(['echo arm=448M', 'true', 'printf gpu=64M']) \
+        == ['arm=448M\n', '', 'gpu=64M']
+    assert len(cmds) == 1
+
+
+def test_shell_backend_only_parses_a_fresh_edid():
+    cmds = []
+
+    def run_fn(cmd):
+        cmds.append(cmd)
+        return '', '', 0
+
+    ShellBackend(run_fn=run_fn).display()
+
+    assert len(cmds) == 1
+    assert re.search(r'tvservice -d (\S+) > /dev/null && edidparser \1',
+                     cmds[0])
+
+
+def test_display_modes():
+    display = DisplayInfo(
+        name='device_name=SAM-SAMSUNG\n',
+        modes={
+            'CEA': 'Group CEA has 2 modes:\n'
+                   '           mode 4: 1280x720 @ 60Hz 16:9\n'
+                   '  (prefer) mode 16: 1920x1080 @ 60Hz 16:9\n',
+            'DMT': 'Group DMT has 0 modes:\n',
+        }
+    )
+
+    assert display.model == 'SAM-SAMSUNG'
+    assert display.supported_modes() == {
+        'CEA': ['mode 4: 1280x720 @ 60Hz 16:9',
+                '(prefer) mode 16: 1920x1080 @ 60Hz 16:9'],
+        'DMT': [],
+    }
+    assert display.preferred_mode() == \
+        'CEA (prefer) mode 16: 1920x1080 @ 60Hz 16:9'
+    assert DisplayInfo().preferred_mode() is None
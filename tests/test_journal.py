@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# test_journal.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests reading the newest journal entries
+#
+
+
+import json
+
+from kano_feedback.journal import JournalReader, newest_cursor, \
+    render_json, render_short
+from kano_feedback.time_window import TimeWindow
+
+
+def _entry(idx, message='message'):
+    stamp = (1559390400 + idx) * 1000000
+    return {
+        '__CURSOR': 's=abc;i={:x};t={:x}'.format(idx, stamp),
+        '__REALTIME_TIMESTAMP': str(stamp),
+        '_HOSTNAME': 'kano',
+        'SYSLOG_IDENTIFIER': 'kano-updater',
+        '_PID': '42',
+        '_MACHINE_ID': 'left out',
+        'MESSAGE': message,
+    }
+
+
+class FakeJournalctl(object):
+    def __init__(self, entries):
+        self.entries = entries
+        self.cmds = []
+
+    def __call__(self, cmd):
+        self.cmds.append(cmd)
+        newest_first = reversed(self.entries)
+        return ''.join(json.dumps(entry) + '\n' for entry in newest_first), \
+            '', 0
+
+
+def test_reads_newest_entries_of_the_boot():
+    journalctl = FakeJournalctl([_entry(idx) for idx in xrange(3)])
+    reader = JournalReader(run_fn=journalctl, max_entries=50)
+
+    entries = reader.read()
+
+    assert [entry['MESSAGE'] for entry in entries] == ['message'] * 3
+    assert newest_cursor(entries) == _entry(2)['__CURSOR']
+    assert journalctl.cmds == [
+        'sudo journalctl --output=json --reverse --lines=50 --boot'
+    ]
+
+
+def test_stops_at_cursor():
+    entries = [_entry(idx, 'entry {}'.format(idx)) for idx in xrange(5)]
+    reader = JournalReader(run_fn=FakeJournalctl(entries))
+
+    new_entries = reader.read(cursor=entries[2]['__CURSOR'])
+
+    assert [entry['MESSAGE'] for entry in new_entries] == \
+        ['entry 3', 'entry 4']
+
+
+def test_filters():
+    journalctl = FakeJournalctl([])
+    reader = JournalReader(run_fn=journalctl, priority='err',
+                           units=['kano-updater.service'], sudo=False)
+
+    reader.read(time_window=TimeWindow(since=0))
+
+    cmd = journalctl.cmds[0]
+    assert cmd.startswith('journalctl ')
+    assert '--boot' not in cmd
+    assert '--priority=err' in cmd
+    assert '--unit=kano-updater.service' in cmd
+    assert '--since=' in cmd
+
+
+def test_render():
+    entries = [_entry(0, u'first\nsecond ✓'), _entry(1, [1, 2, 3])]
+
+    short = render_short(entries).splitlines()
+    assert short[0].endswith(' kano kano-updater[42]: first')
+    assert short[1].strip() == 'second \xe2\x9c\x93'
+    assert short[2].endswith(': [3 blob data]')
+
+    structured = [
+        json.loads(line) for line in render_json(entries).splitlines()
+    ]
+    assert structured[0]['MESSAGE'] == u'first\nsecond ✓'
+    assert '_MACHINE_ID' not in structured[0]
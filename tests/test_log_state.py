@@ -0,0 +1,127 @@
+#
+# test_log_state.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that incremental reports only pick up what is new since the last one
+#
+
+
+import os
+
+from kano_feedback.log_state import LogState
+
+
+def _read(log_state, path):
+    stat = os.stat(path)
+    offset = log_state.file_offset(path, stat)
+    with open(path) as log_f:
+        log_f.seek(offset)
+        contents = log_f.read()
+    log_state.file_read(path, stat, offset + len(contents))
+    return contents
+
+
+def test_incremental_resumes_after_last_report(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    log = tmpdir.join('dpkg.log')
+    log.write('first\n')
+
+    first = LogState(state_path, incremental=True)
+    assert _read(first, str(log)) == 'first\n'
+    assert first.previous_report_id is None
+    assert first.commit()
+
+    log.write('second\n', mode='a')
+    second = LogState(state_path, incremental=True)
+    assert _read(second, str(log)) == 'second\n'
+    assert second.previous_report_id == first.report_id
+    assert second.metadata()['previous_report_id'] == first.report_id
+
+
+def test_state_is_only_kept_on_commit(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    log = tmpdir.join('dpkg.log')
+    log.write('first\n')
+
+    _read(LogState(state_path, incremental=True), str(log))
+
+    assert _read(LogState(state_path, incremental=True), str(log)) == \
+        'first\n'
+
+
+def test_full_report_sends_everything(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    log = tmpdir.join('dpkg.log')
+    log.write('first\n')
+
+    first = LogState(state_path)
+    _read(first, str(log))
+    first.commit()
+
+    full = LogState(state_path)
+    assert _read(full, str(log)) == 'first\n'
+    assert 'previous_report_id' not in full.metadata()
+
+
+def test_rotated_and_truncated_logs_are_read_again(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    log = tmpdir.join('dpkg.log')
+    log.write('first line\n')
+
+    first = LogState(state_path, incremental=True)
+    _read(first, str(log))
+    first.commit()
+
+    log.write('new\n')
+    assert _read(LogState(state_path, incremental=True), str(log)) == 'new\n'
+
+    log.remove()
+    log.write('rotated\n')
+    assert _read(LogState(state_path, incremental=True), str(log)) == \
+        'rotated\n'
+
+
+def test_commit_keeps_sources_not_collected(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+
+    first = LogState(state_path, incremental=True)
+    first.app_log_read('/logs/app.log', 100.0)
+    first.journal_read('s=cursor')
+    first.commit()
+
+    second = LogState(state_path, incremental=True)
+    second.app_log_read('/logs/other.log', 200.0)
+    second.commit()
+
+    third = LogState(state_path, incremental=True)
+    assert third.app_log_since('/logs/app.log') == 100.0
+    assert third.app_log_since('/logs/other.log') == 200.0
+    assert third.journal_cursor == 's=cursor'
+
+
+def test_forgets_positions_of_cut_collectors(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    kept_log = tmpdir.join('kept.log')
+    kept_log.write('kept\n')
+    cut_log = tmpdir.join('cut.log')
+    cut_log.write('cut\n')
+
+    first = LogState(state_path, incremental=True)
+    _read(first.for_collectors(['kept.txt']), str(kept_log))
+    cut_state = first.for_collectors(['cut.txt'])
+    assert cut_state.incremental
+    _read(cut_state, str(cut_log))
+    cut_state.app_log_read('/var/log/kano/app.log', 10.0)
+    first.journal_read('s=cursor')
+    first.forget(['cut.txt'])
+    assert first.commit()
+
+    kept_log.write('more\n', mode='a')
+    cut_log.write('more\n', mode='a')
+    second = LogState(state_path, incremental=True)
+    assert _read(second, str(kept_log)) == 'more\n'
+    assert _read(second, str(cut_log)) == 'cut\nmore\n'
+    assert second.app_log_since('/var/log/kano/app.log') is None
+    assert second.journal_cursor == 's=cursor'
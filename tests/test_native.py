@@ -0,0 +1,148 @@
+#
+# test_native.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests the collectors reading the system files rather than forking commands
+#
+
+
+import time
+
+import pytest
+
+from kano_feedback import native
+
+
+DPKG_STATUS = '''\
+Package: zlib1g
+Status: install ok installed
+Architecture: armhf
+Multi-Arch: same
+Version: 1:1.2.8.dfsg-5
+Description: compression library - runtime
+ zlib is a library implementing the deflate compression method found
+ in gzip and PKZIP.
+
+Package: adduser
+Status: install ok installed
+Architecture: all
+Version: 3.115
+Conffiles:
+ /etc/adduser.conf cc3493ecd2d09837ffdcc3e25fdfff18
+Description: add and remove users and groups
+
+Package: old-package
+Status: purge ok not-installed
+Architecture: armhf
+
+Package: removed-package
+Status: deinstall ok config-files
+Architecture: armhf
+Version: 0.1
+Description: removed but configured
+'''
+
+DPKG_LIST = '''\
+Desired=Unknown/Install/Remove/Purge/Hold
+| Status=Not/Inst/Conf-files/Unpacked/halF-conf/Half-inst/trig-aWait/Trig-pend
+|/ Err?=(none)/Reinst-required (Status,Err: uppercase=bad)
+||/ Name            Version        Architecture Description
++++-===============-==============-============-===============================
+ii  adduser         3.115          all          add and remove users and groups
+rc  removed-package 0.1            armhf        removed but configured
+ii  zlib1g:armhf    1:1.2.8.dfsg-5 armhf        compression library - runtime
+'''
+
+
+def test_dpkg_list(tmpdir):
+    status = tmpdir.join('status')
+    status.write(DPKG_STATUS)
+
+    assert native.dpkg_list(str(status)) == DPKG_LIST
+
+
+def test_kwifi_cache_obfuscates_key(tmpdir):
+    cache = tmpdir.join('kwifiprompt-cache.conf')
+    cache.write('{"essid": "Kano",\n"enckey": "secret",\n"encryption": 1}\n')
+
+    assert native.kwifi_cache(str(cache)) == \
+        '{"essid": "Kano",\n"enckey": "obfuscated"\n"encryption": 1}\n'
+    assert native.kwifi_cache(str(tmpdir.join('missing'))) == ''
+
+
+def test_ls_time():
+    now = time.mktime((2019, 6, 1, 12, 0, 0, 0, 0, -1))
+    recent = time.mktime((2019, 3, 5, 9, 7, 0, 0, 0, -1))
+    old = time.mktime((2018, 3, 5, 9, 7, 0, 0, 0, -1))
+
+    assert native.ls_time(recent, now=now) == 'Mar 5 09:07'
+    assert native.ls_time(old, now=now) == 'Mar 5 2018'
+
+
+@pytest.mark.parametrize('size, ceil, expected', [
+    (0, False, '0B'),
+    (63 * 1024 ** 2, False, '63M'),
+    (int(14.87 * 1024 ** 3), False, '14.9G'),
+    (0, True, '0'),
+    (int(3.01 * 1024 ** 3), True, '3.1G'),
+    (int(17.2 * 1024 ** 3), True, '18G'),
+])
+def test_human_size(size, ceil, expected):
+    assert native.human_size(size, ceil=ceil) == expected
+
+
+def _sys_attrs(path, **attrs):
+    path.ensure(dir=True)
+    for name, value in attrs.iteritems():
+        path.join(name).write('{}\n'.format(value))
+
+
+def test_lsblk(tmpdir):
+    sys_block = tmpdir.join('block')
+    _sys_attrs(sys_block.join('mmcblk0'), dev='179:0', size=31116288,
+               removable=0, ro=0)
+    _sys_attrs(sys_block.join('mmcblk0', 'mmcblk0p1'), dev='179:1',
+               size=129024, ro=0, partition=1)
+    _sys_attrs(sys_block.join('mmcblk0', 'mmcblk0p2'), dev='179:2',
+               size=30982144, ro=0, partition=2)
+    _sys_attrs(sys_block.join('ram0'), dev='1:0', size=8192, removable=0,
+               ro=0)
+    _sys_attrs(sys_block.join('loop0'), dev='7:0', size=0, removable=0, ro=0)
+    mounts = tmpdir.join('mounts')
+    mounts.write('')
+
+    assert native.lsblk(str(sys_block), str(mounts)) == (
+        'NAME        MAJ:MIN RM  SIZE RO TYPE MOUNTPOINT\n'
+        'mmcblk0     179:0    0 14.8G  0 disk\n'
+        '|-mmcblk0p1 179:1    0   63M  0 part\n'
+        '`-mmcblk0p2 179:2    0 14.8G  0 part\n'
+    )
+
+
+def test_usb_devices(tmpdir):
+    sys_usb = tmpdir.join('devices')
+    _sys_attrs(sys_usb.join('usb1'), busnum=1, devnum=1, idVendor='1d6b',
+               idProduct='0002', manufacturer='Linux dwc_otg_hcd',
+               product='DWC OTG Controller', speed=480, maxchild=1)
+    _sys_attrs(sys_usb.join('1-1'), busnum=1, devnum=2, idVendor='0424',
+               idProduct='9514', speed=480, maxchild=5)
+    _sys_attrs(sys_usb.join('1-1:1.0'), bInterfaceClass='09',
+               bInterfaceNumber='00')
+    _sys_attrs(sys_usb.join('1-1.3'), busnum=1, devnum=4, idVendor='0bda',
+               idProduct='8176', manufacturer='Realtek',
+               product='802.11n WLAN Adapter', speed=480, maxchild=0)
+    _sys_attrs(sys_usb.join('1-1.3:1.0'), bInterfaceClass='ff',
+               bInterfaceNumber='00')
+
+    assert native.usb_devices(str(sys_usb)) == (
+        'Bus 001 Device 004: ID 0bda:8176 Realtek 802.11n WLAN Adapter\n'
+        'Bus 001 Device 002: ID 0424:9514\n'
+        'Bus 001 Device 001: ID 1d6b:0002 Linux dwc_otg_hcd '
+        'DWC OTG Controller\n'
+        '/:  Bus 01.Port 1: Dev 1, Class=root_hub, Driver=[none]/1p, 480M\n'
+        '    |__ Port 1: Dev 2, If 0, Class=Hub, Driver=[none]/5p, 480M\n'
+        '        |__ Port 3: Dev 4, If 0, Class=Vendor Specific Class, '
+        'Driver=[none], 480M\n'
+    )
@@ -0,0 +1,159 @@
+#
+# test_proc_snapshot.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that ps, pstree and lsof output is rendered from a single /proc walk
+#
+
+
+import os
+
+import pytest
+
+from kano_feedback.proc_snapshot import take_snapshot, render_processes, \
+    render_process_tree, render_mem_ranking, render_open_files
+
+
+# pid: (comm, state, ppid, session, threads, rss pages, cmdline)
+PROCESSES = {
+    1: ('systemd', 'S', 0, 1, 1, 1000, ['/sbin/init']),
+    2: ('kthreadd', 'S', 0, 0, 1, 0, []),
+    300: ('lxsession', 'S', 1, 300, 1, 3000, ['/usr/bin/lxsession', '-s']),
+    400: ('python', 'R', 300, 300, 2, 20000,
+          ['/usr/bin/python', '/usr/bin/kano-feedback']),
+    401: ('python', 'S', 400, 300, 1, 100, ['python', '-c', 'a\nb']),
+}
+
+
+def _stat_line(pid, comm, state, ppid, session, threads, rss):
+    fields = [state, ppid, pid, session, 0, -1, 4194560, 0, 0, 0, 0,
+              100, 50, 0, 0, 20, 0, threads, 0, 500, 1024 * 1024, rss]
+    return '{} ({}) {}\n'.format(pid, comm, ' '.join(str(f) for f in fields))
+
+
+@pytest.fixture
+def proc_dir(tmpdir):
+    proc = tmpdir.mkdir('proc')
+    proc.join('uptime').write('1000.00 900.00\n')
+    proc.join('stat').write('cpu  1 2 3 4\nbtime 1550000000\n')
+    proc.join('meminfo').write('MemTotal:         400000 kB\n')
+    proc.mkdir('self')
+
+    for pid, (comm, state, ppid, session, threads, rss, cmdline) in \
+            PROCESSES.iteritems():
+        pid_dir = proc.mkdir(str(pid))
+        pid_dir.join('stat').write(
+            _stat_line(pid, comm, state, ppid, session, threads, rss)
+        )
+        pid_dir.join('cmdline').write(
+            ''.join(arg + '\0' for arg in cmdline)
+        )
+        pid_dir.join('wchan').write('0')
+
+    task_dir = proc.join('400').mkdir('task')
+    task_dir.mkdir('400').join('comm').write('python\n')
+    task_dir.mkdir('410').join('comm').write('gmain\n')
+
+    fd_dir = proc.join('400').mkdir('fd')
+    log = tmpdir.join('feedback.log')
+    log.write('logs')
+    os.symlink(str(log), str(fd_dir.join('3')))
+
+    return str(proc)
+
+
+def test_snapshot(proc_dir):
+    snapshot = take_snapshot(proc_dir)
+
+    assert sorted(snapshot.processes) == sorted(PROCESSES)
+    assert snapshot.processes[400].ppid == 300
+    assert snapshot.processes[400].args == \
+        '/usr/bin/python /usr/bin/kano-feedback'
+    assert snapshot.processes[2].args == '[kthreadd]'
+    assert snapshot.mem_total == 400000
+
+
+def test_render_processes(proc_dir):
+    lines = render_processes(take_snapshot(proc_dir)).splitlines()
+
+    assert lines[0].split() == [
+        'USER', 'PID', '%CPU', '%MEM', 'VSZ', 'RSS', 'TTY', 'TMOUT', 'FLAGS',
+        'EXTRA-WIDE-WCHAN-COLUMN', 'STAT', 'START', 'TIME', 'COMMAND'
+    ]
+    assert [int(line.split()[1]) for line in lines[1:]] == sorted(PROCESSES)
+    python = lines[4].split()
+    assert python[10] == 'Rl'
+    assert python[13:] == ['/usr/bin/python', '/usr/bin/kano-feedback']
+
+
+def test_render_process_tree(proc_dir):
+    assert render_process_tree(take_snapshot(proc_dir, tasks=True)) == (
+        'systemd,1\n'
+        '  `-lxsession,300 -s\n'
+        '      `-python,400 /usr/bin/kano-feedback\n'
+        '          |-python,401 -c a\\012b\n'
+        '          `-{gmain},410\n'
+        'kthreadd,2\n'
+    )
+
+
+def test_render_mem_ranking(proc_dir):
+    snapshot = take_snapshot(proc_dir)
+    ranking = render_mem_ranking(snapshot).splitlines()
+
+    assert [line.split(None, 1)[1] for line in ranking][:3] == [
+        '/usr/bin/python /usr/bin/kano-feedback',
+        '/usr/bin/lxsession -s',
+        '/sbin/init',
+    ]
+    mem = 100.0 * 20000 * snapshot.page_size / 1024 / 400000
+    assert ranking[0].split()[0] == '{:.1f}'.format(mem)
+
+
+def test_render_open_files(proc_dir):
+    lines = render_open_files(take_snapshot(proc_dir, open_files=True)).splitlines()
+
+    assert lines[0].split()[0] == 'COMMAND'
+    assert len(lines) == 2
+    assert lines[1].split()[:5] == ['python', '400', lines[1].split()[2],
+                                    '3', 'REG']
+    assert lines[1].endswith('feedback.log')
+
+
+def test_render_reads_only_the_snapshot(proc_dir, tmpdir):
+    snapshot = take_snapshot(proc_dir, tasks=True, open_files=True)
+    tree = render_process_tree(snapshot)
+    open_files = render_open_files(snapshot)
+
+    # the processes are gone by the time the snapshot is rendered
+    tmpdir.join('proc').remove()
+
+    assert render_process_tree(snapshot) == tree
+    assert render_open_files(snapshot) == open_files
+    assert '{gmain},410' in tree
+    assert open_files.splitlines()[1].endswith('feedback.log')
+
+
+def test_snapshot_reads_threads_and_files_on_demand(proc_dir, monkeypatch):
+    read = []
+    listdir = os.listdir
+
+    def tracking_listdir(path):
+        read.append(path)
+        return listdir(path)
+
+    def tracking_readlink(path):
+        read.append(path)
+        return path
+
+    monkeypatch.setattr(os, 'listdir', tracking_listdir)
+    monkeypatch.setattr(os, 'readlink', tracking_readlink)
+    snapshot = take_snapshot(proc_dir)
+
+    assert not [path for path in read
+                if os.path.basename(path) in ('fd', 'task', 'cwd')]
+    assert snapshot.processes[400].tasks == []
+    assert snapshot.processes[400].open_files == []
+    assert render_open_files(snapshot).splitlines()[1:] == []
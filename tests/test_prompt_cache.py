@@ -0,0 +1,77 @@
+#
+# test_prompt_cache.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests the local copy of the widget questions and its incremental syncs
+#
+
+
+from kano_feedback.prompt_cache import PromptCache, QUESTIONS_ENDPOINT
+
+
+def _question(qid, created):
+    return {
+        'id': qid,
+        'text': u'Question {}'.format(qid),
+        'date_created': created,
+    }
+
+
+FIRST = _question('a', '2019-01-01T10:00:00Z')
+SECOND = _question('b', '2019-02-01T10:00:00Z')
+THIRD = _question('c', '2019-03-01T10:00:00Z')
+
+
+def test_full_sync_saves_questions(tmpdir):
+    path = str(tmpdir.join('questions.json'))
+    cache = PromptCache(path)
+    assert cache.load() is None
+    assert cache.since() is None
+    assert cache.endpoint(None) == QUESTIONS_ENDPOINT
+
+    assert cache.update([SECOND, FIRST], None, now=1000)
+    assert PromptCache(path).load() == [FIRST, SECOND]
+
+
+def test_sync_only_asks_for_new_questions(tmpdir):
+    path = str(tmpdir.join('questions.json'))
+    cache = PromptCache(path, full_sync_interval=100)
+    cache.update([FIRST, SECOND], None, now=1000)
+
+    since = cache.since(now=1050)
+    assert since == SECOND['date_created']
+    assert cache.endpoint(since) == \
+        '/questions?since=2019-02-01T10%3A00%3A00Z'
+
+    assert not cache.update([], since, now=1050)
+    assert cache.update([THIRD], since, now=1060)
+    assert PromptCache(path).load() == [FIRST, SECOND, THIRD]
+
+    assert cache.since(now=1100) is None
+
+
+def test_sync_ignored_since_replaces_questions(tmpdir):
+    path = str(tmpdir.join('questions.json'))
+    cache = PromptCache(path)
+    cache.update([FIRST, SECOND], None, now=1000)
+
+    # a server which does not filter returns the full list
+    since = cache.since(now=1010)
+    assert cache.update([FIRST, THIRD], since, now=1010)
+    assert cache.questions == [FIRST, THIRD]
+
+    assert not cache.update([FIRST, THIRD], None, now=1020)
+
+
+def test_sync_delta_may_hold_newest_question(tmpdir):
+    path = str(tmpdir.join('questions.json'))
+    cache = PromptCache(path)
+    cache.update([FIRST, SECOND], None, now=1000)
+
+    # a server may take since as inclusive
+    since = cache.since(now=1010)
+    assert not cache.update([SECOND], since, now=1010)
+    assert cache.update([SECOND, THIRD], since, now=1020)
+    assert cache.questions == [FIRST, SECOND, THIRD]
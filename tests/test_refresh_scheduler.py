@@ -0,0 +1,59 @@
+#
+# test_refresh_scheduler.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests when the widget refreshes its questions
+#
+
+
+import struct
+
+from kano_feedback.refresh_scheduler import RefreshScheduler, \
+    parse_netlink_types, RTM_NEWADDR
+
+
+def test_interval_grows_without_new_questions():
+    scheduler = RefreshScheduler(min_interval=100, max_interval=350)
+
+    scheduler.record(online=True, changed=False)
+    assert scheduler.interval == 200
+    assert 150 <= scheduler.next_delay() <= 200
+
+    scheduler.record(online=True, changed=False)
+    assert scheduler.interval == 350
+
+    scheduler.record(online=True, changed=True)
+    assert scheduler.interval == 100
+
+
+def test_backs_off_while_offline():
+    scheduler = RefreshScheduler(offline_base=10, offline_cap=35)
+    assert not scheduler.link_up()
+
+    scheduler.record(online=False)
+    assert 5 <= scheduler.next_delay() <= 10
+    scheduler.record(online=False)
+    assert 10 <= scheduler.next_delay() <= 20
+    scheduler.record(online=False)
+    scheduler.record(online=False)
+    assert scheduler.next_delay() <= 35
+    assert scheduler.link_up()
+
+    scheduler.record(online=True, changed=False)
+    assert not scheduler.link_up()
+    assert scheduler.next_delay() >= scheduler.min_interval
+
+
+def _netlink_message(msg_type, payload=''):
+    length = 16 + len(payload)
+    padding = '\0' * ((4 - length % 4) % 4)
+    return struct.pack('=LHHLL', length, msg_type, 0, 0, 0) + payload + \
+        padding
+
+
+def test_parse_netlink_types():
+    data = _netlink_message(16, 'x' * 17) + _netlink_message(RTM_NEWADDR)
+    assert parse_netlink_types(data) == [16, RTM_NEWADDR]
+    assert parse_netlink_types(data[:10]) == []
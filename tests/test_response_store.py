@@ -0,0 +1,100 @@
+#
+# test_response_store.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests the append-only store of the answers to the widget questions
+#
+
+
+import csv
+
+from kano_feedback.response_store import ResponseStore, SENT
+
+
+QUESTION = u'How do you like the k\xe9yboard?'
+
+
+def _lines(path):
+    with open(str(path)) as log_f:
+        return log_f.readlines()
+
+
+def test_store_keeps_answers(tmpdir):
+    log = tmpdir.join('responses.log')
+    store = ResponseStore(str(log))
+    store.put(QUESTION, u'Gr\xe9at', u'q1')
+    store.put(u'Another question', SENT, u'q2')
+    store.close()
+
+    reopened = ResponseStore(str(log))
+    assert reopened.rows() == [
+        [QUESTION, u'Gr\xe9at', u'q1'],
+        [u'Another question', SENT, u'q2'],
+    ]
+    assert reopened.rows(offline=True) == [[QUESTION, u'Gr\xe9at', u'q1']]
+    assert reopened.is_responded(QUESTION)
+    assert reopened.is_responded(u'Reworded question', u'q2')
+    assert not reopened.is_responded(u'Reworded question', u'q3')
+
+
+def test_store_appends_answers(tmpdir):
+    log = tmpdir.join('responses.log')
+    store = ResponseStore(str(log))
+    store.put(QUESTION, u'Great', u'q1')
+    store.put(QUESTION, SENT, u'q1')
+
+    assert len(_lines(log)) == 2
+    assert store.get(QUESTION) == [QUESTION, SENT, u'q1']
+    assert store.rows(offline=True) == []
+
+
+def test_store_drops_torn_line(tmpdir):
+    log = tmpdir.join('responses.log')
+    store = ResponseStore(str(log))
+    store.put(QUESTION, u'Great', u'q1')
+    store.close()
+    log.write('["Half a question", "Hal', mode='a')
+
+    reopened = ResponseStore(str(log))
+    assert reopened.rows() == [[QUESTION, u'Great', u'q1']]
+
+    reopened.put(u'Another question', u'Fine', u'q2')
+    reopened.close()
+    assert len(ResponseStore(str(log)).rows()) == 2
+
+
+def test_store_compacts_log(tmpdir):
+    log = tmpdir.join('responses.log')
+    store = ResponseStore(str(log), compact_min_stale=4)
+    for attempt in range(4):
+        store.put(QUESTION, u'Answer {}'.format(attempt), u'q1')
+    store.put(QUESTION, SENT, u'q1')
+
+    assert len(_lines(log)) == 1
+    assert store.get(QUESTION) == [QUESTION, SENT, u'q1']
+
+    store.put(u'Another question', u'Fine', u'q2')
+    assert len(_lines(log)) == 2
+    assert not tmpdir.join('responses.log.tmp').exists()
+
+
+def test_store_migrates_csv(tmpdir):
+    legacy = tmpdir.join('sent.csv')
+    with open(str(legacy), 'w') as csv_f:
+        writer = csv.writer(csv_f, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow([QUESTION.encode('utf-8'), 'yes', None])
+        writer.writerow(['Another question', 'Fine', 'q2'])
+
+    log = tmpdir.join('responses.log')
+    store = ResponseStore(str(log), legacy_path=str(legacy))
+
+    assert store.rows() == [
+        [QUESTION, SENT, None],
+        [u'Another question', u'Fine', u'q2'],
+    ]
+    assert not legacy.exists()
+    assert len(_lines(log)) == 2
+    assert ResponseStore(str(log), legacy_path=str(legacy)).rows() == \
+        store.rows()
@@ -0,0 +1,61 @@
+#
+# test_result_cache.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that collector output is reused only while its sources are unchanged
+#
+
+
+import os
+import time
+
+from kano_feedback.result_cache import ResultCache, fingerprint
+
+
+def test_cached_until_sources_change(tmpdir):
+    status = tmpdir.join('status')
+    status.write('Package: adduser\n')
+    calls = []
+
+    def collector():
+        calls.append(None)
+        return 'output {}'.format(len(calls))
+
+    cache = ResultCache(str(tmpdir.join('cache')))
+    cached = cache.wrap('packages.txt', [str(status)], collector)
+
+    assert cached() == 'output 1'
+    assert cached() == 'output 1'
+    assert len(calls) == 1
+
+    status.write('Package: adduser\nPackage: zlib1g\n')
+    assert cached() == 'output 2'
+    assert len(calls) == 2
+
+
+def test_fingerprint_follows_globs(tmpdir):
+    sources_d = tmpdir.join('sources.list.d')
+    sources_d.ensure(dir=True)
+    paths = [str(sources_d.join('*'))]
+    empty = fingerprint(paths)
+
+    sources_d.join('kano.list').write('deb http://repo.kano.me/ jessie main\n')
+    assert fingerprint(paths) != empty
+    assert fingerprint(paths) == fingerprint(paths)
+
+
+def test_evicts_stale_then_least_recently_used(tmpdir):
+    cache_dir = tmpdir.join('cache')
+    now = time.time()
+    for name, age in [('stale', 120), ('old', 30), ('new', 0)]:
+        ResultCache(str(cache_dir)).put(name, 'key', 'x' * 40)
+        used = now - age
+        os.utime(str(cache_dir.join('{}.cache'.format(name))), (used, used))
+
+    cache = ResultCache(str(cache_dir), max_bytes=80, max_age=60)
+    assert cache.evict(now=now) == ['stale', 'old']
+    assert cache.get('new', 'key') == 'x' * 40
+    assert cache.get('old', 'key') is None
+    assert cache.get('new', 'other key') is None
@@ -0,0 +1,166 @@
+#
+# test_spool.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that unsent reports are kept and drained in the background
+#
+
+
+import os
+import time
+
+from kano_feedback.chunked_upload import UploadState
+from kano_feedback.spool import ReportSpool, SpoolDrainer, backoff_delay
+from tests.fixtures.helpers import random_file
+
+
+PAYLOAD = {'subject': 'Test report', 'text': u'Some d\xe9scription'}
+
+
+def _spool_report(tmpdir, spool, name='bug_report.tar.gz', size=None):
+    archive = tmpdir.join(name)
+    archive.write(random_file() if size is None else 'x' * size)
+    return spool.add(str(archive), PAYLOAD)
+
+
+def test_spool_keeps_reports(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    archive = tmpdir.join('bug_report.tar.gz')
+    archive.write('archive contents')
+
+    entry = spool.add(str(archive), PAYLOAD)
+
+    assert not archive.exists()
+    entries = spool.entries()
+    assert [spooled.entry_id for spooled in entries] == [entry.entry_id]
+    assert entries[0].payload == PAYLOAD
+    with open(entries[0].archive_path) as archive_f:
+        assert archive_f.read() == 'archive contents'
+
+
+def test_spool_keeps_upload_session(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    archive = tmpdir.join('bug_report.tar.gz')
+    archive.write('archive contents')
+    tmpdir.join('bug_report.tar.gz.upload').write('{"upload_id": "abc"}')
+
+    entry = spool.add(str(archive), PAYLOAD)
+
+    upload = UploadState(entry.archive_path)
+    assert not os.path.exists(UploadState(str(archive)).path)
+    with open(upload.path) as upload_f:
+        assert upload_f.read() == '{"upload_id": "abc"}'
+
+    spool.remove(entry)
+    assert not os.path.exists(upload.path)
+
+
+def test_spool_evicts_by_size(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')), max_bytes=250)
+
+    first = _spool_report(tmpdir, spool, size=100)
+    second = _spool_report(tmpdir, spool, size=100)
+    third = _spool_report(tmpdir, spool, size=100)
+
+    kept = [entry.entry_id for entry in spool.entries()]
+    assert first.entry_id not in kept
+    assert kept == [second.entry_id, third.entry_id]
+    assert not os.path.exists(first.archive_path)
+
+
+def test_spool_never_evicts_the_new_report(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')), max_bytes=250)
+    first = _spool_report(tmpdir, spool, size=100)
+
+    archive = tmpdir.join('too_large.tar.gz')
+    archive.write('x' * 300)
+    assert spool.add(str(archive), PAYLOAD) is None
+    assert archive.exists()
+    assert [entry.entry_id for entry in spool.entries()] == [first.entry_id]
+
+    second = _spool_report(tmpdir, spool, size=200)
+    assert [entry.entry_id for entry in spool.entries()] == [second.entry_id]
+    assert spool.evict(now=time.time(), keep=second) == []
+
+
+def test_spool_evicts_by_age(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')), max_age=60)
+    _spool_report(tmpdir, spool)
+
+    assert spool.evict(now=time.time() + 30) == []
+    assert len(spool.evict(now=time.time() + 120)) == 1
+    assert spool.entries() == []
+
+
+def test_backoff_delay_grows_and_is_capped():
+    assert backoff_delay(0, base=10, cap=100) <= 10
+    assert 40 <= backoff_delay(3, base=10, cap=1000) <= 80
+    assert backoff_delay(50, base=10, cap=100) <= 100
+
+
+def test_drainer_sends_everything(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    entries = [_spool_report(tmpdir, spool) for dummy in range(3)]
+    sent = []
+
+    def send_fn(archive_path, payload):
+        assert payload == PAYLOAD
+        sent.append(archive_path)
+        return True, None
+
+    drainer = SpoolDrainer(spool, send_fn, is_online=lambda: True)
+
+    assert drainer.drain()
+    assert sent == [entry.archive_path for entry in entries]
+    assert spool.entries() == []
+
+
+def test_drainer_backs_off_on_failure(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    _spool_report(tmpdir, spool)
+
+    drainer = SpoolDrainer(spool, lambda *args: (False, 'Server error'),
+                           is_online=lambda: True, max_runtime=0.1)
+
+    assert not drainer.drain()
+    entry = spool.entries()[0]
+    assert entry.attempts == 1
+    assert entry.last_error == 'Server error'
+    assert entry.next_attempt > time.time()
+
+
+def test_drainer_waits_for_connectivity(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    _spool_report(tmpdir, spool)
+    sent = []
+
+    drainer = SpoolDrainer(spool, lambda *args: sent.append(args),
+                           is_online=lambda: False, max_runtime=0.1)
+
+    assert not drainer.drain()
+    assert sent == []
+    assert spool.entries()[0].attempts == 0
+
+
+def test_single_drainer_at_a_time(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    _spool_report(tmpdir, spool)
+
+    lock = spool.lock()
+    try:
+        drainer = SpoolDrainer(spool, lambda *args: (True, None),
+                               is_online=lambda: True)
+        assert not drainer.drain()
+        assert len(spool.entries()) == 1
+    finally:
+        lock.close()
+
+
+def test_spool_keeps_archive_extension(tmpdir):
+    spool = ReportSpool(str(tmpdir.join('spool')))
+    entry = _spool_report(tmpdir, spool, name='bug_report.tar.xz')
+
+    assert entry.archive_path.endswith('.tar.xz')
+    assert spool.entries()[0].archive_path == entry.archive_path
@@ -0,0 +1,83 @@
+#
+# test_streaming.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that the report is piped into a valid multipart upload
+#
+
+
+import cgi
+import io
+import threading
+
+import pytest
+
+from kano_feedback.streaming import StreamPipe, UploadProgress, \
+    multipart_content_type, multipart_stream
+from tests.fixtures.helpers import random_file
+
+
+def _write_chunks(pipe, chunks, failed=False):
+    for chunk in chunks:
+        pipe.write(chunk)
+    pipe.close(failed=failed)
+
+
+def test_pipe_passes_data_across_threads():
+    chunks = [random_file() for dummy in range(500)]
+    pipe = StreamPipe(max_chunks=4)
+
+    writer = threading.Thread(target=_write_chunks, args=(pipe, chunks))
+    writer.start()
+    received = ''.join(pipe)
+    writer.join()
+
+    assert received == ''.join(chunks)
+
+
+def test_pipe_reports_failures():
+    pipe = StreamPipe()
+    _write_chunks(pipe, ['some data'], failed=True)
+
+    with pytest.raises(IOError):
+        list(pipe)
+
+
+def test_abandoned_pipe_does_not_block_the_writer():
+    pipe = StreamPipe(max_chunks=1)
+    pipe.abandon()
+
+    # Would block forever on the full queue if the pipe was not abandoned
+    _write_chunks(pipe, ['data'] * 10)
+
+
+def test_multipart_stream_is_parseable():
+    fields = {'text': u'Some d\xe9scription', 'subject': 'Title', 'email': ''}
+    report = random_file() * 20
+    updates = []
+    progress = UploadProgress(lambda prog: updates.append(prog.bytes_sent))
+
+    boundary = 'testboundary'
+    body = ''.join(multipart_stream(
+        boundary, fields, 'report', 'bug_report.tar.gz',
+        [report[:100], report[100:]], progress=progress
+    ))
+
+    form = cgi.FieldStorage(
+        fp=io.BytesIO(body),
+        environ={
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': multipart_content_type(boundary),
+            'CONTENT_LENGTH': str(len(body)),
+        }
+    )
+
+    assert form.getvalue('text') == fields['text'].encode('utf-8')
+    assert form.getvalue('subject') == 'Title'
+    assert form['report'].filename == 'bug_report.tar.gz'
+    assert form['report'].value == report
+
+    assert progress.bytes_sent == len(body)
+    assert updates[-1] == len(body)
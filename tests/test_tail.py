@@ -0,0 +1,77 @@
+#
+# test_tail.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that only the end of large logs is read
+#
+
+
+import pytest
+
+from kano_feedback.tail import TRUNCATION_MARKER, lines_offset, read_tail, \
+    tail_file
+
+
+LINES = ['line {}\n'.format(idx) for idx in range(1000)]
+
+
+@pytest.fixture
+def log_file(tmpdir):
+    log = tmpdir.join('dpkg.log')
+    log.write(''.join(LINES))
+    return str(log)
+
+
+@pytest.mark.parametrize('max_lines', [0, 1, 10, 999, 1000, 2000])
+def test_last_lines(log_file, max_lines):
+    with open(log_file) as log_f:
+        contents, truncated = read_tail(log_f, max_lines=max_lines)
+
+    expected = ''.join(LINES[-max_lines:] if max_lines else [])
+    assert contents == expected
+    assert truncated == len(''.join(LINES)) - len(expected)
+
+
+def test_last_lines_without_final_newline(tmpdir):
+    log = tmpdir.join('app.log')
+    log.write('first\nsecond\nthird')
+
+    with open(str(log)) as log_f:
+        assert read_tail(log_f, max_lines=2)[0] == 'second\nthird'
+
+
+def test_lines_offset_reads_backwards_in_blocks(log_file):
+    with open(log_file) as log_f:
+        offset = lines_offset(log_f, 3, block_size=7)
+        log_f.seek(offset)
+        assert log_f.read() == ''.join(LINES[-3:])
+
+
+def test_last_bytes_keeps_whole_lines(log_file):
+    with open(log_file) as log_f:
+        contents, truncated = read_tail(log_f, max_bytes=100)
+
+    assert len(contents) <= 100
+    assert contents.endswith(LINES[-1])
+    assert contents in ''.join(LINES)
+    assert LINES.index(contents.splitlines(True)[0]) > 0
+
+
+def test_tail_from_offset(log_file):
+    start = len(''.join(LINES[:990]))
+
+    with open(log_file) as log_f:
+        assert read_tail(log_f, start=start) == (''.join(LINES[990:]), 0)
+        assert read_tail(log_f, max_lines=5, start=start) == \
+            (''.join(LINES[995:]), len(''.join(LINES[990:995])))
+
+
+def test_tail_file_marks_truncation(log_file):
+    contents = tail_file(log_file, max_lines=2)
+
+    assert contents == TRUNCATION_MARKER.format(
+        len(''.join(LINES[:-2]))
+    ) + ''.join(LINES[-2:])
+    assert tail_file(log_file) == ''.join(LINES)
@@ -0,0 +1,98 @@
+#
+# test_task_pool.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that the tasks are run concurrently and in isolation
+#
+
+
+import threading
+import time
+
+import pytest
+
+from kano_feedback.task_pool import SharedResource, run_tasks
+
+
+def _sleepy(value, delay):
+    def collector():
+        time.sleep(delay)
+        return value
+    return collector
+
+
+def _broken():
+    raise IOError('Task exploded')
+
+
+@pytest.mark.parametrize('max_workers', [1, 2, 4, 16])
+def test_run_tasks_keeps_order(max_workers):
+    jobs = [
+        ('slow', _sleepy('slow contents', 0.05)),
+        ('fast', _sleepy('fast contents', 0)),
+        ('medium', _sleepy('medium contents', 0.02)),
+    ]
+
+    results = run_tasks(jobs, max_workers=max_workers)
+
+    assert [result.name for result in results] == ['slow', 'fast', 'medium']
+    assert [result.contents for result in results] == [
+        'slow contents', 'fast contents', 'medium contents'
+    ]
+
+
+def test_run_tasks_isolates_failures():
+    jobs = [
+        ('before', _sleepy('before', 0)),
+        ('broken', _broken),
+        ('after', _sleepy('after', 0)),
+    ]
+
+    results = run_tasks(jobs, max_workers=2)
+
+    assert not results[0].failed
+    assert results[1].failed
+    assert results[1].contents is None
+    assert 'Task exploded' in results[1].error
+    assert results[2].contents == 'after'
+
+
+def test_run_tasks_is_bounded():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def collector():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    run_tasks([(str(idx), collector) for idx in range(10)], max_workers=3)
+
+    assert 1 < peak[0] <= 3
+
+
+def test_run_tasks_no_jobs():
+    assert run_tasks([]) == []
+
+
+def test_shared_resource_is_computed_once():
+    calls = []
+
+    def factory():
+        calls.append(None)
+        time.sleep(0.05)
+        return 'snapshot'
+
+    shared = SharedResource(factory)
+    results = run_tasks([
+        ('collector-{}'.format(idx), shared.get) for idx in range(8)
+    ], max_workers=8)
+
+    assert [result.contents for result in results] == ['snapshot'] * 8
+    assert len(calls) == 1
@@ -0,0 +1,68 @@
+#
+# test_templates.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests grouping repeated log lines into templates
+#
+
+
+from kano_feedback.templates import LogSummary, TemplateMiner, \
+    parse_syslog_line
+
+
+def test_groups_repeated_messages():
+    miner = TemplateMiner()
+    for attempt in xrange(1000):
+        miner.add('Reconnecting to network Kano attempt {} after {}ms'.format(
+            attempt, attempt * 10
+        ), stamp=str(attempt))
+    miner.add('Connection state up', stamp='1000')
+    miner.add('Connection state down', stamp='1001')
+
+    templates = miner.templates()
+    assert [str(template) for template in templates] == [
+        'Reconnecting to network Kano attempt <*> after <*>',
+        'Connection state <*>',
+    ]
+    assert templates[0].count == 1000
+    assert (templates[0].first, templates[0].last) == ('0', '999')
+    assert templates[0].samples == [('0', '0ms'), ('1', '10ms'),
+                                    ('2', '20ms')]
+    assert templates[1].count == 2
+
+
+def test_leaf_is_bounded():
+    miner = TemplateMiner(depth=1, max_templates=2)
+    for words in ['alpha one', 'beta two', 'gamma three', 'delta four']:
+        miner.add('unique {}'.format(words))
+
+    assert len(miner.templates()) == 2
+    assert sum(template.count for template in miner.templates()) == 4
+
+
+def test_parse_syslog_line():
+    assert parse_syslog_line(
+        'Jun 01 12:00:00 kano dhcpcd[412]: wlan0: leased 10.0.0.2'
+    ) == ('Jun 01 12:00:00', 'dhcpcd: wlan0: leased 10.0.0.2')
+    assert parse_syslog_line('    continuation') is None
+
+
+def test_summary_of_members(tmpdir):
+    app_logs = tmpdir.join('app-logs.txt')
+    app_logs.write(
+        'LOGFILE: /var/log/kano/kano-updater.log\n' +
+        ''.join('2019-06-01T12:00:{:02d} kano-updater info: '
+                'Downloaded {} bytes\n'.format(idx, idx * 100)
+                for idx in xrange(10))
+    )
+    summary = LogSummary()
+    summary.add_member({'name': 'app-logs.txt', 'path': str(app_logs)})
+    summary.add_member({'name': 'dmesg.txt', 'contents': 'not mined\n'})
+
+    rendered = summary.render()
+    assert rendered.startswith('== app-logs.txt: 10 lines, 1 templates ==\n')
+    assert '10  2019-06-01T12:00:00 .. 2019-06-01T12:00:09  ' \
+        'kano-updater info: Downloaded <*> bytes' in rendered
+    assert 'dmesg' not in rendered
@@ -0,0 +1,105 @@
+#
+# test_time_window.py
+#
+# Copyright (C) 2019 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Tests that the logs are cut down to a window of time by bisecting them
+#
+
+
+import json
+import time
+
+import pytest
+
+from kano_feedback.time_window import TimeWindow, bisect_log, \
+    dpkg_log_time, json_log_time, parse_time
+
+
+START = time.mktime((2019, 6, 1, 12, 0, 0, 0, 0, -1))
+
+
+def _dpkg_log(tmpdir, count):
+    lines = []
+    for idx in xrange(count):
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S',
+                              time.localtime(START + idx * 60))
+        lines.append('{} status installed package-{}:armhf 1.0\n'.format(
+            stamp, idx
+        ))
+    log = tmpdir.join('dpkg.log')
+    log.write(''.join(lines))
+    return log, lines
+
+
+@pytest.mark.parametrize('since, until, first, last', [
+    (None, None, 0, 99),
+    (10, None, 10, 99),
+    (None, 20, 0, 20),
+    (10.5, 20.5, 11, 20),
+    (-5, 0, 0, 0),
+    (200, None, None, None),
+])
+def test_span(tmpdir, since, until, first, last):
+    log, lines = _dpkg_log(tmpdir, 100)
+    window = TimeWindow(
+        START + since * 60 if since is not None else None,
+        START + until * 60 if until is not None else None
+    )
+
+    with open(str(log)) as log_f:
+        start, end = window.span(log_f, dpkg_log_time)
+        log_f.seek(start)
+        contents = log_f.read(end - start)
+
+    expected = lines[first:last + 1] if first is not None else []
+    assert contents == ''.join(expected)
+
+
+def test_bisect_reads_logarithmically(tmpdir):
+    log, lines = _dpkg_log(tmpdir, 10000)
+    parsed = []
+
+    def counting_time(line):
+        parsed.append(line)
+        return dpkg_log_time(line)
+
+    with open(str(log)) as log_f:
+        offset = bisect_log(log_f, START + 1234 * 60, counting_time)
+        log_f.seek(offset)
+        assert log_f.readline() == lines[1234]
+
+    # about log2 of the size of the log, rather than its 10000 lines
+    assert len(parsed) < 30
+
+
+def test_bisect_skips_lines_without_time(tmpdir):
+    log = tmpdir.join('app.log')
+    log.write(
+        json.dumps({'time': START, 'message': 'first'}) + '\n' +
+        'not an entry\n' +
+        json.dumps({'time': START + 10, 'message': 'second'}) + '\n'
+    )
+
+    with open(str(log)) as log_f:
+        offset = bisect_log(log_f, START + 5, json_log_time)
+        log_f.seek(offset)
+        assert json.loads(log_f.readline())['message'] == 'second'
+
+
+def test_parse_time():
+    assert parse_time('2019-06-01 12:00') == START
+    assert parse_time('2019-06-01T12:00:30') == START + 30
+    assert parse_time('10m', now=START) == START - 600
+
+    with pytest.raises(ValueError):
+        parse_time('yesterday')
+
+
+def test_empty_window_is_false():
+    assert not TimeWindow()
+    assert TimeWindow(since=START)
+    assert TimeWindow().metadata() == {}
+    assert TimeWindow(until=START).journalctl_args() == \
+        ["--until='2019-06-01 12:00:00'"]